@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+下载性能对比工具：比较 download_media 与并行下载的耗时
+
+用法: python benchmark_download.py <消息链接>
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+from telethon.tl.types import MessageMediaDocument, PeerChannel
+
+from config import API_ID, API_HASH, USER_SESSION, get_proxy
+from handlers.message_handler import parse_url
+from services.parallel_transfer import iter_download_parallel
+from services.media_transfer import get_document_file_name
+
+# 设置日志格式
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(asctime)s - %(message)s")
+logger = logging.getLogger("DownloadBenchmark")
+
+
+async def download_with_telethon(client, message, file):
+    """使用 Telethon 自带的单连接下载"""
+    await client.download_media(message, file=file)
+
+
+async def download_with_parallel(client, message, file):
+    """使用多连接并行下载"""
+    with open(file, 'wb') as f:
+        async for chunk in iter_download_parallel(client, message.media.document):
+            f.write(chunk)
+
+
+async def benchmark(client, message, name, download):
+    """执行一次下载并返回耗时（秒）"""
+    file = f"benchmark_{name}_{get_document_file_name(message.media.document)}"
+    start = time.perf_counter()
+    try:
+        await download(client, message, file)
+        elapsed = time.perf_counter() - start
+        if os.path.getsize(file) != message.media.document.size:
+            logger.error(f"{name}: 下载的文件大小不正确")
+    finally:
+        if os.path.exists(file):
+            os.remove(file)
+    return elapsed
+
+
+async def main(link):
+    chat_id, message_id = await parse_url(link.split('?')[0])
+    peer = PeerChannel(int(chat_id)) if chat_id.isdigit() else chat_id
+
+    client = TelegramClient(StringSession(USER_SESSION), API_ID, API_HASH, proxy=get_proxy())
+    await client.connect()
+    try:
+        message = await client.get_messages(peer, ids=message_id)
+        if not message or not isinstance(message.media, MessageMediaDocument):
+            logger.error("该链接不包含文档类型的媒体")
+            return
+
+        size_mb = message.media.document.size / 1024 / 1024
+        logger.info(f"开始测试，文件大小 {size_mb:.2f} MB")
+
+        for name, download in (("telethon", download_with_telethon), ("parallel", download_with_parallel)):
+            elapsed = await benchmark(client, message, name, download)
+            logger.info(f"{name}: 耗时 {elapsed:.2f} 秒，速度 {size_mb / elapsed:.2f} MB/s")
+    finally:
+        await client.disconnect()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1]))
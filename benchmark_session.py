@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+会话启动性能对比工具：比较 StringSession 与持久化 SQLite 会话在重启后解析聊天的耗时
+
+每种会话各模拟一次重启：连接后依次解析给定的聊天（get_input_entity），统计耗时和实际发出的网络请求数。
+SQLite 会话先运行一次预热，模拟上次运行留下的会话文件。
+
+用法: python benchmark_session.py <用户名或频道ID> [<用户名或频道ID> ...]
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+
+from config import API_ID, API_HASH, USER_SESSION, get_proxy
+from services.session_store import migrate_string_session
+
+# 设置日志格式
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(asctime)s - %(message)s")
+logger = logging.getLogger("SessionBenchmark")
+
+
+class CountingClient(TelegramClient):
+    """统计发出的请求数的客户端"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.request_count = 0
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        self.request_count += 1
+        return await super()._call(sender, request, ordered, flood_sleep_threshold)
+
+
+def parse_chat(chat):
+    """频道ID转换为整数，用户名原样返回"""
+    if chat.lstrip("-").isdigit():
+        chat_id = int(chat)
+        return chat_id if chat_id < 0 else int(f"-100{chat_id}")
+    return chat
+
+
+async def start_and_resolve(session, chats):
+    """模拟一次启动：连接并解析全部聊天，返回 (耗时, 请求数, 解析失败数)"""
+    client = CountingClient(session, API_ID, API_HASH, proxy=get_proxy())
+    start = time.perf_counter()
+    await client.connect()
+    failed = 0
+    try:
+        for chat in chats:
+            try:
+                await client.get_input_entity(parse_chat(chat))
+            except ValueError:
+                failed += 1
+        return time.perf_counter() - start, client.request_count, failed
+    finally:
+        await client.disconnect()
+
+
+async def main(chats):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark")
+
+        # 预热：第一次运行写入会话文件
+        await start_and_resolve(migrate_string_session(USER_SESSION, path), chats)
+
+        runs = (
+            ("string", StringSession(USER_SESSION)),
+            ("sqlite", migrate_string_session(USER_SESSION, path)),
+        )
+        for name, session in runs:
+            elapsed, requests, failed = await start_and_resolve(session, chats)
+            logger.info(f"{name}: 耗时 {elapsed:.2f} 秒，请求 {requests} 次，{failed}/{len(chats)} 个聊天无法解析")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(main(sys.argv[1:]))
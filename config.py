@@ -3,8 +3,10 @@
 """
 
 import logging
+import os
+import tempfile
 
-from decouple import config
+from decouple import config, Csv
 
 # 初始化日志记录器
 logging.basicConfig(
@@ -14,13 +16,24 @@ log = logging.getLogger("Config")
 # 设置Telethon内部日志级别，减少日志输出
 logging.getLogger('telethon').setLevel(logging.WARNING)
 
+
+def optional_int(value):
+    """可选的整数配置，未设置时为 None"""
+    return int(value) if value not in (None, "") else None
+
+
 # 从环境变量中获取配置
-API_ID = config("API_ID", default=None, cast=int)
+API_ID = config("API_ID", default=None, cast=optional_int)
 API_HASH = config("API_HASH", default=None)
 BOT_SESSION = config("BOT_SESSION", default=None)
 USER_SESSION = config("USER_SESSION", default=None)
+# 多个用户账号的会话字符串，逗号分隔；未设置时只使用 USER_SESSION
+USER_SESSIONS = config("USER_SESSIONS", default="", cast=Csv()) or ([USER_SESSION] if USER_SESSION else [])
 BOT_TOKEN = config("BOT_TOKEN", default=None)
-PRIVATE_CHAT_ID = config("PRIVATE_CHAT_ID", default=None, cast=int)
+PRIVATE_CHAT_ID = config("PRIVATE_CHAT_ID", default=None, cast=optional_int)
+# 多个归档频道ID，逗号分隔；新的归档按源聊天分散到这些频道，未设置时只使用 PRIVATE_CHAT_ID
+ARCHIVE_CHAT_IDS = config("ARCHIVE_CHAT_IDS", default="", cast=Csv(int)) or ([PRIVATE_CHAT_ID] if PRIVATE_CHAT_ID else [])
+ARCHIVE_HASH_REPLICAS = config("ARCHIVE_HASH_REPLICAS", default=100, cast=int)  # 一致性哈希中每个归档频道的虚拟节点数
 AUTHS = config("AUTHS", default="")
 
 # 代理设置
@@ -38,7 +51,7 @@ USDT_CONTRACT = "TR7NHqjeKQxGTCi8q8ZY4pL8otSzgjLj6t"
 # 自动检查交易的间隔（秒）
 TRANSACTION_CHECK_INTERVAL = config("TRANSACTION_CHECK_INTERVAL", default=60, cast=int)
 # 管理员用户ID，用于接收订单通知
-ADMIN_ID = config("ADMIN_ID", default=None, cast=int)
+ADMIN_ID = config("ADMIN_ID", default=None, cast=optional_int)
 # 消息范围±10
 RANGE = 10
 
@@ -47,8 +60,107 @@ SYSTEM_OVERLOADED = False
 CPU_THRESHOLD = 80  # CPU使用率阈值（百分比）
 MEMORY_THRESHOLD = 80  # 内存使用率阈值（百分比）
 DISK_IO_THRESHOLD = 80  # 磁盘I/O使用率阈值（百分比）
+SPOOL_THRESHOLD = 90  # 临时文件池占用阈值（百分比）
 MONITOR_INTERVAL = 5  # 监控间隔（秒）
 
+# 流式转存设置：下载的分片直接上传，不经过临时文件
+STREAM_TRANSFER = config("STREAM_TRANSFER", default=True, cast=bool)
+STREAM_BUFFER_PARTS = config("STREAM_BUFFER_PARTS", default=8, cast=int)  # 内存中最多缓冲的分片数
+
+# 请求限流设置：每个账号按 RPC 方法和目标聊天分别限流，FloodWait 时暂停对应的令牌桶并降低速率
+RATE_LIMIT_METHOD_RATE = config("RATE_LIMIT_METHOD_RATE", default=30, cast=float)  # 每个方法每秒的请求数
+RATE_LIMIT_METHOD_BURST = config("RATE_LIMIT_METHOD_BURST", default=30, cast=int)  # 每个方法允许的突发请求数
+RATE_LIMIT_PEER_RATE = config("RATE_LIMIT_PEER_RATE", default=3, cast=float)  # 同一聊天上每个方法每秒的请求数
+RATE_LIMIT_PEER_BURST = config("RATE_LIMIT_PEER_BURST", default=10, cast=int)  # 同一聊天上每个方法允许的突发请求数
+RATE_LIMIT_MAX_WAIT = config("RATE_LIMIT_MAX_WAIT", default=300, cast=int)  # 超过此时间（秒）的 FloodWait 不再等待，直接报错
+RATE_LIMIT_MAX_BUCKETS = config("RATE_LIMIT_MAX_BUCKETS", default=10000, cast=int)  # 每个账号最多保留的令牌桶数
+
+# 任务队列设置：链接请求排队后由固定数量的工作协程处理，付费用户优先
+JOB_WORKERS = config("JOB_WORKERS", default=16, cast=int)  # 同时处理的请求数
+JOB_QUEUE_SIZE = config("JOB_QUEUE_SIZE", default=1000, cast=int)  # 排队请求数上限，超出时提示系统繁忙
+JOB_USER_PENDING = config("JOB_USER_PENDING", default=3, cast=int)  # 每个用户排队和处理中的请求数上限
+
+# 数据库连接设置：每个进程保持一个写连接和一组只读连接，数据库使用 WAL 模式
+DB_READ_CONNECTIONS = config("DB_READ_CONNECTIONS", default=4, cast=int)  # 只读连接数上限
+DB_SYNCHRONOUS = config("DB_SYNCHRONOUS", default="NORMAL")  # WAL 模式下 NORMAL 只在断电时可能丢失最后的事务
+DB_CACHE_SIZE = config("DB_CACHE_SIZE", default=-16384, cast=int)  # 每个连接的页缓存，负数表示 KiB
+DB_MMAP_SIZE = config("DB_MMAP_SIZE", default=256 * 1024 * 1024, cast=int)  # 内存映射读取的最大字节数
+DB_BUSY_TIMEOUT = config("DB_BUSY_TIMEOUT", default=5000, cast=int)  # 等待其他进程释放锁的时间（毫秒）
+
+# 多进程设置：MEDIA_WORKERS 大于 0 时 main.py 只接收消息和排队，下载和上传由独立的媒体工作进程执行
+MEDIA_WORKERS = config("MEDIA_WORKERS", default="0",
+                       cast=lambda v: (os.cpu_count() or 1) if v == "auto" else int(v))  # 工作进程数，auto 为 CPU 核数
+MEDIA_WORKER_CONCURRENCY = config("MEDIA_WORKER_CONCURRENCY", default=4, cast=int)  # 每个工作进程同时处理的请求数
+LINK_JOB_POLL_INTERVAL = config("LINK_JOB_POLL_INTERVAL", default=0.5, cast=float)  # 检查新任务和任务结果的间隔（秒）
+LINK_JOB_POLL_MAX_INTERVAL = config("LINK_JOB_POLL_MAX_INTERVAL", default=5, cast=float)  # 持续没有新任务和结果时检查间隔逐次翻倍的上限（秒）
+LINK_JOB_MAX_ATTEMPTS = config("LINK_JOB_MAX_ATTEMPTS", default=2, cast=int)  # 工作进程异常退出时任务最多执行的次数
+FLIGHT_LOCK_DIR = config("FLIGHT_LOCK_DIR", default=os.path.join(tempfile.gettempdir(), "message_forward_flights"))  # 多个进程同时转存同一条消息时互斥的锁文件目录
+
+# 用户账号池设置：每个请求交给已加入源聊天的账号处理，同一聊天优先使用同一个账号
+USER_POOL_AFFINITY_SLACK = config("USER_POOL_AFFINITY_SLACK", default=2, cast=int)  # 上次处理该聊天的账号比最空闲账号多出的任务数不超过此值时继续使用它
+USER_POOL_NEGATIVE_TTL = config("USER_POOL_NEGATIVE_TTL", default=300, cast=int)  # 账号无法访问某个聊天的结果缓存时间（秒）
+USER_POOL_MAX_CHATS = config("USER_POOL_MAX_CHATS", default=10000, cast=int)  # 最多记录的聊天数
+
+# 传输准入控制：同时进行的传输总字节数和数量上限，超出时排队；多进程模式下由各媒体工作进程平分
+TRANSFER_MAX_BYTES = config("TRANSFER_MAX_BYTES", default=1024 * 1024 * 1024, cast=int)
+TRANSFER_MAX_COUNT = config("TRANSFER_MAX_COUNT", default=8, cast=int)
+
+# 并行下载设置：大文件通过多条连接同时下载不同分片
+PARALLEL_DOWNLOAD_CONNECTIONS = config("PARALLEL_DOWNLOAD_CONNECTIONS", default=4, cast=int)  # 并发连接数
+PARALLEL_DOWNLOAD_MIN_SIZE = config("PARALLEL_DOWNLOAD_MIN_SIZE", default=20 * 1024 * 1024, cast=int)  # 启用并行下载的最小文件大小（字节）
+
+# 并行上传设置：大文件通过多条连接同时上传不同分片
+PARALLEL_UPLOAD_CONNECTIONS = config("PARALLEL_UPLOAD_CONNECTIONS", default=4, cast=int)  # 并发连接数
+PARALLEL_UPLOAD_MIN_SIZE = config("PARALLEL_UPLOAD_MIN_SIZE", default=20 * 1024 * 1024, cast=int)  # 启用并行上传的最小文件大小（字节）
+
+# 临时文件池设置：传输过程中落盘的文件统一存放在此目录（可以指向 tmpfs），总占用不超过上限
+SPOOL_DIR = config("SPOOL_DIR", default=os.path.join(tempfile.gettempdir(), "message_forward_spool"))
+SPOOL_MAX_BYTES = config("SPOOL_MAX_BYTES", default=4 * 1024 * 1024 * 1024, cast=int)
+
+# 断点续传设置：大文件的下载/上传进度记录在数据库中，中断后从已完成的分片继续
+TRANSFER_JOURNAL_TTL = config("TRANSFER_JOURNAL_TTL", default=6 * 3600, cast=int)  # 传输记录的有效时间（秒），服务器保留已上传分片的时间有限
+TRANSFER_RESUME_RETRIES = config("TRANSFER_RESUME_RETRIES", default=3, cast=int)  # 网络中断时自动续传的次数
+
+# 内存缓冲区设置：不超过阈值的照片和文档直接在内存中下载和上传，不经过临时文件池
+MEMORY_BUFFER_THRESHOLD = config("MEMORY_BUFFER_THRESHOLD", default=10 * 1024 * 1024, cast=int)  # 使用内存缓冲区的最大文件大小（字节）
+MEMORY_BUFFER_COUNT = config("MEMORY_BUFFER_COUNT", default=16, cast=int)  # 同时使用的缓冲区数量上限
+
+# HTTP 客户端设置：Bot API 和 TronGrid 请求共享连接池
+HTTP_TIMEOUT = config("HTTP_TIMEOUT", default=15, cast=int)  # 单次请求的总超时（秒）
+HTTP_CONNECT_TIMEOUT = config("HTTP_CONNECT_TIMEOUT", default=5, cast=int)  # 建立连接的超时（秒）
+HTTP_POOL_LIMIT = config("HTTP_POOL_LIMIT", default=100, cast=int)  # 连接池的总连接数上限
+HTTP_POOL_LIMIT_PER_HOST = config("HTTP_POOL_LIMIT_PER_HOST", default=20, cast=int)  # 每个主机的连接数上限
+HTTP_DNS_CACHE_TTL = config("HTTP_DNS_CACHE_TTL", default=300, cast=int)  # DNS 缓存时间（秒）
+HTTP_KEEPALIVE_TIMEOUT = config("HTTP_KEEPALIVE_TIMEOUT", default=60, cast=int)  # 空闲连接保持时间（秒）
+
+# 聊天信息缓存设置：频道的受保护标志、类型和用户名几乎不变，按用户名或 peer id 缓存
+CHAT_CACHE_SIZE = config("CHAT_CACHE_SIZE", default=1024, cast=int)  # 最多缓存的聊天数
+CHAT_CACHE_TTL = config("CHAT_CACHE_TTL", default=3600, cast=int)  # 查询成功的结果缓存时间（秒）
+CHAT_CACHE_NEGATIVE_TTL = config("CHAT_CACHE_NEGATIVE_TTL", default=60, cast=int)  # 查询失败的结果缓存时间（秒）
+CACHE_STATS_INTERVAL = config("CACHE_STATS_INTERVAL", default=600, cast=int)  # 记录各缓存命中率的间隔（秒），0 表示不记录
+
+# 用户名解析缓存设置：解析结果按账号保存在数据库中，重启后仍然有效
+USERNAME_CACHE_SIZE = config("USERNAME_CACHE_SIZE", default=4096, cast=int)  # 内存中记住的不存在的用户名数量上限
+USERNAME_REFRESH_AGE = config("USERNAME_REFRESH_AGE", default=24 * 3600, cast=int)  # 超过此时间（秒）的记录在后台重新解析
+USERNAME_NEGATIVE_TTL = config("USERNAME_NEGATIVE_TTL", default=300, cast=int)  # 不存在的用户名的缓存时间（秒）
+
+# 评论解析缓存设置：帖子对应的讨论组几乎不变，按帖子缓存
+COMMENT_CACHE_SIZE = config("COMMENT_CACHE_SIZE", default=4096, cast=int)  # 最多缓存的帖子数
+COMMENT_CACHE_TTL = config("COMMENT_CACHE_TTL", default=24 * 3600, cast=int)  # 讨论组的缓存时间（秒）
+COMMENT_CACHE_NEGATIVE_TTL = config("COMMENT_CACHE_NEGATIVE_TTL", default=300, cast=int)  # 没有评论区的帖子的缓存时间（秒）
+
+# 媒体组发现设置：从消息两侧各获取少量消息开始，边缘仍属于同一组时加倍扩大范围
+MEDIA_GROUP_INITIAL_WINDOW = config("MEDIA_GROUP_INITIAL_WINDOW", default=2, cast=int)  # 第一次每侧获取的消息数
+MEDIA_GROUP_CACHE_SIZE = config("MEDIA_GROUP_CACHE_SIZE", default=4096, cast=int)  # 最多缓存的媒体组数
+MEDIA_GROUP_CACHE_TTL = config("MEDIA_GROUP_CACHE_TTL", default=24 * 3600, cast=int)  # 媒体组消息ID的缓存时间（秒）
+
+# 会话存储设置：sqlite 时首次启动用 BOT_SESSION/USER_SESSION 初始化会话文件，重启后保留实体缓存和更新状态；string 时每次都从会话字符串启动
+SESSION_STORE = config("SESSION_STORE", default="sqlite")
+SESSION_DIR = config("SESSION_DIR", default="")  # 会话文件所在目录，默认与数据库文件一样放在工作目录
+
+# 已归档的媒体组直接从归档频道转发（隐藏来源）给用户，附加信息作为单独的消息发送
+ALBUM_FORWARD_COPY = config("ALBUM_FORWARD_COPY", default=True, cast=bool)
+
 # 在配置加载时解析授权用户列表
 AUTH_USERS = set()
 if AUTHS:
@@ -70,10 +182,6 @@ if AUTHS:
         log.error("AUTHS 配置中包含无效的用户格式，确保是 user_id 或 username")
         exit(1)
 
-if not all([API_ID, API_HASH, BOT_SESSION, USER_SESSION]):
-    log.error("缺少一个或多个必要环境变量: API_ID、API_HASH、BOT_SESSION、USER_SESSION")
-    exit(1)
-
 
 # 获取代理配置
 def get_proxy(proxy_format="tuple"):
@@ -92,6 +200,14 @@ def get_proxy(proxy_format="tuple"):
         return PROXY_TYPE, PROXY_HOST, PROXY_PORT
 
 
+# 检查机器人必需的配置，独立脚本（main_download.py 等）只使用其中一部分，由各自检查
+def check_bot_config():
+    """缺少机器人必需的环境变量时退出"""
+    if not all([API_ID, API_HASH, BOT_SESSION, USER_SESSIONS]):
+        log.error("缺少一个或多个必要环境变量: API_ID、API_HASH、BOT_SESSION、USER_SESSION（或 USER_SESSIONS）")
+        exit(1)
+
+
 # 验证用户是否有权使用机器人
 def is_authorized(event):
     """检查用户是否被授权使用机器人"""
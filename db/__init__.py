@@ -1,11 +1,22 @@
-from .database import init_db, get_db_connection, add_indexes, analyze_db, analyze_index_usage
+from .database import init_db, get_db_connection, close_db, add_indexes, analyze_db, analyze_index_usage
 from .invite import (
     generate_invite_code,
     get_user_invite_code,
     process_invite,
+    get_inviter_id,
     get_invite_stats
 )
+from .media_cache import (
+    get_media_key,
+    save_media_cache,
+    save_media_group_cache,
+    find_media_cache
+)
 from .message_relations import (
+    ArchivedMessage,
+    load_archived_message,
+    to_archived_message,
+    update_archived_message,
     save_message_relation,
     save_media_group_relations,
     find_forwarded_message,
@@ -23,6 +34,26 @@ from .orders import (
     get_user_pending_orders,
     complete_order
 )
+from .transfer_journal import (
+    get_transfer_journal,
+    save_transfer_progress,
+    delete_transfer_journal,
+    purge_transfer_journal
+)
+from .username_cache import (
+    get_cached_username,
+    save_cached_username,
+    delete_cached_username
+)
+from .link_jobs import (
+    enqueue_link_job,
+    claim_link_job,
+    finish_link_job,
+    requeue_link_jobs,
+    count_link_jobs,
+    count_link_jobs_ahead,
+    pop_finished_link_jobs
+)
 from .user_quota import (
     get_user_quota,
     decrease_user_quota,
@@ -0,0 +1,96 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from config import DB_READ_CONNECTIONS
+from . import (
+    database, invite, link_jobs, media_cache, message_relations, orders, transfer_journal, user_quota, username_cache
+)
+
+# 协程中使用的数据库接口：语句在专用线程中执行，等待数据库锁时不会阻塞事件循环。
+# 写操作只有一个写连接，放在同一个线程中按提交顺序执行；读操作使用只读连接池，线程数与连接数一致
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+_read_executor = ThreadPoolExecutor(max_workers=max(1, DB_READ_CONNECTIONS), thread_name_prefix="db-read")
+
+
+async def run_db(func, *args, readonly=False, **kwargs):
+    """
+    在数据库线程中执行同步的数据库函数
+
+    :param func: db 包中的函数，或者其他使用 get_db_connection 的函数
+    :param readonly: 只读取数据的函数在读线程中执行，不需要等待排队中的写操作
+    """
+    loop = asyncio.get_running_loop()
+    executor = _read_executor if readonly else _write_executor
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+
+def _wrap(func, readonly=False):
+    """将同步的数据库函数包装为协程函数"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_db(func, *args, readonly=readonly, **kwargs)
+    return wrapper
+
+
+def close_db():
+    """等待排队中的数据库操作完成，停止数据库线程并关闭连接"""
+    _write_executor.shutdown(wait=True)
+    _read_executor.shutdown(wait=True)
+    database.close_db()
+
+
+# 邀请
+get_user_invite_code = _wrap(invite.get_user_invite_code)
+process_invite = _wrap(invite.process_invite)
+get_inviter_id = _wrap(invite.get_inviter_id, readonly=True)
+get_invite_stats = _wrap(invite.get_invite_stats, readonly=True)
+
+# 媒体缓存
+save_media_cache = _wrap(media_cache.save_media_cache)
+save_media_group_cache = _wrap(media_cache.save_media_group_cache)
+find_media_cache = _wrap(media_cache.find_media_cache, readonly=True)
+
+# 消息关系
+update_archived_message = _wrap(message_relations.update_archived_message)
+save_message_relation = _wrap(message_relations.save_message_relation)
+save_media_group_relations = _wrap(message_relations.save_media_group_relations)
+find_forwarded_message = _wrap(message_relations.find_forwarded_message, readonly=True)
+find_forwarded_message_for_one = _wrap(message_relations.find_forwarded_message_for_one, readonly=True)
+find_grouped_messages = _wrap(message_relations.find_grouped_messages, readonly=True)
+
+# 订单
+update_order_tx_info = _wrap(orders.update_order_tx_info)
+update_order_last_checked = _wrap(orders.update_order_last_checked)
+cancel_expired_order = _wrap(orders.cancel_expired_order)
+get_all_pending_orders = _wrap(orders.get_all_pending_orders, readonly=True)
+create_new_order = _wrap(orders.create_new_order)
+get_order_by_id = _wrap(orders.get_order_by_id, readonly=True)
+get_user_pending_orders = _wrap(orders.get_user_pending_orders, readonly=True)
+complete_order = _wrap(orders.complete_order)
+
+# 断点续传记录
+get_transfer_journal = _wrap(transfer_journal.get_transfer_journal, readonly=True)
+save_transfer_progress = _wrap(transfer_journal.save_transfer_progress)
+delete_transfer_journal = _wrap(transfer_journal.delete_transfer_journal)
+purge_transfer_journal = _wrap(transfer_journal.purge_transfer_journal)
+
+# 用户名缓存
+get_cached_username = _wrap(username_cache.get_cached_username, readonly=True)
+save_cached_username = _wrap(username_cache.save_cached_username)
+delete_cached_username = _wrap(username_cache.delete_cached_username)
+
+# 链接任务
+enqueue_link_job = _wrap(link_jobs.enqueue_link_job)
+claim_link_job = _wrap(link_jobs.claim_link_job)
+finish_link_job = _wrap(link_jobs.finish_link_job)
+requeue_link_jobs = _wrap(link_jobs.requeue_link_jobs)
+count_link_jobs = _wrap(link_jobs.count_link_jobs, readonly=True)
+count_link_jobs_ahead = _wrap(link_jobs.count_link_jobs_ahead, readonly=True)
+pop_finished_link_jobs = _wrap(link_jobs.pop_finished_link_jobs)
+
+# 用户配额：已重置过的用户只读取，需要写入时在读线程中等待写连接，不占用写线程
+get_user_quota = _wrap(user_quota.get_user_quota, readonly=True)
+decrease_user_quota = _wrap(user_quota.decrease_user_quota)
+add_paid_quota = _wrap(user_quota.add_paid_quota)
+reset_all_free_quotas = _wrap(user_quota.reset_all_free_quotas)
@@ -1,7 +1,13 @@
 import logging
+import os
+import queue
 import sqlite3
+import threading
+import urllib.parse
 from contextlib import contextmanager
 
+from config import DB_SYNCHRONOUS, DB_CACHE_SIZE, DB_MMAP_SIZE, DB_BUSY_TIMEOUT, DB_READ_CONNECTIONS
+
 # 全局变量定义
 DB_FILE = "message_forward.db"
 
@@ -10,14 +16,138 @@ logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(asctime)s - %(
 log = logging.getLogger("DB")
 
 
+class ConnectionManager:
+    """
+    数据库连接管理器
+
+    进程内保持一个写连接和最多 read_connections 个只读连接，不再为每次调用打开和关闭连接。
+    数据库使用 WAL 模式，读操作不会被正在进行的写事务阻塞。写连接同一时间只由一个线程使用，
+    同一线程中嵌套获取写连接时使用同一个连接。
+    """
+
+    def __init__(self, path, read_connections=DB_READ_CONNECTIONS):
+        self.path = path
+        self.pid = os.getpid()
+        self.read_connections = read_connections
+        self._writer = None
+        self._writer_lock = threading.RLock()
+        self._local = threading.local()
+        self._readers = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+
+    def _configure(self, conn):
+        conn.execute(f"PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT)}")
+        conn.execute(f"PRAGMA cache_size = {int(DB_CACHE_SIZE)}")
+        conn.execute(f"PRAGMA mmap_size = {int(DB_MMAP_SIZE)}")
+        return conn
+
+    def _open_writer(self):
+        if self._writer is None:
+            conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT / 1000, check_same_thread=False)
+            # WAL 模式写入数据库文件，之后打开的连接都使用 WAL
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+            self._writer = self._configure(conn)
+        return self._writer
+
+    def _open_reader(self):
+        # 只读连接不能创建数据库文件和 WAL 文件，先确保写连接已打开
+        with self._writer_lock:
+            self._open_writer()
+        uri = f"file:{urllib.parse.quote(os.path.abspath(self.path))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT / 1000, check_same_thread=False)
+        return self._configure(conn)
+
+    @contextmanager
+    def writer(self):
+        """取得写连接，离开时未提交的事务被回滚"""
+        with self._writer_lock:
+            conn = self._open_writer()
+            depth = getattr(self._local, "depth", 0)
+            self._local.depth = depth + 1
+            try:
+                yield conn
+            finally:
+                self._local.depth = depth
+                if not depth and conn.in_transaction:
+                    conn.rollback()
+
+    @contextmanager
+    def reader(self):
+        """取得一个只读连接，没有空闲连接且已达上限时等待"""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._reader_lock:
+                create = self._reader_count < self.read_connections
+                if create:
+                    self._reader_count += 1
+            if not create:
+                conn = self._readers.get()
+            else:
+                try:
+                    conn = self._open_reader()
+                except Exception:
+                    with self._reader_lock:
+                        self._reader_count -= 1
+                    raise
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def close(self):
+        """关闭所有连接"""
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        self._reader_count = 0
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_connection_manager():
+    """获取当前进程的连接管理器，DB_FILE 改变或在子进程中时重新创建"""
+    global _manager
+    with _manager_lock:
+        if _manager is None or _manager.path != DB_FILE or _manager.pid != os.getpid():
+            # 从父进程继承的连接不能在子进程中使用，也不能关闭
+            if _manager is not None and _manager.pid == os.getpid():
+                _manager.close()
+            _manager = ConnectionManager(DB_FILE)
+        return _manager
+
+
+def close_db():
+    """关闭当前进程的数据库连接"""
+    global _manager
+    with _manager_lock:
+        if _manager is not None and _manager.pid == os.getpid():
+            _manager.close()
+        _manager = None
+
+
 @contextmanager
-def get_db_connection():
-    """提供SQLite数据库连接的上下文管理器"""
-    conn = sqlite3.connect(DB_FILE)
-    try:
+def get_db_connection(readonly=False):
+    """
+    提供SQLite数据库连接的上下文管理器
+
+    :param readonly: 只读操作使用只读连接池，不需要等待写连接
+    """
+    manager = get_connection_manager()
+    with (manager.reader() if readonly else manager.writer()) as conn:
         yield conn
-    finally:
-        conn.close()
 
 
 def add_indexes():
@@ -101,6 +231,17 @@ def add_indexes():
         ON invite_relations(created_at)
         ''')
 
+        # link_jobs 表索引
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_link_jobs_status 
+        ON link_jobs(status, priority, id)
+        ''')
+
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_link_jobs_user 
+        ON link_jobs(user_id, status)
+        ''')
+
         conn.commit()
         log.info("数据库索引添加完成")
 
@@ -165,6 +306,69 @@ def init_db():
         )
         ''')
 
+        # 为旧版本的 message_relations 表补充归档消息的媒体信息列（文件引用、caption、entities等）
+        cursor.execute("PRAGMA table_info(message_relations)")
+        existing_columns = {row[1] for row in cursor.fetchall()}
+        for column, column_type in (("media_type", "TEXT"), ("media_id", "INTEGER"), ("access_hash", "INTEGER"),
+                                    ("file_reference", "BLOB"), ("caption", "TEXT"), ("entities", "BLOB"),
+                                    ("reply_markup", "BLOB")):
+            if column not in existing_columns:
+                cursor.execute(f"ALTER TABLE message_relations ADD COLUMN {column} {column_type}")
+
+        # 创建媒体缓存表，按 Telegram 的 document/photo id 记录已归档的消息
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS media_cache (
+            media_type TEXT NOT NULL,
+            media_id INTEGER NOT NULL,
+            target_chat_id TEXT NOT NULL,
+            target_message_id INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (media_type, media_id, target_chat_id)
+        )
+        ''')
+
+        # 创建传输记录表，记录大文件下载/上传已连续完成的分片数，用于中断后续传
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transfer_journal (
+            document_id INTEGER NOT NULL,
+            direction TEXT NOT NULL,
+            file_id INTEGER,
+            part_size INTEGER NOT NULL,
+            completed_parts INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (document_id, direction)
+        )
+        ''')
+
+        # 创建用户名解析缓存表，按账号记录用户名对应的 peer id 和 access_hash，避免重复调用 contacts.ResolveUsername
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS username_cache (
+            account_id INTEGER NOT NULL,
+            username TEXT NOT NULL,
+            peer_type TEXT NOT NULL,
+            peer_id INTEGER NOT NULL,
+            access_hash INTEGER,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (account_id, username)
+        )
+        ''')
+
+        # 创建链接任务表，多进程模式下入口进程写入，媒体工作进程取出执行并写回结果
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS link_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            priority INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT DEFAULT 'pending',
+            worker_id TEXT,
+            attempts INTEGER DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''')
+
         # 创建用户转发次数表
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS user_forward_quota (
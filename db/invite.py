@@ -10,7 +10,7 @@ log = logging.getLogger("Invite")
 
 def generate_invite_code():
     """生成唯一的邀请码"""
-    with get_db_connection() as conn:
+    with get_db_connection(readonly=True) as conn:
         cursor = conn.cursor()
         while True:
             # 生成新的邀请码
@@ -104,9 +104,18 @@ def process_invite(invite_code, invitee_id):
             return False, "处理邀请时发生错误"
 
 
+def get_inviter_id(invite_code):
+    """获取邀请码所属的邀请人ID，邀请码不存在时返回 None"""
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT inviter_id FROM invite_relations WHERE invite_code = ?', (invite_code,))
+        result = cursor.fetchone()
+    return result[0] if result else None
+
+
 def get_invite_stats(user_id):
     """获取用户的邀请统计信息"""
-    with get_db_connection() as conn:
+    with get_db_connection(readonly=True) as conn:
         cursor = conn.cursor()
 
         # 获取成功邀请的人数（invitee_id 不为 NULL 的记录）
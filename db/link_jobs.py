@@ -0,0 +1,159 @@
+import json
+import logging
+from datetime import datetime
+
+from .database import get_db_connection
+
+# 初始化日志记录器
+log = logging.getLogger("LinkJobs")
+
+
+def enqueue_link_job(user_id, priority, payload):
+    """
+    写入一个待处理的链接任务
+
+    :param payload: 可序列化为 JSON 的任务内容
+    :return: 任务ID
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+        cursor.execute('''
+        INSERT INTO link_jobs (user_id, priority, payload, status, created_at, updated_at)
+        VALUES (?, ?, ?, 'pending', ?, ?)
+        ''', (user_id, priority, json.dumps(payload), now, now))
+        conn.commit()
+        return cursor.lastrowid
+
+
+def claim_link_job(worker_id):
+    """
+    取出优先级最高、最早写入的待处理任务并标记为执行中，多个进程同时调用时每个任务只会被取出一次
+
+    :param worker_id: 工作进程标识，进程退出后据此将其未完成的任务放回队列
+    :return: (任务ID, 任务内容)，没有待处理任务时返回 None
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            # 立即取得写锁，查询和标记之间不会有其他进程取走同一个任务
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute('''
+            SELECT id, payload FROM link_jobs WHERE status = 'pending'
+            ORDER BY priority, id
+            LIMIT 1
+            ''')
+            result = cursor.fetchone()
+            if not result:
+                conn.rollback()
+                return None
+            cursor.execute('''
+            UPDATE link_jobs SET status = 'running', worker_id = ?, attempts = attempts + 1, updated_at = ?
+            WHERE id = ?
+            ''', (worker_id, datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'), result[0]))
+            conn.commit()
+        except Exception as e:
+            log.exception(f"取出链接任务失败: {e}")
+            conn.rollback()
+            return None
+    return result[0], json.loads(result[1])
+
+
+def finish_link_job(job_id, error=None):
+    """记录任务执行结果，error 为 None 时表示成功"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+            UPDATE link_jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?
+            ''', ('failed' if error else 'done', error, datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'), job_id))
+            conn.commit()
+        except Exception as e:
+            log.exception(f"保存链接任务结果失败: {e}")
+            conn.rollback()
+
+
+def requeue_link_jobs(max_attempts, worker_id=None):
+    """
+    将执行中断的任务放回队列，已尝试 max_attempts 次的任务标记为失败
+
+    :param worker_id: 只处理该工作进程的任务，为 None 时处理所有执行中的任务（入口进程启动时）
+    :return: 放回队列的任务数
+    """
+    condition, params = ("status = 'running' AND worker_id = ?", (worker_id,)) if worker_id \
+        else ("status = 'running'", ())
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+            cursor.execute(f'''
+            UPDATE link_jobs SET status = 'failed', error = '工作进程异常退出', updated_at = ?
+            WHERE {condition} AND attempts >= ?
+            ''', (now, *params, max_attempts))
+            cursor.execute(f'''
+            UPDATE link_jobs SET status = 'pending', worker_id = NULL, updated_at = ?
+            WHERE {condition}
+            ''', (now, *params))
+            conn.commit()
+            return cursor.rowcount
+        except Exception as e:
+            log.exception(f"重新排队链接任务失败: {e}")
+            conn.rollback()
+            return 0
+
+
+def count_link_jobs(user_id=None, status=None):
+    """
+    统计未完成的任务数
+
+    :param user_id: 只统计该用户的任务
+    :param status: 'pending' 或 'running'，为 None 时两者都统计
+    """
+    conditions = ["status IN ('pending', 'running')" if status is None else "status = ?"]
+    params = [] if status is None else [status]
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM link_jobs WHERE {' AND '.join(conditions)}", params)
+        return cursor.fetchone()[0]
+
+
+def count_link_jobs_ahead(job_id):
+    """统计排在该任务前面的待处理任务数"""
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT COUNT(*) FROM link_jobs j, link_jobs t
+        WHERE t.id = ? AND j.status = 'pending'
+        AND (j.priority < t.priority OR (j.priority = t.priority AND j.id < t.id))
+        ''', (job_id,))
+        return cursor.fetchone()[0]
+
+
+def pop_finished_link_jobs(limit=100):
+    """
+    取出并删除已结束的任务
+
+    :return: [(任务ID, 状态, 任务内容, 错误信息)]
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+            SELECT id, status, payload, error FROM link_jobs WHERE status IN ('done', 'failed')
+            ORDER BY id
+            LIMIT ?
+            ''', (limit,))
+            results = cursor.fetchall()
+            if results:
+                cursor.execute(f'''
+                DELETE FROM link_jobs WHERE id IN ({', '.join('?' * len(results))})
+                ''', [row[0] for row in results])
+            conn.commit()
+        except Exception as e:
+            log.exception(f"取出已结束的链接任务失败: {e}")
+            conn.rollback()
+            return []
+    return [(job_id, status, json.loads(payload), error) for job_id, status, payload, error in results]
@@ -0,0 +1,82 @@
+import logging
+from datetime import datetime
+
+from telethon.tl.types import Message, MessageMediaDocument, MessageMediaPhoto
+
+from .database import get_db_connection
+from .message_relations import ARCHIVED_COLUMNS, chat_id_filter
+
+# 初始化日志记录器
+log = logging.getLogger("MediaCache")
+
+
+def get_media_key(message):
+    """获取消息中媒体的缓存键 (media_type, media_id)，没有可缓存的媒体时返回 None"""
+    if isinstance(message.media, MessageMediaDocument) and message.media.document:
+        return 'document', message.media.document.id
+    if isinstance(message.media, MessageMediaPhoto) and message.media.photo:
+        return 'photo', message.media.photo.id
+    return None
+
+
+def save_media_cache(media_type, media_id, target_chat_id, target_message_id):
+    """保存媒体与归档消息的对应关系"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+            cursor.execute('''
+            INSERT OR REPLACE INTO media_cache 
+            (media_type, media_id, target_chat_id, target_message_id, created_at) 
+            VALUES (?, ?, ?, ?, ?)
+            ''', (media_type, media_id, str(target_chat_id), target_message_id, created_at))
+            conn.commit()
+        except Exception as e:
+            log.exception(f"保存媒体缓存失败: {e}")
+            conn.rollback()
+
+
+def save_media_group_cache(source_messages, target_chat_id, target_messages):
+    """批量保存媒体组中每个媒体与归档消息的对应关系"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+            for source_msg, target_msg in zip(source_messages, target_messages):
+                key = get_media_key(source_msg)
+                if not key:
+                    continue
+                cursor.execute('''
+                INSERT OR REPLACE INTO media_cache 
+                (media_type, media_id, target_chat_id, target_message_id, created_at) 
+                VALUES (?, ?, ?, ?, ?)
+                ''', (key[0], key[1], str(target_chat_id),
+                      target_msg.id if isinstance(target_msg, Message) else target_msg, created_at))
+            conn.commit()
+        except Exception as e:
+            log.exception(f"保存媒体组缓存失败: {e}")
+            conn.rollback()
+
+
+def find_media_cache(media_type, media_id, target_chat_ids):
+    """
+    查找媒体已归档的消息，同时返回消息关系中保存的归档媒体信息（可能为空）
+
+    :param target_chat_ids: 一个或多个归档频道ID，在其中查找最近归档的一条
+    :return: (归档频道ID, 归档消息ID, 媒体信息列...)，没有记录时返回 None
+    """
+    chat_filter, chat_ids = chat_id_filter("c.target_chat_id", target_chat_ids)
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        SELECT CAST(c.target_chat_id AS INTEGER), c.target_message_id,
+               {", ".join("r." + column.strip() for column in ARCHIVED_COLUMNS.split(","))}
+        FROM media_cache c
+        LEFT JOIN message_relations r
+        ON r.target_chat_id = c.target_chat_id AND r.target_message_id = c.target_message_id
+        WHERE c.media_type = ? AND c.media_id = ? AND {chat_filter}
+        ORDER BY c.created_at DESC
+        LIMIT 1
+        ''', (media_type, media_id, *chat_ids))
+        result = cursor.fetchone()
+    return result
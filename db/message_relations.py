@@ -1,26 +1,122 @@
 import logging
+from collections import namedtuple
 from datetime import datetime
 
-from telethon.tl.types import Message
+from telethon.extensions import BinaryReader
+from telethon.tl.types import (
+    Message, MessageMediaDocument, MessageMediaPhoto, MessageMediaWebPage, InputDocument, InputPhoto
+)
 
 from .database import get_db_connection
 
 # 初始化日志记录器
 log = logging.getLogger("MessageRelations")
 
+# 归档消息的媒体信息列，查询结果中紧跟在消息ID之后
+ARCHIVED_COLUMNS = "media_type, media_id, access_hash, file_reference, caption, entities, reply_markup"
 
-def save_message_relation(source_chat_id, source_message_id, target_chat_id, target_message_id, grouped_id=None):
-    """保存消息转发关系"""
+# 归档消息中可直接重新发送的内容：media 为 InputDocument/InputPhoto，没有媒体时为 None；target_chat_id 为所在的归档频道
+ArchivedMessage = namedtuple("ArchivedMessage", ["target_message_id", "media", "caption", "entities", "reply_markup",
+                                                 "target_chat_id"], defaults=(None,))
+
+
+def chat_id_filter(column, target_chat_ids):
+    """
+    生成按归档频道过滤的 SQL 条件
+
+    :param column: 归档频道ID列名
+    :param target_chat_ids: 一个归档频道ID，或多个归档频道ID的列表
+    :return: (SQL 条件, 参数列表)
+    """
+    if isinstance(target_chat_ids, (int, str)):
+        target_chat_ids = [target_chat_ids]
+    chat_ids = [str(chat_id) for chat_id in target_chat_ids]
+    return f"{column} IN ({', '.join('?' * len(chat_ids))})", chat_ids
+
+
+def _dump_tl_objects(objects):
+    """将 TL 对象列表序列化为字节串"""
+    if not objects:
+        return None
+    return b''.join(bytes(obj) for obj in objects)
+
+
+def _load_tl_objects(data):
+    """从字节串中反序列化 TL 对象列表"""
+    objects = []
+    if not data:
+        return objects
+    with BinaryReader(data) as reader:
+        while reader.tell_position() < len(data):
+            objects.append(reader.tgread_object())
+    return objects
+
+
+def get_archived_columns(message):
+    """提取归档消息的媒体信息列，与 ARCHIVED_COLUMNS 的顺序一致"""
+    media_type, media_id, access_hash, file_reference = None, None, None, None
+    if isinstance(message.media, MessageMediaDocument) and message.media.document:
+        document = message.media.document
+        media_type, media_id, access_hash, file_reference = \
+            'document', document.id, document.access_hash, document.file_reference
+    elif isinstance(message.media, MessageMediaPhoto) and message.media.photo:
+        photo = message.media.photo
+        media_type, media_id, access_hash, file_reference = 'photo', photo.id, photo.access_hash, photo.file_reference
+    elif message.media and not isinstance(message.media, MessageMediaWebPage):
+        # 其他类型的媒体无法通过文件引用重新发送，网页预览则按纯文本消息处理
+        media_type = 'other'
+    return (media_type, media_id, access_hash, file_reference, message.message or '',
+            _dump_tl_objects(message.entities),
+            bytes(message.reply_markup) if message.reply_markup else None)
+
+
+def load_archived_message(target_message_id, columns, target_chat_id=None):
+    """
+    根据查询到的媒体信息列还原归档消息
+
+    :param target_message_id: 归档消息ID
+    :param columns: 按 ARCHIVED_COLUMNS 顺序排列的媒体信息列
+    :param target_chat_id: 归档频道ID
+    :return: ArchivedMessage，旧记录没有保存媒体信息或媒体无法直接重新发送时返回 None
+    """
+    media_type, media_id, access_hash, file_reference, caption, entities, reply_markup = columns
+    if caption is None or media_type == 'other':
+        return None
+    media = None
+    if media_type == 'document':
+        media = InputDocument(media_id, access_hash, file_reference)
+    elif media_type == 'photo':
+        media = InputPhoto(media_id, access_hash, file_reference)
+    reply_markup_objects = _load_tl_objects(reply_markup)
+    return ArchivedMessage(target_message_id, media, caption, _load_tl_objects(entities),
+                           reply_markup_objects[0] if reply_markup_objects else None, target_chat_id)
+
+
+def to_archived_message(message, target_chat_id=None):
+    """将从归档频道获取到的消息转换为 ArchivedMessage，无法通过文件引用重新发送的媒体保留原对象"""
+    archived = load_archived_message(message.id, get_archived_columns(message), target_chat_id)
+    if archived:
+        return archived
+    return ArchivedMessage(message.id, message.media, message.message or '', message.entities or [],
+                           message.reply_markup, target_chat_id)
+
+
+def save_message_relation(source_chat_id, source_message_id, target_chat_id, target_message_id, grouped_id=None,
+                          archived_message=None):
+    """保存消息转发关系，传入 archived_message 时同时保存归档消息的媒体信息"""
+    archived_columns = get_archived_columns(archived_message) if archived_message else (None,) * 7
     with get_db_connection() as conn:
         cursor = conn.cursor()
         try:
             created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-            cursor.execute('''
+            cursor.execute(f'''
             INSERT INTO message_relations 
-            (source_chat_id, source_message_id, target_chat_id, target_message_id, grouped_id, created_at) 
-            VALUES (?, ?, ?, ?, ?, ?)
+            (source_chat_id, source_message_id, target_chat_id, target_message_id, grouped_id, created_at,
+             {ARCHIVED_COLUMNS}) 
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
-                str(source_chat_id), source_message_id, str(target_chat_id), target_message_id, grouped_id, created_at))
+                str(source_chat_id), source_message_id, str(target_chat_id), target_message_id, grouped_id, created_at,
+                *archived_columns))
             conn.commit()
         except Exception as e:
             if 'UNIQUE constraint failed' in str(e):
@@ -28,11 +124,13 @@ def save_message_relation(source_chat_id, source_message_id, target_chat_id, tar
                 created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
                 cursor.execute('''
                 UPDATE message_relations 
-                SET target_message_id = ?, grouped_id = ?, created_at = ?
+                SET target_message_id = ?, grouped_id = ?, created_at = ?,
+                    media_type = ?, media_id = ?, access_hash = ?, file_reference = ?,
+                    caption = ?, entities = ?, reply_markup = ?
                 WHERE source_chat_id = ? AND source_message_id = ? AND target_chat_id = ?
                 ''', (
-                    target_message_id, grouped_id, created_at, str(source_chat_id), source_message_id,
-                    str(target_chat_id)))
+                    target_message_id, grouped_id, created_at, *archived_columns, str(source_chat_id),
+                    source_message_id, str(target_chat_id)))
                 conn.commit()
             else:
                 log.exception(f"保存消息关系失败: {e}")
@@ -48,27 +146,33 @@ def save_media_group_relations(source_chat_id, source_messages, target_chat_id,
                 if i < len(target_messages):
                     source_msg = source_messages[i]
                     target_msg = target_messages[i] if isinstance(target_messages[i], Message) else target_messages
+                    archived_columns = get_archived_columns(target_msg) if isinstance(target_msg, Message) \
+                        else (None,) * 7
                     created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
                     try:
-                        cursor.execute('''
+                        cursor.execute(f'''
                         INSERT INTO message_relations 
-                        (source_chat_id, source_message_id, target_chat_id, target_message_id, grouped_id, created_at) 
-                        VALUES (?, ?, ?, ?, ?, ?)
+                        (source_chat_id, source_message_id, target_chat_id, target_message_id, grouped_id, created_at,
+                         {ARCHIVED_COLUMNS}) 
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                         ''', (str(source_chat_id), source_msg.id, str(target_chat_id),
                               target_msg.id if isinstance(target_msg, Message) else target_msg,
-                              grouped_id, created_at))
+                              grouped_id, created_at, *archived_columns))
                     except Exception as e:
                         if 'UNIQUE constraint failed' in str(e):
                             # 如果已存在，则更新
                             created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
                             cursor.execute('''
                             UPDATE message_relations 
-                            SET target_message_id = ?, grouped_id = ?, created_at = ?
+                            SET target_message_id = ?, grouped_id = ?, created_at = ?,
+                                media_type = ?, media_id = ?, access_hash = ?, file_reference = ?,
+                                caption = ?, entities = ?, reply_markup = ?
                             WHERE source_chat_id = ? AND source_message_id = ? AND target_chat_id = ?
                             ''', (
                                 target_msg.id if isinstance(target_msg, Message) else target_msg, 
                                 grouped_id, 
                                 created_at, 
+                                *archived_columns,
                                 str(source_chat_id), 
                                 source_msg.id,
                                 str(target_chat_id)))
@@ -80,37 +184,84 @@ def save_media_group_relations(source_chat_id, source_messages, target_chat_id,
             conn.rollback()
 
 
-def find_forwarded_message(source_chat_id, source_message_id, target_chat_id):
-    """查找已转发的消息（针对媒体组）"""
+def update_archived_message(target_chat_id, message):
+    """用重新获取的归档消息更新保存的媒体信息（例如文件引用过期后）"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-        SELECT target_message_id, grouped_id FROM message_relations
-        WHERE source_chat_id = ? AND source_message_id = ? AND target_chat_id = ? and grouped_id != 0
-        ''', (str(source_chat_id), source_message_id, str(target_chat_id)))
+        try:
+            cursor.execute('''
+            UPDATE message_relations 
+            SET media_type = ?, media_id = ?, access_hash = ?, file_reference = ?,
+                caption = ?, entities = ?, reply_markup = ?
+            WHERE target_chat_id = ? AND target_message_id = ?
+            ''', (*get_archived_columns(message), str(target_chat_id), message.id))
+            conn.commit()
+        except Exception as e:
+            log.exception(f"更新归档消息媒体信息失败: {e}")
+            conn.rollback()
+
+
+def find_forwarded_message(source_chat_id, source_message_id, target_chat_ids):
+    """
+    查找已转发的消息（针对媒体组）
+
+    :param target_chat_ids: 一个或多个归档频道ID，在其中查找最近的一条记录
+    :return: (归档频道ID, 归档消息ID, grouped_id, 媒体信息列...)，没有记录时返回 None
+    """
+    chat_filter, chat_ids = chat_id_filter("target_chat_id", target_chat_ids)
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        SELECT CAST(target_chat_id AS INTEGER), target_message_id, grouped_id, {ARCHIVED_COLUMNS}
+        FROM message_relations
+        WHERE source_chat_id = ? AND source_message_id = ? AND {chat_filter} and grouped_id != 0
+        ORDER BY created_at DESC
+        LIMIT 1
+        ''', (str(source_chat_id), source_message_id, *chat_ids))
         result = cursor.fetchone()
     return result
 
 
-def find_forwarded_message_for_one(source_chat_id, source_message_id, target_chat_id):
-    """查找已转发的单条消息"""
-    with get_db_connection() as conn:
+def find_forwarded_message_for_one(source_chat_id, source_message_id, target_chat_ids):
+    """
+    查找已转发的单条消息
+
+    :param target_chat_ids: 一个或多个归档频道ID，在其中查找最近的一条记录
+    :return: (归档频道ID, 归档消息ID, grouped_id, 媒体信息列...)，没有记录时返回 None
+    """
+    chat_filter, chat_ids = chat_id_filter("target_chat_id", target_chat_ids)
+    with get_db_connection(readonly=True) as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-        SELECT target_message_id, grouped_id FROM message_relations
-        WHERE source_chat_id = ? AND source_message_id = ? AND target_chat_id = ? AND grouped_id = 0
-        ''', (str(source_chat_id), source_message_id, str(target_chat_id)))
+        cursor.execute(f'''
+        SELECT CAST(target_chat_id AS INTEGER), target_message_id, grouped_id, {ARCHIVED_COLUMNS}
+        FROM message_relations
+        WHERE source_chat_id = ? AND source_message_id = ? AND {chat_filter} AND grouped_id = 0
+        ORDER BY created_at DESC
+        LIMIT 1
+        ''', (str(source_chat_id), source_message_id, *chat_ids))
         result = cursor.fetchone()
     return result
 
 
-def find_grouped_messages(source_chat_id, grouped_id, target_chat_id):
-    """查找相同组ID的所有转发消息"""
-    with get_db_connection() as conn:
+def find_grouped_messages(source_chat_id, grouped_id, target_chat_ids):
+    """
+    查找相同组ID的所有转发消息
+
+    :param target_chat_ids: 一个或多个归档频道ID；同一组在多个归档频道中都有记录时，只返回最近归档的那个频道中的记录
+    :return: [(源消息ID, 归档频道ID, 归档消息ID, 媒体信息列...)]
+    """
+    chat_filter, chat_ids = chat_id_filter("target_chat_id", target_chat_ids)
+    with get_db_connection(readonly=True) as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-        SELECT source_message_id, target_message_id FROM message_relations 
-        WHERE source_chat_id = ? AND grouped_id = ? AND target_chat_id = ?
-        ''', (str(source_chat_id), grouped_id, str(target_chat_id)))
+        cursor.execute(f'''
+        SELECT source_message_id, CAST(target_chat_id AS INTEGER), target_message_id, {ARCHIVED_COLUMNS}
+        FROM message_relations 
+        WHERE source_chat_id = ? AND grouped_id = ? AND {chat_filter}
+        ORDER BY created_at DESC
+        ''', (str(source_chat_id), grouped_id, *chat_ids))
         results = cursor.fetchall()
+    # 一个媒体组只能从同一个归档频道整体转发
+    if results:
+        latest_chat_id = results[0][1]
+        results = sorted((row for row in results if row[1] == latest_chat_id), key=lambda row: row[0])
     return results
@@ -108,7 +108,7 @@ def cancel_expired_order(order_id):
 
 def get_all_pending_orders():
     """获取所有待处理的订单"""
-    with get_db_connection() as conn:
+    with get_db_connection(readonly=True) as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM orders WHERE status = "pending"')
         orders = cursor.fetchall()
@@ -149,7 +149,7 @@ def create_new_order(user_id, package_name, amount, quota_amount):
 
 def get_order_by_id(order_id):
     """通过订单ID获取订单信息"""
-    with get_db_connection() as conn:
+    with get_db_connection(readonly=True) as conn:
         cursor = conn.cursor()
 
         cursor.execute('SELECT * FROM orders WHERE order_id = ?', (order_id,))
@@ -160,7 +160,7 @@ def get_order_by_id(order_id):
 
 def get_user_pending_orders(user_id):
     """获取用户的待处理订单"""
-    with get_db_connection() as conn:
+    with get_db_connection(readonly=True) as conn:
         cursor = conn.cursor()
         cursor.execute('SELECT * FROM orders WHERE user_id = ? AND status = "pending" ORDER BY created_at DESC',
                        (str(user_id),))
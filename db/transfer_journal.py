@@ -0,0 +1,83 @@
+import logging
+from datetime import datetime, timedelta
+
+from .database import get_db_connection
+
+# 初始化日志记录器
+log = logging.getLogger("TransferJournal")
+
+
+def get_transfer_journal(document_id, direction, max_age):
+    """
+    查找文档未完成的传输记录
+
+    :param document_id: 文档ID
+    :param direction: 'download' 或 'upload'
+    :param max_age: 记录的最长有效时间（秒），超过时视为失效
+    :return: (file_id, part_size, completed_parts)，没有有效记录时返回 None
+    """
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT file_id, part_size, completed_parts, updated_at FROM transfer_journal
+        WHERE document_id = ? AND direction = ?
+        ''', (document_id, direction))
+        result = cursor.fetchone()
+    if not result:
+        return None
+    file_id, part_size, completed_parts, updated_at = result
+    if datetime.strptime(updated_at, '%Y-%m-%d %H:%M:%S.%f') < datetime.now() - timedelta(seconds=max_age):
+        return None
+    return file_id, part_size, completed_parts
+
+
+def save_transfer_progress(document_id, direction, file_id, part_size, completed_parts):
+    """记录文档传输已连续完成的分片数"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+            cursor.execute('''
+            INSERT OR REPLACE INTO transfer_journal
+            (document_id, direction, file_id, part_size, completed_parts, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (document_id, direction, file_id, part_size, completed_parts, updated_at))
+            conn.commit()
+        except Exception as e:
+            log.exception(f"保存传输进度失败: {e}")
+            conn.rollback()
+
+
+def delete_transfer_journal(document_id, direction):
+    """传输完成后删除记录"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+            DELETE FROM transfer_journal WHERE document_id = ? AND direction = ?
+            ''', (document_id, direction))
+            conn.commit()
+        except Exception as e:
+            log.exception(f"删除传输记录失败: {e}")
+            conn.rollback()
+
+
+def purge_transfer_journal(max_age):
+    """删除超过有效时间的传输记录，返回被删除记录的 (document_id, direction) 列表"""
+    expired_before = (datetime.now() - timedelta(seconds=max_age)).strftime('%Y-%m-%d %H:%M:%S.%f')
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+            SELECT document_id, direction FROM transfer_journal WHERE updated_at < ?
+            ''', (expired_before,))
+            expired = cursor.fetchall()
+            cursor.execute('''
+            DELETE FROM transfer_journal WHERE updated_at < ?
+            ''', (expired_before,))
+            conn.commit()
+            return expired
+        except Exception as e:
+            log.exception(f"清理传输记录失败: {e}")
+            conn.rollback()
+            return []
@@ -9,6 +9,16 @@ log = logging.getLogger("UserQuota")
 
 def get_user_quota(user_id):
     """获取用户当前的转发次数配额"""
+    # 已有记录且今天已重置过时只需要读取，不占用写连接
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT free_quota, paid_quota, last_reset_date FROM user_forward_quota WHERE user_id = ?',
+                       (str(user_id),))
+        result = cursor.fetchone()
+    current_date = datetime.now().strftime('%Y-%m-%d')
+    if result and result[2] == current_date:
+        return result[0], result[1], current_date
+
     with get_db_connection() as conn:
         cursor = conn.cursor()
 
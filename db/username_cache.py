@@ -0,0 +1,59 @@
+import logging
+from datetime import datetime
+
+from .database import get_db_connection
+
+# 初始化日志记录器
+log = logging.getLogger("UsernameCache")
+
+
+def get_cached_username(account_id, username):
+    """
+    查找账号已解析过的用户名
+
+    :param account_id: 解析用户名的账号ID，access_hash 只对该账号有效
+    :param username: 小写的用户名，不带 @
+    :return: (peer_type, peer_id, access_hash, updated_at)，updated_at 为 datetime；没有记录时返回 None
+    """
+    with get_db_connection(readonly=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        SELECT peer_type, peer_id, access_hash, updated_at FROM username_cache
+        WHERE account_id = ? AND username = ?
+        ''', (account_id, username))
+        result = cursor.fetchone()
+    if not result:
+        return None
+    peer_type, peer_id, access_hash, updated_at = result
+    return peer_type, peer_id, access_hash, datetime.strptime(updated_at, '%Y-%m-%d %H:%M:%S.%f')
+
+
+def save_cached_username(account_id, username, peer_type, peer_id, access_hash):
+    """记录用户名的解析结果"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
+            cursor.execute('''
+            INSERT OR REPLACE INTO username_cache
+            (account_id, username, peer_type, peer_id, access_hash, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ''', (account_id, username, peer_type, peer_id, access_hash, updated_at))
+            conn.commit()
+        except Exception as e:
+            log.exception(f"保存用户名解析结果失败: {e}")
+            conn.rollback()
+
+
+def delete_cached_username(account_id, username):
+    """用户名已失效时删除记录"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+            DELETE FROM username_cache WHERE account_id = ? AND username = ?
+            ''', (account_id, username))
+            conn.commit()
+        except Exception as e:
+            log.exception(f"删除用户名解析结果失败: {e}")
+            conn.rollback()
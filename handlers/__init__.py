@@ -3,6 +3,8 @@ from .callback_handler import (
 )
 from .message_handler import (
     on_new_link,
+    process_link,
+    QueuedEvent,
     process_forward_quota
 )
 from .user_commands import (
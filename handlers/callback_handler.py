@@ -6,7 +6,7 @@ from telethon.tl.custom import Button
 
 # 获取全局变量
 from config import USDT_WALLET, ADMIN_ID
-from db import (
+from db.aio import (
     get_order_by_id, create_new_order
 )
 
@@ -31,7 +31,7 @@ async def callback_handler(event, bot_client):
     if data in packages:
         package = packages[data]
         # 创建新订单
-        order_id, unique_amount = create_new_order(user_id, package["name"], package["price"], package["quota"])
+        order_id, unique_amount = await create_new_order(user_id, package["name"], package["price"], package["quota"])
 
         if order_id:
             # 生成付款信息
@@ -73,7 +73,7 @@ async def callback_handler(event, bot_client):
     # 查询订单状态
     elif data.startswith(b"check_"):
         order_id = data[6:].decode('utf-8')
-        order = get_order_by_id(order_id)
+        order = await get_order_by_id(order_id)
 
         if order:
             # 假设order是tuple(order_id, user_id, package_name, amount, quota_amount, status, payment_address, tx_hash, memo, last_checked, created_at, updated_at, completed_at)
@@ -1,58 +1,53 @@
 import asyncio
+import copy
 import logging
-import os
-import tempfile
-import time
 import urllib.parse
+from types import SimpleNamespace
 
-import aiofiles
-import aiofiles.os
-import aiohttp
 from telethon import events, utils
 from telethon.errors import ChannelPrivateError, InviteHashInvalidError, UserAlreadyParticipantError, \
-    UserBannedInChannelError, InviteRequestSentError, UserRestrictedError, InviteHashExpiredError, FloodWaitError
-from telethon.tl.functions.messages import ImportChatInviteRequest
+    UserBannedInChannelError, InviteRequestSentError, UserRestrictedError, InviteHashExpiredError, FloodWaitError, \
+    FileReferenceExpiredError, FileReferenceInvalidError, RPCError
+from telethon.extensions import BinaryReader, markdown
+from telethon.helpers import add_surrogate
+from telethon.tl.functions.messages import ForwardMessagesRequest
 from telethon.tl.types import MessageMediaDocument, PeerChannel, Message, MessageMediaPhoto, InputMediaUploadedPhoto, \
-    InputMediaUploadedDocument
+    InputMediaUploadedDocument, InputDocument, InputReplyToMessage
 
-from db import (
+from db import get_media_key, load_archived_message, to_archived_message
+from db.aio import (
     get_user_quota, decrease_user_quota, save_message_relation, save_media_group_relations,
-    find_forwarded_message, find_forwarded_message_for_one, find_grouped_messages
+    find_forwarded_message, find_forwarded_message_for_one, find_grouped_messages,
+    save_media_cache, save_media_group_cache, find_media_cache, update_archived_message
 )
 
 # 初始化日志记录器
 log = logging.getLogger("MessageHandler")
 
 # 获取全局变量
-from config import PRIVATE_CHAT_ID, RANGE, get_proxy
+from config import STREAM_TRANSFER, ALBUM_FORWARD_COPY
+from services import (
+    stream_document, transfer_message_media, get_document_file_name, get_media_size, transfer_budget, get_chat, \
+    call_with_peer, get_comment_message, get_comment_media_group, discover_media_group, archive_flight, \
+    job_queue, QueueFullError, UserJobLimitError, PRIORITY_PAID, PRIORITY_FREE, archive_ring, link_job_queue
+)
 
 # 附加信息
 addInfo = "\n\n♋[91转发|机器人](https://t.me/91_zf_bot)👉：@91_zf_bot\n♍[91转发|聊天👉：](https://t.me/91_zf_bot)@91_zf_group\n🔯[91转发|通知👉：](https://t.me/91_zf_channel)@91_zf_channel"
 
-# 用户锁字典，防止并发请求
-USER_LOCKS = {}
-
-
-async def create_temp_file(suffix=""):
-    """创建临时文件的异步封装"""
-    try:
-        temp_file = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
-        temp_name = temp_file.name
-        temp_file.close()
-        return temp_name
-    except Exception as e:
-        log.exception(f"创建临时文件失败: {e}")
-        raise
+# 附加信息解析为纯文本和 entities，以便直接拼接到归档消息保存的 caption 后面（markdown 解析会去掉开头的换行）
+ADD_INFO_TEXT, ADD_INFO_ENTITIES = markdown.parse(addInfo)
+ADD_INFO_PREFIX = addInfo[:len(addInfo) - len(addInfo.lstrip())]
 
 
 async def process_forward_quota(event):
     """处理转发次数减少并发送提示消息的公共方法"""
     # 减少用户转发次数
     user_id = event.sender_id
-    decrease_user_quota(user_id)
+    await decrease_user_quota(user_id)
 
     # 获取用户剩余次数
-    free_quota, paid_quota, _ = get_user_quota(user_id)
+    free_quota, paid_quota, _ = await get_user_quota(user_id)
     total_quota = free_quota + paid_quota
 
     # 在转发成功后告知用户剩余次数
@@ -63,24 +58,16 @@ async def replace_message(message: Message, bot_token):
     if message.fwd_from and message.fwd_from.from_id and message.fwd_from.channel_post:
         peer_id = utils.get_peer_id(message.fwd_from.from_id)
         message_id = message.fwd_from.channel_post
-        url = f"https://api.telegram.org/bot{bot_token}/getChat"
-        req_params = {"chat_id": peer_id}
-
-        # 获取代理设置
-        proxy = get_proxy(proxy_format="url")
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, params=req_params, proxy=proxy) as response:
-                peer_type = "channel"
-                channel_username = None
-                if response.status == 200:
-                    result = await response.json()
-                    if result and result.get("ok"):
-                        channel = result.get("result")
-                        peer_type = channel.get("type", "channel")
-                        channel_username = channel.get("username")
-                if peer_type == "channel" and channel_username:
-                    return channel_username, message_id
+
+        # 频道信息几乎不变，通过缓存查询，转发来源的实体已随消息缓存在会话中
+        channel = await get_chat(bot_token, peer_id, client=message.client)
+        peer_type = "channel"
+        channel_username = None
+        if channel:
+            peer_type = channel.get("type", "channel")
+            channel_username = channel.get("username")
+        if peer_type == "channel" and channel_username:
+            return channel_username, message_id
     return None
 
 
@@ -102,152 +89,264 @@ async def prepare_album_file(msg: Message, user_client, bot_client):
     # 为临时文件添加扩展名
     suffix = ".jpg" if isinstance(msg.media,
                                   MessageMediaPhoto) else ".mp4" if "video/mp4" in msg.media.document.mime_type else ""
-    temp_name = None
-    thumb_path = None
-    file_path = None
+    thumb = None
 
-    try:
-        temp_name = await create_temp_file(suffix=suffix)
-        file_path = await user_client.download_media(msg, file=temp_name)
+    # 按文件大小申请传输额度，超出进程内传输上限时在此排队
+    async with transfer_budget.reserve(get_media_size(msg)):
         if isinstance(msg.media, MessageMediaPhoto):
-            return InputMediaUploadedPhoto(file=await bot_client.upload_file(file_path))
+            # 小文件在内存中转存，大文件经临时文件池
+            uploaded_file = await transfer_message_media(user_client, bot_client, msg, f"{msg.id}{suffix}")
+            return InputMediaUploadedPhoto(file=uploaded_file)
         elif isinstance(msg.media, MessageMediaDocument):
+            if STREAM_TRANSFER:
+                # 流式转存，边下载边上传
+                uploaded_file = await stream_document(user_client, bot_client, msg.media.document)
+            else:
+                uploaded_file = await transfer_message_media(user_client, bot_client, msg,
+                                                             get_document_file_name(msg.media.document))
             if (msg.media.document.mime_type == "video/mp4" and msg.media.document.size > 10 * 1024 * 1024) or (
                     msg.media.document.mime_type == "image/heic"):
-                thumb_path = await user_client.download_media(
-                    msg, file=f"{temp_name}_thumb.jpg", thumb=-1
-                )
+                # 缩略图很小，直接下载到内存
+                thumb = await user_client.download_media(msg, file=bytes, thumb=-1)
             # 对于文档类型，返回带有特殊标记的对象，以便后续处理
             return InputMediaUploadedDocument(
-                file=await bot_client.upload_file(file_path),
-                thumb=await bot_client.upload_file(thumb_path) if thumb_path else None,
+                file=uploaded_file,
+                thumb=await bot_client.upload_file(thumb, file_name=f"{msg.id}_thumb.jpg") if thumb else None,
                 mime_type=msg.media.document.mime_type or "application/octet-stream",
                 attributes=msg.media.document.attributes,
                 nosound_video=True
             )
-    finally:
-        # 删除临时文件
-        if file_path and os.path.exists(file_path):
-            await aiofiles.os.remove(file_path)
-        if thumb_path and os.path.exists(thumb_path):
-            await aiofiles.os.remove(thumb_path)
-        if temp_name and os.path.exists(temp_name):
-            await aiofiles.os.remove(temp_name)
-
-
-async def get_comment_message(client, channel, message_id, comment_id):
-    """从评论中获取指定的评论消息及其 grouped_id"""
-    async for reply in client.iter_messages(
-            entity=channel,
-            reply_to=message_id
-    ):
-        if reply.id == comment_id:
-            return reply, reply.grouped_id  # 返回匹配的评论消息及其 grouped_id
-    return None, None  # 如果没有找到，返回 None
 
 
-async def single_forward_message(event, relation, bot_client):
-    # 如果有记录，直接转发保存的消息
-    target_message_id = relation[0]
-    # await event.reply("该消息已经转发过，正在重新发送...")
-    message = await bot_client.get_messages(PeerChannel(PRIVATE_CHAT_ID), ids=target_message_id)
-    if message.media:
-        await bot_client.send_file(event.chat_id, message.media, caption=message.text + addInfo,
-                                   buttons=message.buttons,
-                                   reply_to=event.message.id)
+def append_add_info(caption, entities):
+    """在归档消息的 caption 后追加附加信息，返回新的文本和 entities（偏移量按 UTF-16 计算）"""
+    caption = caption + ADD_INFO_PREFIX
+    offset = len(add_surrogate(caption))
+    add_info_entities = []
+    for entity in ADD_INFO_ENTITIES:
+        entity = copy.copy(entity)
+        entity.offset += offset
+        add_info_entities.append(entity)
+    return caption + ADD_INFO_TEXT, list(entities) + add_info_entities
+
+
+async def refresh_archived_messages(bot_client, targets):
+    """
+    从归档频道重新获取消息，更新保存的文件引用等信息
+
+    :param targets: {(归档频道ID, 归档消息ID)}
+    :return: {(归档频道ID, 归档消息ID): ArchivedMessage}
+    """
+    target_ids = {}
+    for chat_id, target_id in targets:
+        target_ids.setdefault(chat_id, []).append(target_id)
+    archived = {}
+    for chat_id, ids in target_ids.items():
+        messages = await bot_client.get_messages(PeerChannel(chat_id), ids=ids)
+        for msg in messages:
+            if msg:
+                await update_archived_message(chat_id, msg)
+                archived[(chat_id, msg.id)] = to_archived_message(msg, chat_id)
+    return archived
+
+
+async def load_archived_messages(bot_client, rows):
+    """
+    根据数据库记录还原归档消息，旧记录缺少媒体信息时从归档频道获取并补存
+
+    :param rows: [(键, 归档频道ID, 归档消息ID, 按 ARCHIVED_COLUMNS 顺序排列的媒体信息列...)]
+    :return: {键: ArchivedMessage}，归档频道中已不存在的消息不会出现在结果中
+    """
+    archived = {key: load_archived_message(target_id, columns, chat_id) for key, chat_id, target_id, *columns in rows}
+    missing = {(chat_id, target_id) for key, chat_id, target_id, *_ in rows if archived[key] is None}
+    if missing:
+        refreshed = await refresh_archived_messages(bot_client, missing)
+        for key, chat_id, target_id, *_ in rows:
+            if archived[key] is None:
+                archived[key] = refreshed.get((chat_id, target_id))
+    return {key: item for key, item in archived.items() if item}
+
+
+async def send_with_fresh_references(bot_client, archived, send):
+    """
+    使用归档消息中的文件引用发送，文件引用过期时刷新后重试一次
+
+    :param archived: {键: ArchivedMessage}
+    :param send: 接收 {键: ArchivedMessage} 并完成发送的协程函数
+    """
+    try:
+        return await send(archived)
+    except (FileReferenceExpiredError, FileReferenceInvalidError):
+        log.info("归档消息的文件引用已失效，刷新后重试")
+        refreshed = await refresh_archived_messages(
+            bot_client, {(item.target_chat_id, item.target_message_id) for item in archived.values()})
+        return await send({key: refreshed[(item.target_chat_id, item.target_message_id)]
+                           for key, item in archived.items()
+                           if (item.target_chat_id, item.target_message_id) in refreshed})
+
+
+async def send_archived_single(event, archived, bot_client):
+    """把一条归档消息连同附加信息发送给用户"""
+    text, entities = append_add_info(archived.caption, archived.entities)
+    if archived.media:
+        await bot_client.send_file(event.chat_id, archived.media, caption=text, formatting_entities=entities,
+                                   parse_mode=None, buttons=archived.reply_markup, reply_to=event.message.id)
     else:
-        await bot_client.send_message(event.chat_id, message.text + addInfo, buttons=message.buttons,
-                                      reply_to=event.message.id)
+        await bot_client.send_message(event.chat_id, text, formatting_entities=entities, parse_mode=None,
+                                      buttons=archived.reply_markup, reply_to=event.message.id)
+
+
+async def send_archived_group(event, archived_messages, bot_client):
+    """把归档的媒体组连同附加信息发送给用户"""
+    media_messages = [item for item in archived_messages if item.media]
+    captions = [item.caption for item in media_messages]
+    entities = [list(item.entities) for item in media_messages]
+    # 有文档类型媒体时附加信息加在最后一个媒体上，否则加在第一个媒体上
+    has_document = any(isinstance(item.media, (InputDocument, MessageMediaDocument)) for item in media_messages)
+    index = -1 if has_document else 0
+    captions[index], entities[index] = append_add_info(captions[index], entities[index])
+    await bot_client.send_file(event.chat_id, [item.media for item in media_messages], caption=captions,
+                               formatting_entities=entities, parse_mode=None, reply_to=event.message.id)
+
+
+async def find_cached_media(messages, bot_client):
+    """按 document/photo id 查找已归档过的相同媒体，返回 {源消息ID: ArchivedMessage}"""
+    rows = []
+    for msg in messages:
+        key = get_media_key(msg)
+        if key:
+            cached = await find_media_cache(key[0], key[1], archive_ring.lookup_chat_ids)
+            if cached:
+                rows.append((msg.id, *cached))
+    if not rows:
+        return {}
+    return {source_id: item for source_id, item in (await load_archived_messages(bot_client, rows)).items()
+            if item.media}
+
+
+async def find_message_relation(source_chat_id, message_id):
+    """检查数据库中是否有该消息的转发记录"""
+    relation = await find_forwarded_message_for_one(source_chat_id, message_id, archive_ring.lookup_chat_ids)
+    if not relation:
+        relation = await find_forwarded_message(source_chat_id, message_id, archive_ring.lookup_chat_ids)
+    return relation
+
+
+async def single_forward_message(event, relation, bot_client):
+    # 如果有记录，直接使用保存的文件引用重新发送，无需再从归档频道获取消息
+    target_chat_id, target_message_id, _, *columns = relation
+    archived = await load_archived_messages(bot_client,
+                                            [(target_message_id, target_chat_id, target_message_id, *columns)])
+
+    async def send(items):
+        await send_archived_single(event, items[target_message_id], bot_client)
+
+    await send_with_fresh_references(bot_client, archived, send)
 
     # 处理转发次数并发送提示消息
     await process_forward_quota(event)
 
 
+async def copy_archived_group(event, target_chat_id, target_ids, bot_client):
+    """用一次 ForwardMessages 调用把归档的媒体组复制给用户（drop_author 隐藏来源），无需重新发送媒体"""
+    await bot_client(ForwardMessagesRequest(
+        from_peer=await bot_client.get_input_entity(PeerChannel(target_chat_id)),
+        id=sorted(target_ids),
+        to_peer=await event.get_input_chat(),
+        drop_author=True,
+        reply_to=InputReplyToMessage(event.message.id)
+    ))
+
+
 async def group_forward_message(event, grouped_messages, bot_client):
-    target_ids = [target_id for _, target_id in grouped_messages]
-    messages = await bot_client.get_messages(PeerChannel(PRIVATE_CHAT_ID), ids=target_ids)
-    media_files = [msg.media for msg in messages if msg.media]
-    # 检查媒体组中是否有文档类型的媒体
-    has_document = any(isinstance(msg.media, MessageMediaDocument) for msg in messages if msg.media)
-    if has_document:
-        media_captions = [msg.text if msg.text else "" for msg in messages]
-        media_captions[-1] = media_captions[-1] + addInfo  # 只在最后一个媒体添加caption和附加信息
-        await bot_client.send_file(event.chat_id, media_files, caption=media_captions, reply_to=event.message.id)
-    else:
-        caption = messages[0].text
-        # 按钮信息追加到原 caption 后面
-        await bot_client.send_file(event.chat_id, media_files, caption=caption + addInfo, reply_to=event.message.id)
+    if ALBUM_FORWARD_COPY:
+        try:
+            # 同一组的记录都在同一个归档频道中
+            await copy_archived_group(event, grouped_messages[0][1],
+                                      [target_id for _, _, target_id, *_ in grouped_messages], bot_client)
+        except RPCError as e:
+            log.warning(f"转发归档媒体组失败，改为重新发送: {e}")
+        else:
+            # 附加信息作为单独的文本消息回复
+            await bot_client.send_message(event.chat_id, addInfo, reply_to=event.message.id, link_preview=False)
+            # 处理转发次数并发送提示消息
+            await process_forward_quota(event)
+            return
+
+    rows = [(target_id, chat_id, target_id, *columns) for _, chat_id, target_id, *columns in grouped_messages]
+    archived = await load_archived_messages(bot_client, rows)
+
+    async def send(items):
+        await send_archived_group(event, [items[target_id] for target_id, *_ in rows if target_id in items],
+                                  bot_client)
+
+    await send_with_fresh_references(bot_client, archived, send)
     # 处理转发次数并发送提示消息
     await process_forward_quota(event)
 
 
 async def get_media_group_messages(initial_message, message_id, peer, client) -> list:
-    media_group = [initial_message]
-    grouped_id = initial_message.grouped_id
-    if not grouped_id:
-        # 如果初始消息没有 grouped_id，则返回初始消息本身
-        return media_group
-    # 获取前后10条消息的范围
-    start_id = max(1, message_id - RANGE)
-    end_id = message_id + RANGE
     try:
-        # 转换 range 为列表
-        ids = list(range(start_id, end_id + 1))
-        # 一次性获取指定范围内的消息
-        messages = await client.get_messages(peer, ids=ids)
-        # 按照 grouped_id 筛选属于同一组的消息
-        media_group = [msg for msg in messages if msg and msg.grouped_id == grouped_id]
+        # 从小范围开始按需扩大获取范围，同组消息的 ID 会被缓存
+        return await discover_media_group(client, peer, initial_message)
     except Exception as e:
         log.exception(f"Error: {e}")
-    return media_group
+        return [initial_message]
 
 
 async def user_handle_media_group(event: events.NewMessage.Event, message, media_group, source_chat_id, bot_client,
                                   user_client) -> None:
+    flight = None
     try:
         # 先检查数据库中是否有该消息组的转发记录
         if message.grouped_id:
-            grouped_messages = find_grouped_messages(source_chat_id, message.grouped_id, PRIVATE_CHAT_ID)
+            key = (source_chat_id, message.grouped_id, "group")
+            # 同一媒体组正在被其他请求转存时，等待其完成后直接使用归档结果
+            grouped_messages, flight = await archive_flight.lookup_or_claim(
+                key, lambda: find_grouped_messages(source_chat_id, message.grouped_id, archive_ring.lookup_chat_ids))
             if grouped_messages:
                 await group_forward_message(event, grouped_messages, bot_client)
                 return
+            # 由当前请求转存，其他相同的请求在此期间等待
+            # 同一源聊天的消息归档到同一个频道
+            archive_chat_id = archive_ring.chat_for(source_chat_id)
             # 发送提示消息
             status_message = await event.reply("转存中，请稍等...")
 
+            # 已归档过的相同媒体直接引用，无需下载和上传
+            cached_media = await find_cached_media(media_group, bot_client)
+
             # 构造相册的文件对象
-            album_files = await asyncio.gather(
-                *[prepare_album_file(msg, user_client, bot_client) for msg in media_group if msg.media])
+            uploaded_files = dict(zip(
+                [msg.id for msg in media_group if msg.media and msg.id not in cached_media],
+                await asyncio.gather(*[prepare_album_file(msg, user_client, bot_client) for msg in media_group
+                                       if msg.media and msg.id not in cached_media])))
 
             # 检查媒体组中是否有文档类型的媒体
             has_document = any(isinstance(msg.media, MessageMediaDocument) for msg in media_group if msg.media)
-            if has_document:
-                media_captions = [msg.text if msg.text else "" for msg in media_group]
-                sent_messages = await bot_client.send_file(PeerChannel(PRIVATE_CHAT_ID), file=album_files,
-                                                           caption=media_captions)
-            else:
+
+            async def send_to_archive(cached):
+                album_files = [cached[msg.id].media if msg.id in cached else uploaded_files[msg.id]
+                               for msg in media_group if msg.media]
+                if has_document:
+                    media_captions = [msg.text if msg.text else "" for msg in media_group]
+                    return await bot_client.send_file(PeerChannel(archive_chat_id), file=album_files,
+                                                      caption=media_captions)
                 captions = media_group[0].text
-                sent_messages = await bot_client.send_file(PeerChannel(PRIVATE_CHAT_ID), file=album_files,
-                                                           caption=captions)
+                return await bot_client.send_file(PeerChannel(archive_chat_id), file=album_files, caption=captions)
+
+            sent_messages = await send_with_fresh_references(bot_client, cached_media, send_to_archive)
             # 保存媒体组消息关系到数据库
-            save_media_group_relations(
+            await save_media_group_relations(
                 source_chat_id, media_group,
-                PRIVATE_CHAT_ID, sent_messages,
+                archive_chat_id, sent_messages,
                 message.grouped_id
             )
+            await save_media_group_cache([msg for msg in media_group if msg.media], archive_chat_id, sent_messages)
 
-            messages = await bot_client.get_messages(PeerChannel(PRIVATE_CHAT_ID), ids=sent_messages)
-            media_files = [msg.media for msg in messages if msg.media]
-
-            # 按钮信息追加到原 caption 后面，如果有文档类型媒体则使用列表形式的caption
-            if has_document:
-                media_captions = [msg.text if msg.text else "" for msg in messages]
-                media_captions[-1] = media_captions[-1] + addInfo  # 只在最后一个媒体添加caption和附加信息
-                await bot_client.send_file(event.chat_id, media_files, caption=media_captions,
-                                           reply_to=event.message.id)
-            else:
-                caption = messages[0].text
-                await bot_client.send_file(event.chat_id, media_files, caption=caption + addInfo,
-                                           reply_to=event.message.id)
+            # 刚归档的消息已带有媒体和文件引用，直接发送给用户，无需再从归档频道获取
+            await send_archived_group(event, [to_archived_message(msg, archive_chat_id) for msg in sent_messages],
+                                      bot_client)
 
             # 删除提示消息
             await status_message.delete()
@@ -259,23 +358,37 @@ async def user_handle_media_group(event: events.NewMessage.Event, message, media
         log.exception(f"Error: {e}")
         await event.reply("服务器内部错误，请联系管理员")
     finally:
-        # 清理其他资源（如果有的话）
-        pass
+        # 转存结束，唤醒等待同一条消息的请求
+        if flight:
+            archive_flight.release(key, flight)
 
 
 async def user_handle_single_message(event: events.NewMessage.Event, message, source_chat_id, bot_client,
                                      user_client) -> None:
+    flight = None
+    key = (source_chat_id, message.id, "single")
     try:
-        # 检查数据库中是否有该消息的转发记录
-        relation = find_forwarded_message_for_one(source_chat_id, message.id, PRIVATE_CHAT_ID)
-        if not relation:
-            relation = find_forwarded_message(source_chat_id, message.id, PRIVATE_CHAT_ID)
+        # 同一条消息正在被其他请求转存时，等待其完成后直接使用归档结果
+        relation, flight = await archive_flight.lookup_or_claim(
+            key, lambda: find_message_relation(source_chat_id, message.id))
         if relation:
             await single_forward_message(event, relation, bot_client)
             return
+        # 由当前请求转存，其他相同的请求在此期间等待
+        # 同一源聊天的消息归档到同一个频道
+        archive_chat_id = archive_ring.chat_for(source_chat_id)
         # 发送提示消息
         status_message = await event.reply("转存中，请稍等...")
-        if message.media:
+        # 相同媒体已归档过时直接引用，无需下载和上传
+        cached_media = await find_cached_media([message], bot_client)
+        if cached_media:
+            async def send_to_archive(cached):
+                return await bot_client.send_file(PeerChannel(archive_chat_id), cached[message.id].media,
+                                                  caption=message.text,
+                                                  buttons=message.buttons)
+
+            sent_message = await send_with_fresh_references(bot_client, cached_media, send_to_archive)
+        elif message.media:
             # 判断原始发送方式
             force_document = False
             if isinstance(message.media, MessageMediaDocument) and (
@@ -283,55 +396,67 @@ async def user_handle_single_message(event: events.NewMessage.Event, message, so
                     message.media.document.mime_type == 'video/mp4' and not message.media.video) or message.media.document.mime_type == 'image/heic'):
                 force_document = True
 
-            # 先下载文件
-            file_path = await message.download_media()
-            if isinstance(message.media, MessageMediaDocument) and (
-                    (
-                            message.media.document.mime_type == 'video/mp4' and message.media.document.size > 10 * 1024 * 1024) or message.media.document.mime_type == 'image/heic'):
-                # 下载缩略图
-                timestamp = int(time.time())
-                thumb_filename = f"{message.media.document.id}_{timestamp}_thumbnail.jpg"
-                thumb_path = await user_client.download_media(
-                    message,
-                    file=thumb_filename,
-                    thumb=-1  # -1 表示下载最高质量的缩略图
-                )
-                sent_message = await bot_client.send_file(PeerChannel(PRIVATE_CHAT_ID), file_path,
-                                                          caption=message.text,
-                                                          attributes=message.media.document.attributes,
-                                                          thumb=thumb_path,
-                                                          buttons=message.buttons,
-                                                          force_document=force_document)
-                await aiofiles.os.remove(thumb_path)  # 发送后删除缩略图
-            elif isinstance(message.media, MessageMediaDocument) and message.media.document.mime_type == 'audio/mpeg':
-                sent_message = await bot_client.send_file(PeerChannel(PRIVATE_CHAT_ID), file_path,
-                                                          caption=message.text,
-                                                          attributes=message.media.document.attributes,
-                                                          buttons=message.buttons,
-                                                          force_document=force_document)
-            else:
-                sent_message = await bot_client.send_file(PeerChannel(PRIVATE_CHAT_ID), file_path,
-                                                          caption=message.text, nosound_video=True,
-                                                          buttons=message.buttons,
-                                                          force_document=force_document)
-            await aiofiles.os.remove(file_path)  # 发送后删除文件
+            # 按文件大小申请传输额度，超出进程内传输上限时在此排队
+            async with transfer_budget.reserve(get_media_size(message)):
+                mime_type = None
+                if STREAM_TRANSFER and isinstance(message.media, MessageMediaDocument):
+                    # 流式转存，边下载边上传，得到的是已上传文件的句柄
+                    file_path = await stream_document(user_client, bot_client, message.media.document)
+                    mime_type = message.media.document.mime_type
+                elif isinstance(message.media, MessageMediaDocument):
+                    # 小文件在内存中转存，大文件经临时文件池并行下载和上传，得到已上传文件的句柄
+                    file_path = await transfer_message_media(user_client, bot_client, message,
+                                                             get_document_file_name(message.media.document))
+                    mime_type = message.media.document.mime_type
+                elif isinstance(message.media, MessageMediaPhoto):
+                    file_path = await transfer_message_media(user_client, bot_client, message, f"{message.id}.jpg")
+                else:
+                    # 其他类型的媒体直接下载到内存
+                    file_path = await message.download_media(file=bytes)
+                if isinstance(message.media, MessageMediaDocument) and (
+                        (
+                                message.media.document.mime_type == 'video/mp4' and message.media.document.size > 10 * 1024 * 1024) or message.media.document.mime_type == 'image/heic'):
+                    # 下载缩略图，缩略图很小，直接下载到内存
+                    thumb_path = await user_client.download_media(
+                        message,
+                        file=bytes,
+                        thumb=-1  # -1 表示下载最高质量的缩略图
+                    )
+                    sent_message = await bot_client.send_file(PeerChannel(archive_chat_id), file_path,
+                                                              caption=message.text,
+                                                              attributes=message.media.document.attributes,
+                                                              thumb=thumb_path,
+                                                              buttons=message.buttons,
+                                                              mime_type=mime_type,
+                                                              force_document=force_document)
+                elif isinstance(message.media, MessageMediaDocument) and message.media.document.mime_type == 'audio/mpeg':
+                    sent_message = await bot_client.send_file(PeerChannel(archive_chat_id), file_path,
+                                                              caption=message.text,
+                                                              attributes=message.media.document.attributes,
+                                                              buttons=message.buttons,
+                                                              mime_type=mime_type,
+                                                              force_document=force_document)
+                else:
+                    sent_message = await bot_client.send_file(PeerChannel(archive_chat_id), file_path,
+                                                              caption=message.text, nosound_video=True,
+                                                              buttons=message.buttons,
+                                                              mime_type=mime_type,
+                                                              force_document=force_document)
         else:
-            sent_message = await bot_client.send_message(PeerChannel(PRIVATE_CHAT_ID), message.text,
+            sent_message = await bot_client.send_message(PeerChannel(archive_chat_id), message.text,
                                                          buttons=message.buttons)
         # 保存消息关系到数据库
-        save_message_relation(
+        await save_message_relation(
             source_chat_id, message.id,
-            PRIVATE_CHAT_ID, sent_message.id,
-            0
+            archive_chat_id, sent_message.id,
+            0,
+            archived_message=sent_message
         )
-        message = await bot_client.get_messages(PeerChannel(PRIVATE_CHAT_ID), ids=sent_message)
-        if message.media:
-            await bot_client.send_file(event.chat_id, message.media, caption=message.text + addInfo,
-                                       buttons=message.buttons,
-                                       reply_to=event.message.id)
-        else:
-            await bot_client.send_message(event.chat_id, message.text + addInfo, buttons=message.buttons,
-                                          reply_to=event.message.id)
+        media_key = get_media_key(message)
+        if media_key:
+            await save_media_cache(media_key[0], media_key[1], archive_chat_id, sent_message.id)
+        # 刚归档的消息已带有媒体和文件引用，直接发送给用户，无需再从归档频道获取
+        await send_archived_single(event, to_archived_message(sent_message, archive_chat_id), bot_client)
 
         # 删除提示消息
         await status_message.delete()
@@ -342,30 +467,50 @@ async def user_handle_single_message(event: events.NewMessage.Event, message, so
         log.exception(f"Error: {e}")
         await event.reply("服务器内部错误，请联系管理员")
     finally:
-        # 清理其他资源（如果有的话）
-        pass
+        # 转存结束，唤醒等待同一条消息的请求
+        if flight:
+            archive_flight.release(key, flight)
 
 
 async def bot_handle_media_group(event: events.NewMessage.Event, message, media_group, source_chat_id,
                                  bot_client) -> None:
+    flight = None
     try:
         # 检查数据库中是否有该消息组的转发记录
         if message.grouped_id:
-            grouped_messages = find_grouped_messages(source_chat_id, message.grouped_id, PRIVATE_CHAT_ID)
+            key = (source_chat_id, message.grouped_id, "group")
+            # 同一媒体组正在被其他请求转存时，等待其完成后直接使用归档结果
+            grouped_messages, flight = await archive_flight.lookup_or_claim(
+                key, lambda: find_grouped_messages(source_chat_id, message.grouped_id, archive_ring.lookup_chat_ids))
             if grouped_messages:
                 await group_forward_message(event, grouped_messages, bot_client)
                 return
-            media_files = [msg.media for msg in media_group if msg.media]
+            # 由当前请求转存，其他相同的请求在此期间等待
+            # 同一源聊天的消息归档到同一个频道
+            archive_chat_id = archive_ring.chat_for(source_chat_id)
+            # 已归档过的相同媒体优先引用归档中的副本，文件引用过期时刷新后重试
+            cached_media = await find_cached_media(media_group, bot_client)
             caption = media_group[0].text
-            sent_messages = await bot_client.send_file(PeerChannel(PRIVATE_CHAT_ID), media_files,
-                                                       caption=caption)
-            await bot_client.send_file(event.chat_id, media_files, caption=caption + addInfo, reply_to=event.message.id)
+
+            def media_files(cached):
+                return [cached[msg.id].media if msg.id in cached else msg.media for msg in media_group if msg.media]
+
+            async def send_to_archive(cached):
+                return await bot_client.send_file(PeerChannel(archive_chat_id), media_files(cached), caption=caption)
+
+            async def send_to_user(cached):
+                await bot_client.send_file(event.chat_id, media_files(cached), caption=caption + addInfo,
+                                           reply_to=event.message.id)
+
+            sent_messages = await send_with_fresh_references(bot_client, cached_media, send_to_archive)
+            await send_with_fresh_references(bot_client, cached_media, send_to_user)
             # 保存媒体组消息关系到数据库
-            save_media_group_relations(
+            await save_media_group_relations(
                 source_chat_id, media_group,
-                PRIVATE_CHAT_ID, sent_messages,
+                archive_chat_id, sent_messages,
                 message.grouped_id
             )
+            await save_media_group_cache([msg for msg in media_group if msg.media], archive_chat_id, sent_messages)
             # 处理转发次数并发送提示消息
             await process_forward_quota(event)
         else:
@@ -374,35 +519,55 @@ async def bot_handle_media_group(event: events.NewMessage.Event, message, media_
         log.exception(f"Error: {e}")
         await event.reply("服务器内部错误，请联系管理员")
     finally:
-        # 清理其他资源（如果有的话）
-        pass
+        # 转存结束，唤醒等待同一条消息的请求
+        if flight:
+            archive_flight.release(key, flight)
 
 
 async def bot_handle_single_message(event: events.NewMessage.Event, message, source_chat_id, bot_client) -> None:
+    flight = None
+    key = (source_chat_id, message.id, "single")
     try:
-        # 检查数据库中是否有该消息的转发记录
-        relation = find_forwarded_message_for_one(source_chat_id, message.id, PRIVATE_CHAT_ID)
-        if not relation:
-            relation = find_forwarded_message(source_chat_id, message.id, PRIVATE_CHAT_ID)
+        # 同一条消息正在被其他请求转存时，等待其完成后直接使用归档结果
+        relation, flight = await archive_flight.lookup_or_claim(
+            key, lambda: find_message_relation(source_chat_id, message.id))
         if relation:
             await single_forward_message(event, relation, bot_client)
             return
+        # 由当前请求转存，其他相同的请求在此期间等待
+        # 同一源聊天的消息归档到同一个频道
+        archive_chat_id = archive_ring.chat_for(source_chat_id)
         if message.media:
-            sent_message = await bot_client.send_file(PeerChannel(PRIVATE_CHAT_ID), message.media,
-                                                      buttons=message.buttons,
-                                                      caption=message.text)
-            await bot_client.send_file(event.chat_id, message.media, caption=message.text + addInfo,
-                                       buttons=message.buttons,
-                                       reply_to=event.message.id)
+            # 已归档过的相同媒体优先引用归档中的副本，文件引用过期时刷新后重试
+            cached_media = await find_cached_media([message], bot_client)
+
+            async def send_to_archive(cached):
+                media = cached[message.id].media if message.id in cached else message.media
+                return await bot_client.send_file(PeerChannel(archive_chat_id), media,
+                                                  buttons=message.buttons,
+                                                  caption=message.text)
+
+            async def send_to_user(cached):
+                media = cached[message.id].media if message.id in cached else message.media
+                await bot_client.send_file(event.chat_id, media, caption=message.text + addInfo,
+                                           buttons=message.buttons,
+                                           reply_to=event.message.id)
+
+            sent_message = await send_with_fresh_references(bot_client, cached_media, send_to_archive)
+            await send_with_fresh_references(bot_client, cached_media, send_to_user)
         else:
-            sent_message = await bot_client.send_message(PeerChannel(PRIVATE_CHAT_ID), message.text)
+            sent_message = await bot_client.send_message(PeerChannel(archive_chat_id), message.text)
             await bot_client.send_message(event.chat_id, message.text + addInfo, reply_to=event.message.id)
         # 保存消息关系到数据库
-        save_message_relation(
+        await save_message_relation(
             source_chat_id, message.id,
-            PRIVATE_CHAT_ID, sent_message.id,
-            0
+            archive_chat_id, sent_message.id,
+            0,
+            archived_message=sent_message
         )
+        media_key = get_media_key(message)
+        if media_key:
+            await save_media_cache(media_key[0], media_key[1], archive_chat_id, sent_message.id)
 
         # 处理转发次数并发送提示消息
         await process_forward_quota(event)
@@ -410,11 +575,12 @@ async def bot_handle_single_message(event: events.NewMessage.Event, message, sou
         log.exception(f"Error: {e}")
         await event.reply("服务器内部错误，请联系管理员")
     finally:
-        # 清理其他资源（如果有的话）
-        pass
+        # 转存结束，唤醒等待同一条消息的请求
+        if flight:
+            archive_flight.release(key, flight)
 
 
-async def on_new_link(event: events.NewMessage.Event, bot_client, user_client, system_overloaded=False,
+async def on_new_link(event: events.NewMessage.Event, bot_client, user_pool, system_overloaded=False,
                       bot_token=None) -> None:
     """处理新的链接消息"""
     text = event.text
@@ -426,7 +592,8 @@ async def on_new_link(event: events.NewMessage.Event, bot_client, user_client, s
         try:
             # 提取邀请链接哈希部分
             invite_hash = text.split("/")[-1].replace("+", "")
-            await user_client(ImportChatInviteRequest(invite_hash))
+            # 由加入聊天最少的账号加入，之后该聊天的请求交给这个账号处理
+            await user_pool.join(invite_hash)
             await event.reply("已成功加入该群组/频道！现在请发送你需要转发的消息链接。")
             return
         except InviteHashInvalidError:
@@ -470,63 +637,134 @@ async def on_new_link(event: events.NewMessage.Event, bot_client, user_client, s
         return
 
     user_id = event.sender_id
-    # 检查用户是否已经有正在处理的请求
-    if user_id not in USER_LOCKS:
-        USER_LOCKS[user_id] = asyncio.Lock()
-
-    # 检查锁是否已被占用
-    if USER_LOCKS[user_id].locked():
-        await event.reply("您有一个正在处理的转发请求，请等待完成后再发送新的请求。")
-        return
-
     # 检查用户转发次数
-    free_quota, paid_quota, _ = get_user_quota(user_id)
+    free_quota, paid_quota, _ = await get_user_quota(user_id)
     total_quota = free_quota + paid_quota
 
     if total_quota <= 0:
         await event.reply("您今日的转发次数已用完！每天0点重置免费次数，或通过支付购买更多次数。")
         return
+    # 多进程模式下交给媒体工作进程处理，否则在本进程的工作协程中处理
+    queue = link_job_queue if link_job_queue.enabled else job_queue
+    # 排队中的请求也会消耗次数，不能超过剩余次数
+    if queue is link_job_queue:
+        pending = await link_job_queue.pending(user_id)
+    else:
+        pending = job_queue.pending(user_id)
+    if pending >= total_quota:
+        await event.reply("您排队中的请求已占用全部剩余次数，请等待完成后再发送新的请求。")
+        return
+
+    # 加入任务队列，付费用户优先处理
+    priority = PRIORITY_PAID if paid_quota > 0 else PRIORITY_FREE
+    try:
+        if queue is link_job_queue:
+            position = await link_job_queue.submit(user_id, priority, await link_job_payload(event, text))
+        else:
+            position = job_queue.submit(user_id, priority,
+                                        lambda: process_link(event, text, bot_client, user_pool, bot_token))
+    except UserJobLimitError:
+        await event.reply(f"您已有 {queue.per_user_limit} 个请求在排队，请等待完成后再发送新的请求。")
+        return
+    except QueueFullError:
+        await event.reply("系统繁忙，请稍后再试...")
+        return
+    if position:
+        await event.reply(f"已加入转发队列，当前排在第 {position} 位，请稍等...")
+
+
+async def link_job_payload(event: events.NewMessage.Event, text):
+    """链接请求转换为可写入任务表的内容，媒体工作进程用 QueuedEvent 还原"""
+    return {
+        "text": text,
+        "sender_id": event.sender_id,
+        "chat_id": event.chat_id,
+        "message_id": event.message.id,
+        # 工作进程的会话中不一定有该用户的 access_hash，直接传递 InputPeer
+        "input_chat": bytes(await event.get_input_chat()).hex()
+    }
+
+
+class QueuedEvent:
+    """
+    媒体工作进程中代替 NewMessage 事件
+
+    只提供链接处理流程用到的属性和方法，回复通过工作进程自己的机器人连接发送。
+    chat_id 为入口进程传来的 InputPeer，可以直接作为发送目标。
+    """
+
+    def __init__(self, bot_client, payload):
+        self.client = bot_client
+        self.text = payload["text"]
+        self.sender_id = payload["sender_id"]
+        with BinaryReader(bytes.fromhex(payload["input_chat"])) as reader:
+            self.chat_id = reader.tgread_object()
+        self.message = SimpleNamespace(id=payload["message_id"])
+
+    async def get_input_chat(self):
+        return self.chat_id
+
+    async def reply(self, *args, **kwargs):
+        return await self.client.send_message(self.chat_id, *args, reply_to=self.message.id, **kwargs)
 
-    # 获取用户锁
-    async with USER_LOCKS[user_id]:
+
+async def process_link(event: events.NewMessage.Event, text, bot_client, user_pool, bot_token) -> None:
+    """在任务队列中处理链接，选择已加入源聊天且最空闲的用户账号执行转存"""
+    try:
+        chat_id, _ = await parse_url(text.split('?')[0])
+    except ValueError:
+        chat_id = None
+    async with user_pool.acquire(chat_id) as user_client:
+        await forward_link(event, text, bot_client, user_client, bot_token)
+
+
+async def forward_link(event: events.NewMessage.Event, text, bot_client, user_client, bot_token) -> None:
+    """用指定的用户账号处理链接，转存消息并发送给用户"""
+    try:
+        # 开始处理消息转发逻辑
+        query = urllib.parse.urlparse(text).query
+        params = dict(urllib.parse.parse_qsl(query))
         try:
-            # 开始处理消息转发逻辑
-            query = urllib.parse.urlparse(text).query
-            params = dict(urllib.parse.parse_qsl(query))
-            try:
-                chat_id, message_id = await parse_url(text.split('?')[0])
-            except ValueError:
-                await event.reply("无效链接")
-                return
+            chat_id, message_id = await parse_url(text.split('?')[0])
+        except ValueError:
+            await event.reply("无效链接")
+            return
 
-            source_chat_id = chat_id
-            is_single = 'single' in text
-            is_digit = chat_id.isdigit()
+        source_chat_id = chat_id
+        is_single = 'single' in text
+        is_digit = chat_id.isdigit()
 
-            url = f"https://api.telegram.org/bot{bot_token}/getChat"
-            if is_digit:  # 私有频道和私有群组
-                peer = PeerChannel(int(chat_id))
-                is_thread = 'thread' in params
-                try:
-                    # 获取指定聊天中的消息
-                    message = await user_client.get_messages(peer, ids=message_id)
-                except ValueError as e:
-                    if is_thread:
-                        await event.reply("请先发送频道里任意一条消息的链接，再发送评论区消息的链接")
-                    else:
-                        await event.reply("私人频道/私人群组，请先发送入群邀请链接，然后再发送消息链接。")
-                    return
-                except ChannelPrivateError as e:
-                    await event.reply("此群组/频道无法访问，或你已被拉黑(踢了)")
-                    return
-                except Exception as e:
-                    log.exception(f"Error: {e}")
-                    await event.reply("服务器内部错误，请联系管理员")
-                    return
+        if is_digit:  # 私有频道和私有群组
+            peer = PeerChannel(int(chat_id))
+            is_thread = 'thread' in params
+            try:
+                # 获取指定聊天中的消息
+                message = await user_client.get_messages(peer, ids=message_id)
+            except ValueError as e:
+                if is_thread:
+                    await event.reply("请先发送频道里任意一条消息的链接，再发送评论区消息的链接")
+                else:
+                    await event.reply("私人频道/私人群组，请先发送入群邀请链接，然后再发送消息链接。")
+                return
+            except ChannelPrivateError as e:
+                await event.reply("此群组/频道无法访问，或你已被拉黑(踢了)")
+                return
+            except Exception as e:
+                log.exception(f"Error: {e}")
+                await event.reply("服务器内部错误，请联系管理员")
+                return
 
-                entity = await user_client.get_entity(peer)
-                from telethon.tl.types import Channel
-                if isinstance(entity, Channel) and not entity.megagroup:  # 频道
+            entity = await user_client.get_entity(peer)
+            from telethon.tl.types import Channel
+            if isinstance(entity, Channel) and not entity.megagroup:  # 频道
+                if is_single:
+                    await user_handle_single_message(event, message, source_chat_id, bot_client, user_client)
+                else:
+                    media_group = await get_media_group_messages(message, message_id, peer, user_client)
+                    await user_handle_media_group(event, message, media_group, source_chat_id, bot_client,
+                                                  user_client)
+            else:
+                if is_thread:  # 评论消息
                     if is_single:
                         await user_handle_single_message(event, message, source_chat_id, bot_client, user_client)
                     else:
@@ -534,131 +772,115 @@ async def on_new_link(event: events.NewMessage.Event, bot_client, user_client, s
                         await user_handle_media_group(event, message, media_group, source_chat_id, bot_client,
                                                       user_client)
                 else:
-                    if is_thread:  # 评论消息
-                        if is_single:
-                            await user_handle_single_message(event, message, source_chat_id, bot_client, user_client)
-                        else:
-                            media_group = await get_media_group_messages(message, message_id, peer, user_client)
-                            await user_handle_media_group(event, message, media_group, source_chat_id, bot_client,
-                                                          user_client)
-                    else:
-                        result = await replace_message(message, bot_token)
-                        if result:
-                            peer, message_id = result
-                            message = await bot_client.get_messages(peer, ids=message_id)
-                            if is_single:
-                                await bot_handle_single_message(event, message, source_chat_id, bot_client)
-                            else:
-                                media_group = await get_media_group_messages(message, message_id, peer, bot_client)
-                                await bot_handle_media_group(event, message, media_group, source_chat_id, bot_client)
-                        else:
-                            if is_single:
-                                await user_handle_single_message(event, message, source_chat_id, bot_client,
-                                                                 user_client)
-                            else:
-                                media_group = await get_media_group_messages(message, message_id, peer, user_client)
-                                await user_handle_media_group(event, message, media_group, source_chat_id, bot_client,
-                                                              user_client)
-
-            else:  # 公开频道和公开群组
-                peer = chat_id
-                req_params = {"chat_id": f"@{chat_id}"}
-
-                # 获取代理设置
-                proxy = get_proxy(proxy_format="url")
-
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(url, params=req_params, proxy=proxy) as response:
-                        if response.status == 200:
-                            result = await response.json()
-                            if result and result.get("ok"):
-                                channel = result.get("result")
-                                has_protected_content = channel.get("has_protected_content", False)
-                                peer_type = channel.get("type")
-                        else:
-                            await event.reply("服务器内部错误，请联系管理员")
-                            return
-
-                is_channel = peer_type == "channel"
-                if is_channel:  # 公开频道
-                    try:
-                        # 获取指定聊天中的消息
-                        message = await bot_client.get_messages(peer, ids=message_id)
-                    except Exception as e:
-                        log.exception(f"Error: {e}")
-                        await event.reply("服务器内部错误，请联系管理员")
-                        return
-
-                    is_comment = 'comment' in params
-                    if is_comment:
-                        comment_id = int(params.get('comment'))
-                        # 获取频道实体
-                        channel = await user_client.get_entity(chat_id)
-                        comment_message, comment_grouped_id = await get_comment_message(
-                            user_client, channel, message_id, comment_id
-                        )
-                        # 1、有评论-单个
-                        if is_single:
-                            await user_handle_single_message(event, comment_message, source_chat_id, bot_client,
-                                                             user_client)
-                        # 2、有评论-多个
-                        else:
-                            # 获取属于同一组的所有消息
-                            comment_media_group = []
-                            async for reply in user_client.iter_messages(
-                                    entity=channel,
-                                    reply_to=message_id
-                            ):
-                                if reply.grouped_id == comment_grouped_id:
-                                    comment_media_group.append(reply)
-                            # 反转列表
-                            comment_media_group.reverse()
-                            await user_handle_media_group(event, comment_message, comment_media_group, source_chat_id,
-                                                          bot_client, user_client)
-                    else:
-                        if not has_protected_content:
-                            await event.reply("此消息允许转发！无需使用本机器人")
-                            return
-                        # 3、无评论-单个
-                        if is_single:
-                            await bot_handle_single_message(event, message, source_chat_id, bot_client)
-                        # 4、无评论-多个
-                        else:
-                            media_group = await get_media_group_messages(message, message_id, peer, bot_client)
-                            await bot_handle_media_group(event, message, media_group, source_chat_id, bot_client)
-                else:  # 公开群组
-                    if not has_protected_content:
-                        await event.reply("此消息允许转发！无需使用本机器人")
-                        return
-                    try:
-                        # 获取指定聊天中的消息
-                        message = await user_client.get_messages(peer, ids=message_id)
-                    except Exception as e:
-                        log.exception(f"Error: {e}")
-                        await event.reply("服务器内部错误，请联系管理员")
-                        return
-
                     result = await replace_message(message, bot_token)
                     if result:
-                        peer, message_id = result
-                        message = await bot_client.get_messages(peer, ids=message_id)
-                        # 5、有替代-单个
+                        username, message_id = result
+                        peer, message = await call_with_peer(
+                            bot_client, username, lambda p: bot_client.get_messages(p, ids=message_id))
                         if is_single:
                             await bot_handle_single_message(event, message, source_chat_id, bot_client)
-                        # 6、有替代-多个
                         else:
                             media_group = await get_media_group_messages(message, message_id, peer, bot_client)
                             await bot_handle_media_group(event, message, media_group, source_chat_id, bot_client)
                     else:
-                        # 7、无替代-单个
                         if is_single:
-                            await user_handle_single_message(event, message, source_chat_id, bot_client, user_client)
-                        # 8、无替代-多个
+                            await user_handle_single_message(event, message, source_chat_id, bot_client,
+                                                             user_client)
                         else:
                             media_group = await get_media_group_messages(message, message_id, peer, user_client)
                             await user_handle_media_group(event, message, media_group, source_chat_id, bot_client,
                                                           user_client)
 
-        except Exception as e:
-            log.exception(f"处理消息时发生错误: {e}")
-            await event.reply("服务器内部错误，请联系管理员")
+        else:  # 公开频道和公开群组
+            peer = chat_id
+
+            # 频道信息几乎不变，通过缓存查询
+            channel = await get_chat(bot_token, f"@{chat_id}", client=bot_client)
+            if not channel:
+                await event.reply("服务器内部错误，请联系管理员")
+                return
+            has_protected_content = channel.get("has_protected_content", False)
+            peer_type = channel.get("type")
+
+            is_channel = peer_type == "channel"
+            if is_channel:  # 公开频道
+                try:
+                    # 用户名先查询解析缓存，避免频繁调用 contacts.ResolveUsername
+                    # 获取指定聊天中的消息，保存的解析结果失效时重新解析
+                    peer, message = await call_with_peer(
+                        bot_client, chat_id, lambda p: bot_client.get_messages(p, ids=message_id))
+                except Exception as e:
+                    log.exception(f"Error: {e}")
+                    await event.reply("服务器内部错误，请联系管理员")
+                    return
+
+                is_comment = 'comment' in params
+                if is_comment:
+                    comment_id = int(params.get('comment'))
+                    # 通过频道关联的讨论组直接获取评论
+                    _, (comment_message, comment_grouped_id) = await call_with_peer(
+                        user_client, chat_id, lambda p: get_comment_message(user_client, p, message_id, comment_id))
+                    # 1、有评论-单个
+                    if is_single:
+                        await user_handle_single_message(event, comment_message, source_chat_id, bot_client,
+                                                         user_client)
+                    # 2、有评论-多个
+                    else:
+                        # 获取属于同一组的所有消息
+                        comment_media_group = await get_comment_media_group(user_client, comment_message)
+                        await user_handle_media_group(event, comment_message, comment_media_group, source_chat_id,
+                                                      bot_client, user_client)
+                else:
+                    if not has_protected_content:
+                        await event.reply("此消息允许转发！无需使用本机器人")
+                        return
+                    # 3、无评论-单个
+                    if is_single:
+                        await bot_handle_single_message(event, message, source_chat_id, bot_client)
+                    # 4、无评论-多个
+                    else:
+                        media_group = await get_media_group_messages(message, message_id, peer, bot_client)
+                        await bot_handle_media_group(event, message, media_group, source_chat_id, bot_client)
+            else:  # 公开群组
+                if not has_protected_content:
+                    await event.reply("此消息允许转发！无需使用本机器人")
+                    return
+                try:
+                    # 用户名先查询解析缓存，避免频繁调用 contacts.ResolveUsername
+                    # 获取指定聊天中的消息，保存的解析结果失效时重新解析
+                    peer, message = await call_with_peer(
+                        user_client, chat_id, lambda p: user_client.get_messages(p, ids=message_id))
+                except Exception as e:
+                    log.exception(f"Error: {e}")
+                    await event.reply("服务器内部错误，请联系管理员")
+                    return
+
+                result = await replace_message(message, bot_token)
+                if result:
+                    username, message_id = result
+                    peer, message = await call_with_peer(
+                        bot_client, username, lambda p: bot_client.get_messages(p, ids=message_id))
+                    # 5、有替代-单个
+                    if is_single:
+                        await bot_handle_single_message(event, message, source_chat_id, bot_client)
+                    # 6、有替代-多个
+                    else:
+                        media_group = await get_media_group_messages(message, message_id, peer, bot_client)
+                        await bot_handle_media_group(event, message, media_group, source_chat_id, bot_client)
+                else:
+                    # 7、无替代-单个
+                    if is_single:
+                        await user_handle_single_message(event, message, source_chat_id, bot_client, user_client)
+                    # 8、无替代-多个
+                    else:
+                        media_group = await get_media_group_messages(message, message_id, peer, user_client)
+                        await user_handle_media_group(event, message, media_group, source_chat_id, bot_client,
+                                                      user_client)
+
+    except FloodWaitError as e:
+        # 超过限流器最长等待时间的 FloodWait
+        log.warning(f"处理消息时触发 FloodWait: {e.seconds} 秒")
+        await event.reply(f"请求过于频繁，请 {e.seconds} 秒后再试")
+    except Exception as e:
+        log.exception(f"处理消息时发生错误: {e}")
+        await event.reply("服务器内部错误，请联系管理员")
@@ -4,8 +4,8 @@ from telethon.tl.custom import Button
 
 # 获取全局变量
 from config import USDT_WALLET
-from db import (
-    get_db_connection, get_user_quota, process_invite,
+from db.aio import (
+    get_user_quota, process_invite, get_inviter_id,
     get_user_invite_code, get_invite_stats,
     get_order_by_id
 )
@@ -20,13 +20,10 @@ async def cmd_start(event, bot_client):
     args = event.text.split()
     if len(args) > 1:
         invite_code = args[1].upper()
-        success, message = process_invite(invite_code, event.sender_id)
+        success, message = await process_invite(invite_code, event.sender_id)
         if success:
             # 获取邀请人信息
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT inviter_id FROM invite_relations WHERE invite_code = ?', (invite_code,))
-                inviter_id = cursor.fetchone()[0]
+            inviter_id = await get_inviter_id(invite_code)
 
             # 通知邀请人
             try:
@@ -85,7 +82,7 @@ async def cmd_start(event, bot_client):
 async def cmd_user(event):
     """处理 /user 命令，显示用户中心信息"""
     user_id = event.sender_id
-    free_quota, paid_quota, last_reset_date = get_user_quota(user_id)
+    free_quota, paid_quota, last_reset_date = await get_user_quota(user_id)
     total_quota = free_quota + paid_quota
 
     # 获取用户名
@@ -135,7 +132,7 @@ async def cmd_check(event):
         return
 
     order_id = text[1]
-    order = get_order_by_id(order_id)
+    order = await get_order_by_id(order_id)
 
     if order:
         # 假设order是tuple(order_id, user_id, package_name, amount, quota_amount, status, payment_address, tx_hash, memo, last_checked, created_at, updated_at, completed_at)
@@ -182,8 +179,8 @@ async def cmd_check(event):
 async def cmd_invite(event, bot_client):
     """处理 /invite 命令，显示邀请信息"""
     user_id = event.sender_id
-    invite_code = get_user_invite_code(user_id)
-    invite_count, reward_count = get_invite_stats(user_id)
+    invite_code = await get_user_invite_code(user_id)
+    invite_count, reward_count = await get_invite_stats(user_id)
 
     # 获取机器人信息
     bot_info = await bot_client.get_me()
@@ -8,36 +8,43 @@ import logging
 from multiprocessing import Value
 import functools
 
-from telethon import TelegramClient
 from telethon.events import NewMessage, CallbackQuery
-from telethon.sessions import StringSession
 
 from config import (
-    API_ID, API_HASH, BOT_SESSION, USER_SESSION, BOT_TOKEN,
+    API_ID, API_HASH, BOT_SESSION, USER_SESSIONS, BOT_TOKEN,
     is_authorized,
-    CPU_THRESHOLD, MEMORY_THRESHOLD, DISK_IO_THRESHOLD,
-    MONITOR_INTERVAL, TRANSACTION_CHECK_INTERVAL, TRONGRID_API_KEY, USDT_CONTRACT,
-    get_proxy
+    CPU_THRESHOLD, MEMORY_THRESHOLD, DISK_IO_THRESHOLD, SPOOL_THRESHOLD,
+    MONITOR_INTERVAL, TRANSACTION_CHECK_INTERVAL, TRANSFER_JOURNAL_TTL, TRONGRID_API_KEY, USDT_CONTRACT,
+    get_proxy, check_bot_config
 )
 # 导入数据库模块
 from db import (
-    init_db
+    init_db, purge_transfer_journal
 )
+from db.aio import close_db
 from handlers import (
     cmd_start, cmd_user, cmd_buy, cmd_check, cmd_invite, callback_handler, on_new_link
 )
 from services import (
-    schedule_transaction_checker, schedule_quota_reset, start_system_monitor
+    schedule_transaction_checker, schedule_quota_reset, schedule_cache_stats, start_system_monitor, spool, http_client,
+    open_session, job_queue, link_job_queue, RateLimitedClient, UserClientPool
 )
 
 log = logging.getLogger("TelethonSnippets")
 
+# 缺少必需的环境变量时退出
+check_bot_config()
+
 # 创建共享的系统过载状态变量
 system_overloaded_ref = Value('b', False)  # 'b' 表示布尔值
 
 # 初始化数据库
 init_db()
 
+# 清理上次运行遗留的临时文件和过期的传输记录，保留仍可续传的部分
+purge_transfer_journal(TRANSFER_JOURNAL_TTL)
+spool.sweep()
+
 # 定义鉴权装饰器
 def requires_auth(func):
     """
@@ -53,8 +60,16 @@ def requires_auth(func):
 # 获取代理设置
 proxy_settings = get_proxy()
 
-bot_client = TelegramClient(StringSession(BOT_SESSION), API_ID, API_HASH, proxy=proxy_settings)
-user_client = TelegramClient(StringSession(USER_SESSION), API_ID, API_HASH, proxy=proxy_settings)
+# 会话保存在文件中，重启后不需要重新解析实体；请求经过限流，FloodWait 时对应的请求排队等待而不是失败
+bot_client = RateLimitedClient(open_session(BOT_SESSION, "bot_client"), API_ID, API_HASH, proxy=proxy_settings)
+# 第一个用户账号沿用原来的会话文件名，其余账号按序号区分
+user_clients = [
+    RateLimitedClient(open_session(session, "user_client" if i == 0 else f"user_client_{i}"), API_ID, API_HASH,
+                      proxy=proxy_settings)
+    for i, session in enumerate(USER_SESSIONS)
+]
+# 下载任务按源聊天分配给已加入该聊天且最空闲的账号
+user_pool = UserClientPool(user_clients)
 
 
 # 注册命令处理器
@@ -100,7 +115,7 @@ async def callback_query_handler(event):
 @requires_auth
 async def message_handler(event):
     # 调用链接处理函数
-    await on_new_link(event, bot_client, user_client, system_overloaded=system_overloaded_ref.value,
+    await on_new_link(event, bot_client, user_pool, system_overloaded=system_overloaded_ref.value,
                       bot_token=BOT_TOKEN)
 
 
@@ -109,15 +124,26 @@ async def main():
     # 客户端初始化
     log.info("启动机器人")
     await bot_client.connect()
-    await user_client.connect()
+    for user_client in user_clients:
+        await user_client.connect()
+
+    # 创建共享的HTTP会话
+    await http_client.start()
+
+    # 启动处理链接请求的工作协程；多进程模式下启动媒体工作进程，本进程只接收消息和排队
+    if link_job_queue.enabled:
+        await link_job_queue.start(bot_client)
+    else:
+        job_queue.start()
 
     # 获取机器人的用户信息
     ubot_self = await bot_client.get_me()
     log.info("机器人已启动为 %s", ubot_self.username or ubot_self.id)
 
-    # 获取 user_client 的用户信息
-    u_user = await user_client.get_me()
-    log.info("用户客户端已启动为 %s", u_user.username or u_user.id)
+    # 获取每个用户账号的用户信息
+    for i, user_client in enumerate(user_clients):
+        u_user = await user_client.get_me()
+        log.info("用户客户端 %d 已启动为 %s", i, u_user.username or u_user.id)
 
     # 启动定时重置任务
     asyncio.create_task(schedule_quota_reset())
@@ -131,18 +157,30 @@ async def main():
     ))
     log.info(f"已启动自动检查交易状态的定时任务，间隔 {TRANSACTION_CHECK_INTERVAL} 秒")
 
+    # 启动缓存命中率记录任务
+    asyncio.create_task(schedule_cache_stats())
+
     # 启动系统资源监控线程
     start_system_monitor(
         cpu_threshold=CPU_THRESHOLD,
         memory_threshold=MEMORY_THRESHOLD,
         disk_io_threshold=DISK_IO_THRESHOLD,
         monitor_interval=MONITOR_INTERVAL,
-        system_overloaded_var=system_overloaded_ref
+        system_overloaded_var=system_overloaded_ref,
+        spool_threshold=SPOOL_THRESHOLD
     )
 
-    # 启动并等待两个客户端断开连接
-    await bot_client.run_until_disconnected()  # 运行 BOT_SESSION
-    await user_client.run_until_disconnected()  # 运行 USER_SESSION
+    try:
+        # 启动并等待所有客户端断开连接
+        await bot_client.run_until_disconnected()  # 运行 BOT_SESSION
+        for user_client in user_clients:
+            await user_client.run_until_disconnected()  # 运行 USER_SESSIONS
+    finally:
+        # 停止工作协程和工作进程，关闭共享的HTTP会话
+        await job_queue.stop()
+        await link_job_queue.stop()
+        await http_client.close()
+        close_db()
 
 
 # 7. 程序入口
@@ -1,14 +1,15 @@
 import logging
 import urllib.parse
 
-import aiohttp
 from decouple import config
 from telethon import TelegramClient, events
 from telethon.sessions import StringSession
 
 from config import (
-    BOT_TOKEN, RANGE
+    BOT_TOKEN
 )
+from db import init_db
+from services import http_client, get_chat, call_with_peer, discover_media_group
 
 # 初始化日志记录器
 logging.basicConfig(
@@ -22,8 +23,6 @@ API_HASH = config("API_HASH", default=None)
 SESSION = config("BOT_SESSION", default=None)
 BOT_TOKEN = config("BOT_TOKEN", default=None)
 AUTHS = config("AUTHS", default="")
-# 消息范围±10
-RANGE = 10
 
 # 代理设置
 USE_PROXY = config("USE_PROXY", default=False, cast=bool)
@@ -84,8 +83,9 @@ async def on_new_link(event: events.NewMessage.Event) -> None:
         peer = chat_id
 
     try:
-        # 获取指定聊天中的消息
-        message = await client.get_messages(peer, ids=message_id)
+        # 用户名先查询解析缓存，避免频繁调用 contacts.ResolveUsername
+        # 获取指定聊天中的消息，保存的解析结果失效时重新解析
+        peer, message = await call_with_peer(client, peer, lambda p: client.get_messages(p, ids=message_id))
     except Exception as e:
         log.exception(f"Error: {e}")
         await event.reply("服务器内部错误，请过段时间重试")
@@ -95,22 +95,9 @@ async def on_new_link(event: events.NewMessage.Event) -> None:
         await event.reply("找不到聊天记录！要么无效，要么先以此帐户加入！")
         return
 
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/getChat"
-    params = {"chat_id": f"@{chat_id}"}
-    has_protected_content = False
-
-    # 获取代理设置
-    proxy = None
-    if USE_PROXY:
-        proxy = f"{PROXY_TYPE}://{PROXY_HOST}:{PROXY_PORT}"
-
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, params=params, proxy=proxy) as response:
-            if response.status == 200:
-                result = await response.json()
-                if result and result.get("ok"):
-                    channel = result.get("result")
-                    has_protected_content = channel.get("has_protected_content", False)
+    # 频道信息几乎不变，通过缓存查询
+    channel = await get_chat(BOT_TOKEN, f"@{chat_id}", client=client)
+    has_protected_content = channel.get("has_protected_content", False) if channel else False
 
     # 如果链接包含 '?single' 参数，则只处理当前消息
     if is_single:
@@ -170,29 +157,12 @@ async def handle_media_group(event: events.NewMessage.Event, message, media_grou
 
 
 async def get_media_group_messages(initial_message, message_id, peer) -> list:
-    media_group = [initial_message]
-    grouped_id = initial_message.grouped_id
-
-    if not grouped_id:
-        # 如果初始消息没有 grouped_id，则返回初始消息本身
-        return media_group
-
-    # 获取前后10条消息的范围
-    start_id = max(1, message_id - RANGE)
-    end_id = message_id + RANGE
-
     try:
-        # 转换 range 为列表
-        ids = list(range(start_id, end_id + 1))
-        # 一次性获取指定范围内的消息
-        messages = await client.get_messages(peer, ids=ids)
-
-        # 按照 grouped_id 筛选属于同一组的消息
-        media_group = [msg for msg in messages if msg and msg.grouped_id == grouped_id]
+        # 从小范围开始按需扩大获取范围，同组消息的 ID 会被缓存
+        return await discover_media_group(client, peer, initial_message)
     except Exception as e:
         log.exception(f"Error: {e}")
-
-    return media_group
+        return [initial_message]
 
 
 # 在配置加载时解析授权用户列表
@@ -231,10 +201,18 @@ client.add_event_handler(on_new_link, events.NewMessage(func=is_authorized))
 
 
 async def main():
+    # 用户名解析缓存保存在数据库中，首次运行时创建数据表
+    init_db()
     # 获取机器人的用户信息并开始运行客户端
     ubot_self = await client.get_me()
     log.info("客户端已启动为 %d。", ubot_self.id)
-    await client.run_until_disconnected()
+    # 创建共享的HTTP会话
+    await http_client.start()
+    try:
+        await client.run_until_disconnected()
+    finally:
+        # 关闭共享的HTTP会话
+        await http_client.close()
 
 
 client.loop.run_until_complete(main())
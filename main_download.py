@@ -1,18 +1,18 @@
 import asyncio
 import logging
 import os
-import tempfile
-import time
 import urllib.parse
 
-import aiofiles
-import aiofiles.os
 from decouple import config
 from telethon import TelegramClient, events
 from telethon.sessions import StringSession
 from telethon.tl.types import MessageMediaDocument, InputMediaUploadedDocument, InputMediaUploadedPhoto, \
     MessageMediaPhoto, Message, PeerChannel
 
+from db import init_db
+from services import transfer_budget, get_media_size, spool, transfer_message_media, get_document_file_name, \
+    call_with_peer, get_comment_message, get_comment_media_group, discover_media_group
+
 # 初始化日志记录器
 logging.basicConfig(
     level=logging.INFO, format="[%(levelname)s] %(asctime)s - %(message)s"
@@ -25,8 +25,6 @@ API_HASH = config("API_HASH", default=None)
 SESSION = config("USER_SESSION", default=None)
 TARGET_BOT_ID = config("TARGET_BOT_ID", default=None, cast=int)
 AUTHS = config("AUTHS", default="")
-# 消息范围±10
-RANGE = 10
 
 # 代理设置
 USE_PROXY = config("USE_PROXY", default=False, cast=bool)
@@ -70,15 +68,6 @@ if AUTHS:
         exit(1)
 
 
-# 创建临时文件的异步函数
-async def create_temp_file(suffix=""):
-    """创建临时文件的异步封装"""
-    temp_file = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
-    temp_name = temp_file.name
-    temp_file.close()
-    return temp_name
-
-
 # 定义处理新消息的函数
 async def on_new_link(event: events.NewMessage.Event) -> None:
     text = event.text
@@ -108,8 +97,9 @@ async def on_new_link(event: events.NewMessage.Event) -> None:
         peer = chat_id
 
     try:
-        # 获取指定聊天中的消息
-        message = await client.get_messages(peer, ids=message_id)
+        # 用户名先查询解析缓存，避免频繁调用 contacts.ResolveUsername
+        # 获取指定聊天中的消息，保存的解析结果失效时重新解析
+        peer, message = await call_with_peer(client, peer, lambda p: client.get_messages(p, ids=message_id))
     except Exception as e:
         log.exception(f"Error: {e}")
         await event.reply("服务器内部错误，请过段时间重试")
@@ -123,24 +113,15 @@ async def on_new_link(event: events.NewMessage.Event) -> None:
 
     if is_comment:
         comment_id = int(params.get('comment'))
-        # 获取频道实体
-        channel = await client.get_entity(chat_id)
+        # 通过频道关联的讨论组直接获取评论
         comment_message, comment_grouped_id = await get_comment_message(
-            client, channel, message_id, comment_id
+            client, peer, message_id, comment_id
         )
         if is_single:
             await handle_single_message(event, comment_message)
         else:
             # 获取属于同一组的所有消息
-            comment_media_group = []
-            async for reply in client.iter_messages(
-                    entity=channel,
-                    reply_to=message_id
-            ):
-                if reply.grouped_id == comment_grouped_id:
-                    comment_media_group.append(reply)
-            # 反转列表
-            comment_media_group.reverse()
+            comment_media_group = await get_comment_media_group(client, comment_message)
             await handle_media_group(event, comment_message, comment_media_group)
     else:
         if is_single:
@@ -164,17 +145,6 @@ async def parse_url(text: str):
     return chat_id, int(message_id)
 
 
-async def get_comment_message(client: TelegramClient, channel, message_id, comment_id):
-    """从评论中获取指定的评论消息及其 grouped_id"""
-    async for reply in client.iter_messages(
-            entity=channel,
-            reply_to=message_id
-    ):
-        if reply.id == comment_id:
-            return reply, reply.grouped_id  # 返回匹配的评论消息及其 grouped_id
-    return None, None  # 如果没有找到，返回 None
-
-
 async def handle_single_message(event: events.NewMessage.Event, message) -> None:
     try:
         # 发送提示消息
@@ -187,32 +157,32 @@ async def handle_single_message(event: events.NewMessage.Event, message) -> None
                     message.media.document.mime_type == 'video/mp4' and not message.media.video) or message.media.document.mime_type == 'image/heic'):
                 force_document = True
 
-            # 先下载文件
-            file_path = await message.download_media()
-            if isinstance(message.media, MessageMediaDocument) and (
-                    (
-                            message.media.document.mime_type == 'video/mp4' and message.media.document.size > 10 * 1024 * 1024) or message.media.document.mime_type == 'image/heic'):
-                # 下载缩略图
-                timestamp = int(time.time())
-                thumb_filename = f"{message.media.document.id}_{timestamp}_thumbnail.jpg"
-                thumb_path = await client.download_media(
-                    message,
-                    file=thumb_filename,
-                    thumb=-1  # -1 表示下载最高质量的缩略图
-                )
-                await client.send_file(event.chat_id, file_path, caption=message.text, reply_to=event.message.id,
-                                       attributes=message.media.document.attributes, thumb=thumb_path,
-                                       force_document=force_document)
-                await aiofiles.os.remove(thumb_path)  # 发送后删除缩略图
-            elif isinstance(message.media, MessageMediaDocument) and message.media.document.mime_type == 'audio/mpeg':
-                await client.send_file(event.chat_id, file_path, caption=message.text, reply_to=event.message.id,
-                                       attributes=message.media.document.attributes,
-                                       force_document=force_document)
-            else:
-                await client.send_file(event.chat_id, file_path, caption=message.text, nosound_video=True,
-                                       reply_to=event.message.id,
-                                       force_document=force_document)
-            await aiofiles.os.remove(file_path)  # 发送后删除文件
+            # 按文件大小申请传输额度和临时文件空间，超出上限时在此排队，离开时临时文件随工作目录一起删除
+            size = get_media_size(message)
+            async with transfer_budget.reserve(size), spool.reserve(size) as work_dir:
+                # 先下载文件
+                file_path = await message.download_media(file=work_dir)
+                if isinstance(message.media, MessageMediaDocument) and (
+                        (
+                                message.media.document.mime_type == 'video/mp4' and message.media.document.size > 10 * 1024 * 1024) or message.media.document.mime_type == 'image/heic'):
+                    # 下载缩略图
+                    thumb_filename = os.path.join(work_dir, f"{message.media.document.id}_thumbnail.jpg")
+                    thumb_path = await client.download_media(
+                        message,
+                        file=thumb_filename,
+                        thumb=-1  # -1 表示下载最高质量的缩略图
+                    )
+                    await client.send_file(event.chat_id, file_path, caption=message.text, reply_to=event.message.id,
+                                           attributes=message.media.document.attributes, thumb=thumb_path,
+                                           force_document=force_document)
+                elif isinstance(message.media, MessageMediaDocument) and message.media.document.mime_type == 'audio/mpeg':
+                    await client.send_file(event.chat_id, file_path, caption=message.text, reply_to=event.message.id,
+                                           attributes=message.media.document.attributes,
+                                           force_document=force_document)
+                else:
+                    await client.send_file(event.chat_id, file_path, caption=message.text, nosound_video=True,
+                                           reply_to=event.message.id,
+                                           force_document=force_document)
         else:
             await client.send_message(event.chat_id, message.text, reply_to=event.message.id)
         # 删除提示消息
@@ -249,62 +219,36 @@ async def prepare_album_file(msg: Message, client: TelegramClient):
     # 为临时文件添加扩展名
     suffix = ".jpg" if isinstance(msg.media,
                                   MessageMediaPhoto) else ".mp4" if "video/mp4" in msg.media.document.mime_type else ""
-    temp_name = None
-    thumb_path = None
-    file_path = None
-    try:
-        temp_name = await create_temp_file(suffix=suffix)
-        file_path = await client.download_media(msg, file=temp_name)
+    thumb = None
+    # 按文件大小申请传输额度，超出进程内传输上限时在此排队
+    async with transfer_budget.reserve(get_media_size(msg)):
         if isinstance(msg.media, MessageMediaPhoto):
-            return InputMediaUploadedPhoto(file=await client.upload_file(file_path))
+            # 小文件在内存中转存，大文件经临时文件池
+            return InputMediaUploadedPhoto(file=await transfer_message_media(client, client, msg, f"{msg.id}{suffix}"))
         elif isinstance(msg.media, MessageMediaDocument):
+            uploaded_file = await transfer_message_media(client, client, msg,
+                                                         get_document_file_name(msg.media.document))
             if (msg.media.document.mime_type == "video/mp4" and msg.media.document.size > 10 * 1024 * 1024) or (
                     msg.media.document.mime_type == "image/heic"):
-                thumb_path = await client.download_media(
-                    msg, file=f"{temp_name}_thumb.jpg", thumb=-1
-                )
+                # 缩略图很小，直接下载到内存
+                thumb = await client.download_media(msg, file=bytes, thumb=-1)
             # 对于文档类型，返回带有特殊标记的对象，以便后续处理
             return InputMediaUploadedDocument(
-                file=await client.upload_file(file_path),
-                thumb=await client.upload_file(thumb_path) if thumb_path else None,
+                file=uploaded_file,
+                thumb=await client.upload_file(thumb, file_name=f"{msg.id}_thumb.jpg") if thumb else None,
                 mime_type=msg.media.document.mime_type or "application/octet-stream",
                 attributes=msg.media.document.attributes,
                 nosound_video=True
             )
-    finally:
-        # 删除临时文件
-        if file_path and os.path.exists(file_path):
-            await aiofiles.os.remove(file_path)
-        if thumb_path and os.path.exists(thumb_path):
-            await aiofiles.os.remove(thumb_path)
-        if temp_name and os.path.exists(temp_name):
-            await aiofiles.os.remove(temp_name)
 
 
 async def get_media_group_messages(initial_message, message_id, peer) -> list:
-    media_group = [initial_message]
-    grouped_id = initial_message.grouped_id
-
-    if not grouped_id:
-        # 如果初始消息没有 grouped_id，则返回初始消息本身
-        return media_group
-
-    # 获取前后10条消息的范围
-    start_id = max(1, message_id - RANGE)
-    end_id = message_id + RANGE
-
     try:
-        # 转换 range 为列表
-        ids = list(range(start_id, end_id + 1))
-        # 一次性获取指定范围内的消息
-        messages = await client.get_messages(peer, ids=ids)
-
-        # 按照 grouped_id 筛选属于同一组的消息
-        media_group = [msg for msg in messages if msg and msg.grouped_id == grouped_id]
+        # 从小范围开始按需扩大获取范围，同组消息的 ID 会被缓存
+        return await discover_media_group(client, peer, initial_message)
     except Exception as e:
         log.exception(f"Error: {e}")
-
-    return media_group
+        return [initial_message]
 
 
 # 添加事件处理器
@@ -333,6 +277,10 @@ client.add_event_handler(on_new_link, events.NewMessage(func=is_authorized))
 
 
 async def main():
+    # 续传记录和用户名解析缓存保存在数据库中，首次运行时创建数据表
+    init_db()
+    # 清理上次运行遗留的临时文件
+    spool.sweep()
     # 获取机器人的用户信息并开始运行客户端
     ubot_self = await client.get_me()
     log.info("客户端已启动为 %d。", ubot_self.id)
@@ -0,0 +1,94 @@
+"""
+媒体工作进程 - MEDIA_WORKERS 大于 0 时由 main.py 启动，从任务表中取出链接请求，下载、归档并发送给用户
+
+用法: python media_worker.py <序号>
+"""
+
+import asyncio
+import logging
+import sys
+
+from config import (
+    API_ID, API_HASH, BOT_SESSION, USER_SESSIONS, BOT_TOKEN, MEDIA_WORKERS, MEDIA_WORKER_CONCURRENCY,
+    LINK_JOB_POLL_INTERVAL, LINK_JOB_POLL_MAX_INTERVAL, get_proxy, check_bot_config
+)
+from db.aio import claim_link_job, finish_link_job, close_db
+from handlers import process_link, QueuedEvent
+from services import (
+    open_session, http_client, schedule_cache_stats, transfer_budget, RateLimitedClient, UserClientPool
+)
+
+log = logging.getLogger("MediaWorker")
+
+
+async def run_job(job_id, payload, bot_client, user_pool):
+    """执行一个任务，执行结果写回任务表"""
+    try:
+        await process_link(QueuedEvent(bot_client, payload), payload["text"], bot_client, user_pool, BOT_TOKEN)
+    except Exception as e:
+        log.exception(f"链接任务 {job_id} 执行失败: {e}")
+        await finish_link_job(job_id, str(e) or type(e).__name__)
+    else:
+        await finish_link_job(job_id)
+
+
+async def run_jobs(worker_id, bot_client, user_pool):
+    """
+    有空闲位置时取出任务执行，同时执行 MEDIA_WORKER_CONCURRENCY 个
+
+    每个进程只有一个协程查询任务表；没有新任务时查询间隔逐次翻倍，直到 LINK_JOB_POLL_MAX_INTERVAL
+    """
+    slots = asyncio.Semaphore(MEDIA_WORKER_CONCURRENCY)
+    running = set()
+    interval = LINK_JOB_POLL_INTERVAL
+    while True:
+        await slots.acquire()
+        job = await claim_link_job(worker_id)
+        if job is None:
+            slots.release()
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, LINK_JOB_POLL_MAX_INTERVAL)
+            continue
+        interval = LINK_JOB_POLL_INTERVAL
+        task = asyncio.create_task(run_job(*job, bot_client, user_pool))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        task.add_done_callback(lambda _: slots.release())
+
+
+async def main(index):
+    check_bot_config()
+    worker_id = f"worker-{index}"
+    proxy_settings = get_proxy()
+
+    # 每个工作进程使用自己的会话文件和连接；不接收更新，机器人的更新只由入口进程处理
+    bot_client = RateLimitedClient(open_session(BOT_SESSION, f"bot_client_{worker_id}"), API_ID, API_HASH,
+                                   proxy=proxy_settings, receive_updates=False)
+    user_clients = [
+        RateLimitedClient(open_session(session, f"user_client_{i}_{worker_id}"), API_ID, API_HASH,
+                          proxy=proxy_settings, receive_updates=False)
+        for i, session in enumerate(USER_SESSIONS)
+    ]
+    user_pool = UserClientPool(user_clients)
+    # 传输额度由所有工作进程平分，总的在途传输不超过配置的上限
+    transfer_budget.split(MEDIA_WORKERS)
+
+    await bot_client.connect()
+    for user_client in user_clients:
+        await user_client.connect()
+    await http_client.start()
+    log.info(f"媒体工作进程 {worker_id} 已启动，同时处理 {MEDIA_WORKER_CONCURRENCY} 个请求")
+
+    # 工作进程中的缓存独立统计
+    asyncio.create_task(schedule_cache_stats())
+    try:
+        await run_jobs(worker_id, bot_client, user_pool)
+    finally:
+        await http_client.close()
+        for client in [bot_client, *user_clients]:
+            await client.disconnect()
+        close_db()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 0))
@@ -4,6 +4,76 @@ from .system_monitor import (
 from .task_scheduler import (
     schedule_transaction_checker,
     schedule_quota_reset,
+    schedule_cache_stats,
     notify_user_order_completed,
     check_trc20_transaction
 )
+from .media_transfer import (
+    stream_document,
+    transfer_message_media,
+    get_document_file_name,
+    get_media_size
+)
+from .parallel_transfer import (
+    download_message_media,
+    iter_download_parallel,
+    upload_file_parallel
+)
+from .transfer_limiter import (
+    transfer_budget
+)
+from .spool import (
+    spool
+)
+from .buffer_pool import (
+    buffer_pool
+)
+from .http_client import (
+    http_client
+)
+from .chat_cache import (
+    chat_cache,
+    get_chat
+)
+from .username_resolver import (
+    username_resolver,
+    resolve_peer,
+    call_with_peer
+)
+from .session_store import (
+    open_session,
+    migrate_string_session
+)
+from .media_group import (
+    media_group_cache,
+    discover_media_group
+)
+from .comment_resolver import (
+    get_comment_message,
+    get_comment_media_group
+)
+from .single_flight import (
+    SingleFlight,
+    archive_flight
+)
+from .job_queue import (
+    job_queue,
+    QueueFullError,
+    UserJobLimitError,
+    PRIORITY_PAID,
+    PRIORITY_FREE
+)
+from .rate_limiter import (
+    RateLimitedClient
+)
+from .user_pool import (
+    UserClientPool
+)
+from .archive_router import (
+    ArchiveRing,
+    archive_ring
+)
+from .link_job_queue import (
+    LinkJobQueue,
+    link_job_queue
+)
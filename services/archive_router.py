@@ -0,0 +1,49 @@
+"""
+归档频道路由模块 - 新的归档按源聊天一致性哈希分散到多个归档频道，查找时覆盖所有归档频道
+"""
+
+import bisect
+import hashlib
+import logging
+
+from config import ARCHIVE_CHAT_IDS, ARCHIVE_HASH_REPLICAS, PRIVATE_CHAT_ID
+
+# 初始化日志记录器
+log = logging.getLogger("ArchiveRouter")
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class ArchiveRing:
+    """
+    归档频道的一致性哈希环
+
+    同一源聊天的消息总是归档到同一个频道，媒体组的各条消息因此在同一个频道中。
+    增加或移除归档频道时只有约 1/n 的源聊天改变归档频道，已有的归档仍可通过 lookup_chat_ids 查到。
+    """
+
+    def __init__(self, chat_ids, replicas=ARCHIVE_HASH_REPLICAS, extra_lookup_chat_ids=()):
+        if not chat_ids:
+            raise ValueError("至少需要一个归档频道")
+        self.chat_ids = list(dict.fromkeys(chat_ids))
+        # 查找时除了接收新归档的频道，还包括只保留旧归档的频道
+        self.lookup_chat_ids = self.chat_ids + [x for x in dict.fromkeys(extra_lookup_chat_ids)
+                                                if x is not None and x not in self.chat_ids]
+        self._ring = sorted((_hash(f"{chat_id}#{i}"), chat_id) for chat_id in self.chat_ids for i in range(replicas))
+        self._points = [point for point, _ in self._ring]
+
+    def chat_for(self, source_chat_id):
+        """
+        源聊天的消息归档到的频道
+
+        :param source_chat_id: 链接中的源聊天标识（数字ID或用户名）
+        :return: 归档频道ID
+        """
+        index = bisect.bisect(self._points, _hash(str(source_chat_id).lower())) % len(self._points)
+        return self._ring[index][1]
+
+
+# 进程内共享的归档频道路由，PRIVATE_CHAT_ID 中已有的归档始终可以查到
+archive_ring = ArchiveRing(ARCHIVE_CHAT_IDS or [PRIVATE_CHAT_ID], extra_lookup_chat_ids=[PRIVATE_CHAT_ID])
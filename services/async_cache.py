@@ -0,0 +1,86 @@
+"""
+异步缓存模块 - 带过期时间的 LRU 缓存，合并同一个键的并发加载
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class AsyncTTLCache:
+    """
+    异步 LRU + TTL 缓存
+
+    同一个键同时未命中时只调用一次加载函数，其余请求等待同一个结果。
+    加载结果为 None 表示查询失败，按 negative_ttl 缓存；加载函数抛出的异常不缓存。
+    """
+
+    def __init__(self, max_size, ttl, negative_ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # 键 -> (过期时间, 值)，按最近使用排序
+        self._entries = OrderedDict()
+        # 键 -> 正在进行的加载任务
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def stats(self):
+        """命中统计，合并到进行中加载的请求也算作命中"""
+        total = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / total if total else 0.0
+        }
+
+    def invalidate(self, key):
+        """删除缓存的值，下次访问时重新加载"""
+        self._entries.pop(key, None)
+
+    def _store(self, key, value):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _load(self, key, loader):
+        try:
+            value = await loader()
+            self._store(key, value)
+            return value
+        finally:
+            self._pending.pop(key, None)
+
+    async def get(self, key, loader):
+        """
+        读取缓存，未命中时调用加载函数
+
+        :param key: 缓存键
+        :param loader: 无参数的异步函数，返回要缓存的值
+        :return: 缓存或加载的值
+        """
+        entry = self._entries.get(key)
+        if entry:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        task = self._pending.get(key)
+        if task:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._pending[key] = task
+        # 发起请求的一方被取消时，不影响其他等待同一结果的请求
+        return await asyncio.shield(task)
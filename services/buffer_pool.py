@@ -0,0 +1,51 @@
+"""
+内存缓冲区池模块 - 小文件在内存中完成下载和上传，避免临时文件的创建和删除
+"""
+
+import asyncio
+import io
+import logging
+from contextlib import asynccontextmanager
+
+from config import MEMORY_BUFFER_THRESHOLD, MEMORY_BUFFER_COUNT
+
+# 初始化日志记录器
+log = logging.getLogger("BufferPool")
+
+
+class BufferPool:
+    """
+    可复用的内存缓冲区池
+
+    同时使用的缓冲区数量有上限，内存占用不超过 max_buffers * threshold。
+    """
+
+    def __init__(self, threshold, max_buffers):
+        self.threshold = threshold
+        self.max_buffers = max_buffers
+        self._free = []
+        self._slots = asyncio.Semaphore(max_buffers)
+
+    def accepts(self, size):
+        """判断指定大小的文件是否应该使用内存缓冲区"""
+        return self.max_buffers > 0 and 0 < size <= self.threshold
+
+    @asynccontextmanager
+    async def acquire(self):
+        """
+        取出一个空的缓冲区，离开上下文时清空并归还
+
+        :return: io.BytesIO 缓冲区
+        """
+        async with self._slots:
+            buffer = self._free.pop() if self._free else io.BytesIO()
+            try:
+                yield buffer
+            finally:
+                buffer.seek(0)
+                buffer.truncate()
+                self._free.append(buffer)
+
+
+# 进程内共享的内存缓冲区池
+buffer_pool = BufferPool(MEMORY_BUFFER_THRESHOLD, MEMORY_BUFFER_COUNT)
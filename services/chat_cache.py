@@ -0,0 +1,87 @@
+"""
+聊天信息缓存模块 - 通过 Telethon 实体获取聊天的受保护标志、类型和用户名并缓存，Bot API getChat 作为后备
+"""
+
+import logging
+
+from telethon import utils
+from telethon.errors import RPCError
+from telethon.tl.types import Channel, Chat, User
+
+from config import CHAT_CACHE_SIZE, CHAT_CACHE_TTL, CHAT_CACHE_NEGATIVE_TTL
+from .async_cache import AsyncTTLCache
+from .http_client import http_client
+from .username_resolver import resolve_peer
+
+# 初始化日志记录器
+log = logging.getLogger("ChatCache")
+
+
+# 进程内共享的聊天信息缓存
+chat_cache = AsyncTTLCache(CHAT_CACHE_SIZE, CHAT_CACHE_TTL, CHAT_CACHE_NEGATIVE_TTL)
+
+
+def chat_info_from_entity(entity):
+    """
+    将 Telethon 实体转换为与 getChat 结果相同结构的字典
+
+    :param entity: Channel、Chat 或 User 实体
+    :return: 包含 type、username、has_protected_content 的字典
+    """
+    if isinstance(entity, Channel):
+        peer_type = "supergroup" if entity.megagroup or entity.gigagroup else "channel"
+    elif isinstance(entity, Chat):
+        peer_type = "group"
+    elif isinstance(entity, User):
+        peer_type = "private"
+    else:
+        return None
+    return {
+        "id": utils.get_peer_id(entity),
+        "type": peer_type,
+        "username": getattr(entity, "username", None),
+        "has_protected_content": bool(getattr(entity, "noforwards", False))
+    }
+
+
+async def _get_chat_from_entity(client, chat_id):
+    """通过 Telethon 客户端获取实体，peer id 只能命中会话中已缓存的实体"""
+    try:
+        entity = await client.get_entity(await resolve_peer(client, chat_id))
+    except (ValueError, TypeError, RPCError) as e:
+        log.debug(f"无法通过实体获取聊天信息: {chat_id}，{e}")
+        return None
+    return chat_info_from_entity(entity)
+
+
+async def _get_chat_from_bot_api(bot_token, chat_id):
+    """通过 Bot API getChat 获取聊天信息"""
+    url = f"https://api.telegram.org/bot{bot_token}/getChat"
+    # 通过共享的HTTP会话请求，复用到 Bot API 的连接
+    status, result = await http_client.get_json(url, params={"chat_id": chat_id})
+    if status == 200 and result and result.get("ok"):
+        return result.get("result")
+    log.info(f"getChat 查询失败: {chat_id}，状态码 {status}")
+    return None
+
+
+async def get_chat(bot_token, chat_id, client=None):
+    """
+    获取聊天信息，结果会被缓存
+
+    优先读取 Telethon 实体的 noforwards、megagroup 和 username，获取不到时再请求 Bot API getChat。
+
+    :param bot_token: 机器人 Token，用于后备的 Bot API 请求
+    :param chat_id: 公开聊天的 "@用户名" 或 peer id
+    :param client: 用于获取实体的 Telethon 客户端
+    :return: 与 getChat 的 result 结构相同的字典（type、username、has_protected_content），查询失败时返回 None
+    """
+    key = chat_id.lower() if isinstance(chat_id, str) else chat_id
+
+    async def load():
+        chat = await _get_chat_from_entity(client, chat_id) if client else None
+        if chat is None and bot_token:
+            chat = await _get_chat_from_bot_api(bot_token, chat_id)
+        return chat
+
+    return await chat_cache.get(key, load)
@@ -0,0 +1,75 @@
+"""
+评论解析模块 - 通过频道关联的讨论组直接获取评论消息，不再遍历整个评论区
+"""
+
+import logging
+
+from telethon import utils
+from telethon.errors import RPCError
+from telethon.tl.functions.messages import GetDiscussionMessageRequest
+
+from config import COMMENT_CACHE_SIZE, COMMENT_CACHE_TTL, COMMENT_CACHE_NEGATIVE_TTL
+from .async_cache import AsyncTTLCache
+from .media_group import discover_media_group
+
+# 初始化日志记录器
+log = logging.getLogger("CommentResolver")
+
+# (账号ID, 频道ID, 帖子ID) -> 讨论组的 InputPeer，帖子没有评论区时为 None
+discussion_cache = AsyncTTLCache(COMMENT_CACHE_SIZE, COMMENT_CACHE_TTL, COMMENT_CACHE_NEGATIVE_TTL)
+
+
+async def get_discussion_peer(client, channel, message_id):
+    """
+    获取频道帖子的评论所在的讨论组，结果会被缓存
+
+    :param client: Telethon 客户端
+    :param channel: 频道实体
+    :param message_id: 帖子ID
+    :return: 讨论组的 InputPeer，帖子没有评论区时返回 None
+    """
+    account_id = (await client.get_me(input_peer=True)).user_id
+
+    async def load():
+        try:
+            result = await client(GetDiscussionMessageRequest(peer=channel, msg_id=message_id))
+        except RPCError as e:
+            log.info(f"获取帖子的讨论组失败: {message_id}，{e}")
+            return None
+        if not result.messages:
+            return None
+        discussion_id = utils.get_peer_id(result.messages[0].peer_id)
+        chat = next((x for x in result.chats if utils.get_peer_id(x) == discussion_id), None)
+        return utils.get_input_peer(chat) if chat else None
+
+    return await discussion_cache.get((account_id, utils.get_peer_id(channel), message_id), load)
+
+
+async def get_comment_message(client, channel, message_id, comment_id):
+    """
+    获取帖子下指定的评论消息及其 grouped_id
+
+    :param client: Telethon 客户端
+    :param channel: 频道实体
+    :param message_id: 帖子ID
+    :param comment_id: 评论在讨论组中的消息ID
+    :return: (评论消息, grouped_id)，找不到时返回 (None, None)
+    """
+    discussion = await get_discussion_peer(client, channel, message_id)
+    if discussion is None:
+        return None, None
+    comment = await client.get_messages(discussion, ids=comment_id)
+    if not comment:
+        return None, None
+    return comment, comment.grouped_id
+
+
+async def get_comment_media_group(client, comment):
+    """
+    获取与评论属于同一组的所有消息
+
+    :param client: Telethon 客户端
+    :param comment: get_comment_message 返回的评论消息
+    :return: 按消息ID排序的同组消息列表
+    """
+    return await discover_media_group(client, await comment.get_input_chat(), comment)
@@ -0,0 +1,77 @@
+"""
+HTTP 客户端模块 - 进程内共享的 aiohttp 会话，复用到 Bot API 和 TronGrid 的连接
+"""
+
+import logging
+
+import aiohttp
+
+from config import (
+    HTTP_TIMEOUT, HTTP_CONNECT_TIMEOUT, HTTP_POOL_LIMIT, HTTP_POOL_LIMIT_PER_HOST,
+    HTTP_DNS_CACHE_TTL, HTTP_KEEPALIVE_TIMEOUT, get_proxy
+)
+
+# 初始化日志记录器
+log = logging.getLogger("HttpClient")
+
+
+class HttpClient:
+    """
+    共享的 HTTP 客户端
+
+    按主机保持长连接的连接池，带有超时设置和 DNS 缓存。应在 main() 中启动和关闭，
+    未启动时第一次请求会自动创建会话。
+    """
+
+    def __init__(self):
+        self._session = None
+
+    async def start(self):
+        """创建共享会话"""
+        if self._session and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+        )
+        timeout = aiohttp.ClientTimeout(total=HTTP_TIMEOUT, sock_connect=HTTP_CONNECT_TIMEOUT)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        log.info("已创建共享的HTTP会话")
+
+    async def close(self):
+        """关闭共享会话及其中的连接"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+            log.info("已关闭共享的HTTP会话")
+        self._session = None
+
+    @property
+    def session(self):
+        if not self._session or self._session.closed:
+            raise RuntimeError("HTTP会话尚未启动")
+        return self._session
+
+    async def get_json(self, url, params=None, headers=None):
+        """
+        发送 GET 请求并解析 JSON 响应，使用配置的代理
+
+        :param url: 请求地址
+        :param params: 查询参数
+        :param headers: 请求头
+        :return: (状态码, JSON数据)，响应不是 JSON 时数据为 None
+        """
+        await self.start()
+        async with self.session.get(url, params=params, headers=headers,
+                                    proxy=get_proxy(proxy_format="url")) as response:
+            try:
+                data = await response.json(content_type=None)
+            except ValueError:
+                data = None
+                log.error(f"请求 {response.url.host} 返回了无法解析的内容: {response.status}")
+            return response.status, data
+
+
+# 进程内共享的HTTP客户端
+http_client = HttpClient()
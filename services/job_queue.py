@@ -0,0 +1,110 @@
+"""
+任务队列模块 - 链接请求进入有界优先队列，由固定数量的工作协程按优先级执行
+"""
+
+import asyncio
+import itertools
+import logging
+
+from config import JOB_WORKERS, JOB_QUEUE_SIZE, JOB_USER_PENDING
+
+# 初始化日志记录器
+log = logging.getLogger("JobQueue")
+
+# 任务优先级，数值越小越先执行
+PRIORITY_PAID = 0
+PRIORITY_FREE = 1
+
+
+class QueueFullError(Exception):
+    """队列中的任务数已达上限"""
+
+
+class UserJobLimitError(Exception):
+    """用户排队和执行中的任务数已达上限"""
+
+
+class JobQueue:
+    """
+    带优先级的任务队列和工作协程池
+
+    优先级相同的任务按提交顺序执行。每个用户排队和执行中的任务数不超过 per_user_limit，
+    用户的计数在其任务全部结束后删除，不会随用户数增长。
+    """
+
+    def __init__(self, workers, max_size, per_user_limit):
+        self.workers = workers
+        self.per_user_limit = per_user_limit
+        self._queue = asyncio.PriorityQueue(max_size)
+        self._counter = itertools.count()
+        self._tasks = []
+        # 用户ID -> 排队和执行中的任务数
+        self._pending = {}
+        # 优先级 -> 排队中（尚未开始执行）的任务数，用于计算排队位置
+        self._queued = {}
+        self.running = 0
+
+    def start(self):
+        """启动工作协程，应在事件循环中调用"""
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        log.info(f"已启动 {self.workers} 个任务工作协程")
+
+    async def stop(self):
+        """停止工作协程，未执行的任务被丢弃"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def pending(self, user_id):
+        """用户排队和执行中的任务数"""
+        return self._pending.get(user_id, 0)
+
+    def submit(self, user_id, priority, job):
+        """
+        提交任务
+
+        :param user_id: 提交任务的用户ID
+        :param priority: PRIORITY_PAID 或 PRIORITY_FREE
+        :param job: 无参数的异步函数
+        :return: 排队位置，有空闲的工作协程、任务会立即开始时为 0
+        :raises UserJobLimitError: 用户的任务数已达上限
+        :raises QueueFullError: 队列已满
+        """
+        self.start()
+        if self.pending(user_id) >= self.per_user_limit:
+            raise UserJobLimitError()
+        key = (priority, next(self._counter))
+        try:
+            self._queue.put_nowait((key, user_id, job))
+        except asyncio.QueueFull:
+            raise QueueFullError()
+        self._pending[user_id] = self.pending(user_id) + 1
+
+        # 优先级更高的任务和先提交的同优先级任务排在前面
+        ahead = sum(count for queued_priority, count in self._queued.items() if queued_priority <= priority)
+        self._queued[priority] = self._queued.get(priority, 0) + 1
+        idle = self.workers - self.running
+        return max(0, ahead + 1 - idle)
+
+    async def _worker(self, index):
+        while True:
+            (priority, _), user_id, job = await self._queue.get()
+            self._queued[priority] -= 1
+            self.running += 1
+            try:
+                await job()
+            except Exception as e:
+                log.exception(f"任务执行失败: {e}")
+            finally:
+                self.running -= 1
+                self._pending[user_id] -= 1
+                if not self._pending[user_id]:
+                    del self._pending[user_id]
+                self._queue.task_done()
+
+
+# 进程内共享的链接任务队列
+job_queue = JobQueue(JOB_WORKERS, JOB_QUEUE_SIZE, JOB_USER_PENDING)
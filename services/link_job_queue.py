@@ -0,0 +1,141 @@
+"""
+多进程任务队列模块 - 入口进程把链接请求写入数据库中的任务表，由独立的媒体工作进程取出执行，执行结果写回任务表
+"""
+
+import asyncio
+import logging
+import os
+import sys
+
+from config import (
+    MEDIA_WORKERS, MEDIA_WORKER_CONCURRENCY, JOB_QUEUE_SIZE, JOB_USER_PENDING, LINK_JOB_POLL_INTERVAL,
+    LINK_JOB_POLL_MAX_INTERVAL, LINK_JOB_MAX_ATTEMPTS
+)
+from db.aio import (
+    enqueue_link_job, requeue_link_jobs, count_link_jobs, count_link_jobs_ahead, pop_finished_link_jobs
+)
+from .job_queue import QueueFullError, UserJobLimitError
+
+# 初始化日志记录器
+log = logging.getLogger("LinkJobQueue")
+
+# 媒体工作进程的入口脚本
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "media_worker.py")
+# 工作进程异常退出后重新启动前的等待时间（秒）
+RESTART_DELAY = 5
+
+
+class LinkJobQueue:
+    """
+    入口进程一侧的任务队列
+
+    与 JobQueue 的 submit/pending 用法相同（需要 await），但任务内容写入数据库，由 workers 个媒体工作进程执行，
+    入口进程重启或工作进程退出时未完成的任务不会丢失。工作进程异常退出后自动重新启动，
+    其执行中的任务放回队列；执行失败的任务由入口进程回复用户。
+    """
+
+    def __init__(self, workers, concurrency, max_size, per_user_limit):
+        self.workers = workers
+        self.concurrency = concurrency
+        self.max_size = max_size
+        self.per_user_limit = per_user_limit
+        self._tasks = []
+        self._processes = {}
+        self._stopping = False
+
+    @property
+    def enabled(self):
+        return self.workers > 0
+
+    async def pending(self, user_id):
+        """用户排队和执行中的任务数"""
+        return await count_link_jobs(user_id)
+
+    async def submit(self, user_id, priority, payload):
+        """
+        提交任务
+
+        :param user_id: 提交任务的用户ID
+        :param priority: PRIORITY_PAID 或 PRIORITY_FREE
+        :param payload: 可序列化为 JSON 的任务内容，由工作进程解析
+        :return: 排队位置，有空闲的工作进程、任务会立即开始时为 0
+        :raises UserJobLimitError: 用户的任务数已达上限
+        :raises QueueFullError: 队列已满
+        """
+        if await self.pending(user_id) >= self.per_user_limit:
+            raise UserJobLimitError()
+        if await count_link_jobs(status='pending') >= self.max_size:
+            raise QueueFullError()
+        job_id = await enqueue_link_job(user_id, priority, payload)
+
+        idle = self.workers * self.concurrency - await count_link_jobs(status='running')
+        return max(0, await count_link_jobs_ahead(job_id) + 1 - idle)
+
+    async def start(self, bot_client):
+        """
+        启动工作进程和结果处理协程，应在事件循环中调用
+
+        :param bot_client: 入口进程的机器人客户端，用于回复执行失败的任务
+        """
+        if self._tasks:
+            return
+        self._stopping = False
+        # 上次运行时未完成的任务重新排队
+        requeued = await requeue_link_jobs(LINK_JOB_MAX_ATTEMPTS)
+        if requeued:
+            log.info(f"{requeued} 个未完成的任务已重新排队")
+        self._tasks = [asyncio.create_task(self._supervise(index)) for index in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._collect_results(bot_client)))
+        log.info(f"已启动 {self.workers} 个媒体工作进程，每个同时处理 {self.concurrency} 个请求")
+
+    async def stop(self):
+        """停止工作进程，执行中的任务在下次启动时重新排队"""
+        self._stopping = True
+        for process in self._processes.values():
+            if process.returncode is None:
+                process.terminate()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.gather(*[process.wait() for process in self._processes.values()], return_exceptions=True)
+        self._tasks = []
+        self._processes = {}
+
+    async def _supervise(self, index):
+        """运行一个工作进程，异常退出时将其执行中的任务放回队列并重新启动"""
+        worker_id = f"worker-{index}"
+        while not self._stopping:
+            process = await asyncio.create_subprocess_exec(sys.executable, WORKER_SCRIPT, str(index))
+            self._processes[index] = process
+            code = await process.wait()
+            if self._stopping:
+                return
+            requeued = await requeue_link_jobs(LINK_JOB_MAX_ATTEMPTS, worker_id)
+            log.error(f"媒体工作进程 {worker_id} 退出（返回码 {code}），{requeued} 个任务已重新排队，"
+                      f"{RESTART_DELAY} 秒后重新启动")
+            await asyncio.sleep(RESTART_DELAY)
+
+    async def _collect_results(self, bot_client):
+        """
+        处理工作进程写回的结果：成功的任务已由工作进程发送给用户，失败的任务在此回复用户
+
+        没有新结果时查询间隔逐次翻倍，直到 LINK_JOB_POLL_MAX_INTERVAL
+        """
+        interval = LINK_JOB_POLL_INTERVAL
+        while True:
+            finished = await pop_finished_link_jobs()
+            interval = LINK_JOB_POLL_INTERVAL if finished else min(interval * 2, LINK_JOB_POLL_MAX_INTERVAL)
+            for job_id, status, payload, error in finished:
+                if status != 'failed':
+                    continue
+                log.warning(f"链接任务 {job_id} 执行失败: {error}")
+                try:
+                    await bot_client.send_message(payload["chat_id"], "服务器内部错误，请联系管理员",
+                                                  reply_to=payload["message_id"])
+                except Exception as e:
+                    log.exception(f"回复执行失败的链接任务失败: {e}")
+            await asyncio.sleep(interval)
+
+
+# 入口进程共享的多进程任务队列，MEDIA_WORKERS 为 0 时不启用
+link_job_queue = LinkJobQueue(MEDIA_WORKERS, MEDIA_WORKER_CONCURRENCY, JOB_QUEUE_SIZE, JOB_USER_PENDING)
@@ -0,0 +1,101 @@
+"""
+媒体组发现模块 - 从小范围开始按需扩大获取范围，找出与消息属于同一组的全部消息
+"""
+
+import logging
+
+from config import MEDIA_GROUP_INITIAL_WINDOW, MEDIA_GROUP_CACHE_SIZE, MEDIA_GROUP_CACHE_TTL
+from .async_cache import AsyncTTLCache
+
+# 初始化日志记录器
+log = logging.getLogger("MediaGroup")
+
+# Telegram 一个媒体组最多包含的消息数
+MAX_GROUP_SIZE = 10
+
+# (聊天ID, grouped_id) -> 已确认的同组消息ID
+media_group_cache = AsyncTTLCache(MEDIA_GROUP_CACHE_SIZE, MEDIA_GROUP_CACHE_TTL, 0)
+
+
+async def _discover(client, peer, message):
+    """
+    从消息两侧逐步扩大获取范围，直到两侧边缘的消息不再属于同一组
+
+    同组消息最多 MAX_GROUP_SIZE 条且 ID 连续（中间可能有已删除的消息），
+    最小和最大的 ID 相差不超过 MAX_GROUP_SIZE - 1，超出这个跨度的 ID 不再获取。
+    """
+    grouped_id = message.grouped_id
+    members = {message.id: message}
+    # 已获取范围的左右边界（包含）
+    low = high = message.id
+    left_open = right_open = True
+    window = MEDIA_GROUP_INITIAL_WINDOW
+    while (left_open or right_open) and len(members) < MAX_GROUP_SIZE:
+        span_low = max(1, max(members) - (MAX_GROUP_SIZE - 1))
+        span_high = min(members) + (MAX_GROUP_SIZE - 1)
+        left_ids = list(range(max(span_low, low - window), low)) if left_open else []
+        right_ids = list(range(high + 1, min(span_high, high + window) + 1)) if right_open else []
+        if not left_ids:
+            left_open = False
+        if not right_ids:
+            right_open = False
+        if not left_ids and not right_ids:
+            break
+
+        fetched = await client.get_messages(peer, ids=left_ids + right_ids)
+        by_id = dict(zip(left_ids + right_ids, fetched))
+
+        # 从已知边界向外检查，遇到不属于同一组的消息时这一侧结束；已删除的消息（None）跳过
+        for ids, side in ((reversed(left_ids), "left"), (right_ids, "right")):
+            for msg_id in ids:
+                msg = by_id[msg_id]
+                if msg is None:
+                    continue
+                if msg.grouped_id != grouped_id:
+                    if side == "left":
+                        left_open = False
+                    else:
+                        right_open = False
+                    break
+                members[msg_id] = msg
+        if left_ids:
+            low = left_ids[0]
+        if right_ids:
+            high = right_ids[-1]
+        window *= 2
+
+    return [members[msg_id] for msg_id in sorted(members)]
+
+
+async def discover_media_group(client, peer, message):
+    """
+    获取与消息属于同一组的全部消息，同组消息的 ID 会被缓存，再次请求时直接按 ID 获取
+
+    :param client: Telethon 客户端
+    :param peer: 消息所在的聊天
+    :param message: 组内任意一条消息
+    :return: 按消息ID排序的同组消息列表
+    """
+    if not message.grouped_id:
+        return [message]
+
+    key = (message.chat_id, message.grouped_id)
+    discovered = []
+
+    async def load():
+        discovered.extend(await _discover(client, peer, message))
+        return tuple(msg.id for msg in discovered)
+
+    ids = await media_group_cache.get(key, load)
+    if discovered:
+        return discovered
+
+    messages = await client.get_messages(peer, ids=list(ids))
+    group = [msg for msg in messages if msg and msg.grouped_id == message.grouped_id]
+    if len(group) == len(ids):
+        return group
+
+    # 缓存的组成员已变化（例如有消息被删除），重新发现
+    log.info(f"媒体组 {message.grouped_id} 的缓存已失效，重新获取")
+    media_group_cache.invalidate(key)
+    return await discover_media_group(client, peer, message)
@@ -0,0 +1,147 @@
+"""
+媒体传输模块 - 负责将 user_client 下载的媒体直接转存到 bot_client
+"""
+
+import asyncio
+import logging
+import os
+
+from telethon import utils
+from telethon.tl.types import (
+    DocumentAttributeFilename, MessageMediaDocument, MessageMediaPhoto,
+    PhotoSize, PhotoSizeProgressive, PhotoCachedSize
+)
+
+from config import STREAM_BUFFER_PARTS, PARALLEL_UPLOAD_CONNECTIONS
+from db.aio import delete_transfer_journal
+from .buffer_pool import buffer_pool
+from .parallel_transfer import (
+    ParallelUploader, iter_download_parallel, should_download_parallel, should_upload_parallel,
+    download_message_media, upload_file_parallel, resume_on_disconnect
+)
+from .spool import spool
+
+# 初始化日志记录器
+log = logging.getLogger("MediaTransfer")
+
+# 下载结束标记
+_STREAM_END = object()
+
+
+def get_document_file_name(document):
+    """获取文档的文件名，没有文件名属性时根据 mime_type 生成"""
+    for attr in document.attributes:
+        if isinstance(attr, DocumentAttributeFilename) and attr.file_name:
+            return attr.file_name
+    return f"{document.id}{utils.get_extension(document)}"
+
+
+def get_media_size(message):
+    """获取消息中媒体的字节数，照片取最大尺寸，无法确定时返回0"""
+    if isinstance(message.media, MessageMediaDocument) and message.media.document:
+        return message.media.document.size
+    if isinstance(message.media, MessageMediaPhoto) and message.media.photo:
+        sizes = [0]
+        for size in message.media.photo.sizes:
+            if isinstance(size, PhotoSize):
+                sizes.append(size.size)
+            elif isinstance(size, PhotoSizeProgressive):
+                sizes.append(max(size.sizes))
+            elif isinstance(size, PhotoCachedSize):
+                sizes.append(len(size.bytes))
+        return max(sizes)
+    return 0
+
+
+async def _stream_document(user_client, bot_client, document, part_size, file_name):
+    file_size = document.size
+    # 有界缓冲区，上传跟不上时下载会在此处等待
+    queue = asyncio.Queue(maxsize=STREAM_BUFFER_PARTS)
+    # 大文件通过多条连接并行上传，其余使用 bot_client 自身的连接
+    connections = PARALLEL_UPLOAD_CONNECTIONS if should_upload_parallel(file_size) else 1
+
+    download_task = None
+    try:
+        async with ParallelUploader(bot_client, file_size, file_name, part_size=part_size,
+                                    connections=connections, resume_key=document.id) as uploader:
+            # 续传时只需下载尚未上传的分片
+            part_index = uploader.completed_parts
+            if should_download_parallel(document):
+                # 大文件通过多条连接并行下载
+                chunks = iter_download_parallel(user_client, document, part_size=part_size, start_part=part_index)
+            else:
+                chunks = user_client.iter_download(document, offset=part_index * part_size, request_size=part_size,
+                                                   file_size=file_size)
+
+            async def download_parts():
+                try:
+                    async for chunk in chunks:
+                        await queue.put(chunk)
+                    await queue.put(_STREAM_END)
+                except Exception as e:
+                    await queue.put(e)
+
+            download_task = asyncio.create_task(download_parts())
+            while True:
+                chunk = await queue.get()
+                if chunk is _STREAM_END:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                await uploader.upload_part(part_index, chunk)
+                part_index += 1
+            uploaded_file = await uploader.finish()
+    finally:
+        if download_task:
+            download_task.cancel()
+
+    log.info(f"流式转存完成: {file_name}，大小 {file_size} 字节，共 {uploader.part_count} 个分片")
+    return uploaded_file
+
+
+async def stream_document(user_client, bot_client, document):
+    """
+    流式转存文档：user_client 下载的分片经有界内存缓冲区直接上传给 bot_client，不落盘
+
+    大文件的上传进度写入传输记录，网络中断或重启后再次转存同一文档时从已上传的分片继续。
+
+    :param user_client: 用于下载的用户客户端
+    :param bot_client: 用于上传的机器人客户端
+    :param document: 要转存的文档（Document）
+    :return: 已上传文件的句柄，大于10MB时为InputFileBig，否则为InputFile
+    """
+    # 下载和上传使用相同的分片大小，保证一个下载分片正好对应一个上传分片
+    part_size = utils.get_appropriated_part_size(document.size) * 1024
+    file_name = get_document_file_name(document)
+    return await resume_on_disconnect(
+        lambda: _stream_document(user_client, bot_client, document, part_size, file_name),
+        f"流式转存 {file_name}")
+
+
+async def transfer_message_media(user_client, bot_client, message, file_name):
+    """
+    下载消息中的媒体并上传给 bot_client：小文件使用内存缓冲区，大文件经临时文件池落盘，中断后可续传
+
+    :param user_client: 用于下载的用户客户端
+    :param bot_client: 用于上传的机器人客户端
+    :param message: 包含照片或文档的消息
+    :param file_name: 上传时使用的文件名，照片需要以图片扩展名结尾
+    :return: 已上传文件的句柄
+    """
+    size = get_media_size(message)
+    if buffer_pool.accepts(size):
+        async with buffer_pool.acquire() as buffer:
+            await user_client.download_media(message, file=buffer)
+            file_size = buffer.tell()
+            buffer.seek(0)
+            return await bot_client.upload_file(buffer, file_size=file_size, file_name=file_name)
+
+    # 按文件大小申请临时文件空间，文档使用固定的工作目录，传输中断时保留已下载的部分用于续传
+    document = message.media.document if isinstance(message.media, MessageMediaDocument) else None
+    resume_key = document.id if document else None
+    async with spool.reserve(size, key=f"document_{resume_key}" if document else None) as work_dir:
+        file_path = await download_message_media(user_client, message, os.path.join(work_dir, file_name))
+        uploaded_file = await upload_file_parallel(bot_client, file_path, resume_key=resume_key)
+    if document:
+        await delete_transfer_journal(document.id, 'download')
+    return uploaded_file
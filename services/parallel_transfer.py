@@ -0,0 +1,421 @@
+"""
+并行传输模块 - 通过多条到指定DC的连接并发下载、上传文件分片
+"""
+
+import asyncio
+import collections
+import copy
+import hashlib
+import logging
+import os
+
+import aiofiles
+from telethon import helpers, utils
+from telethon.errors import FloodWaitError, ServerError, TimedOutError
+from telethon.network import MTProtoSender
+from telethon.tl.alltlobjects import LAYER
+from telethon.tl.functions import InvokeWithLayerRequest
+from telethon.tl.functions.auth import ExportAuthorizationRequest, ImportAuthorizationRequest
+from telethon.tl.functions.help import GetConfigRequest
+from telethon.tl.functions.upload import GetFileRequest, SaveBigFilePartRequest, SaveFilePartRequest
+from telethon.tl.types import MessageMediaDocument, InputFile, InputFileBig
+from telethon.tl.types.upload import FileCdnRedirect
+
+from config import (
+    PARALLEL_DOWNLOAD_CONNECTIONS, PARALLEL_DOWNLOAD_MIN_SIZE,
+    PARALLEL_UPLOAD_CONNECTIONS, PARALLEL_UPLOAD_MIN_SIZE,
+    TRANSFER_JOURNAL_TTL, TRANSFER_RESUME_RETRIES
+)
+from db.aio import get_transfer_journal, save_transfer_progress, delete_transfer_journal
+
+# 初始化日志记录器
+log = logging.getLogger("ParallelTransfer")
+
+# 并行下载使用的分片大小，能整除1MB，满足 upload.getFile 的偏移量要求
+PARALLEL_PART_SIZE = 512 * 1024
+
+# 单个分片的最大重试次数
+MAX_PART_RETRIES = 5
+
+# Telegram 区分大文件和小文件的界限（10MB）
+BIG_FILE_SIZE = 10 * 1024 * 1024
+
+# 每连续完成多少个分片写一次传输记录
+JOURNAL_FLUSH_PARTS = 8
+
+# 已导出到其他DC的授权密钥，按 (客户端, dc_id) 缓存，避免每次下载都重新导出授权
+_exported_auth_keys = {}
+
+
+class SenderPool:
+    """到同一个DC的一组独立 MTProtoSender 连接"""
+
+    def __init__(self, client, dc_id, connections):
+        self.client = client
+        self.dc_id = dc_id
+        self.connections = connections
+        self.senders = []
+        self._idle = asyncio.Queue()
+
+    def _init_connection(self, query):
+        """基于客户端的 InitConnection 参数构造新连接的初始化请求，不修改客户端自身的状态"""
+        init_request = copy.copy(self.client._init_request)
+        init_request.query = query
+        return InvokeWithLayerRequest(LAYER, init_request)
+
+    async def _create_sender(self):
+        """创建一条新连接，必要时将当前账号的授权导出到目标DC"""
+        dc = await self.client._get_dc(self.dc_id)
+        if self.dc_id == self.client.session.dc_id:
+            auth_key = self.client.session.auth_key
+        else:
+            auth_key = _exported_auth_keys.get((id(self.client), self.dc_id))
+
+        sender = MTProtoSender(auth_key, loggers=self.client._log)
+        await sender.connect(self.client._connection(
+            dc.ip_address,
+            dc.port,
+            dc.id,
+            loggers=self.client._log,
+            proxy=self.client._proxy,
+            local_addr=self.client._local_addr
+        ))
+        if auth_key:
+            await sender.send(self._init_connection(GetConfigRequest()))
+        else:
+            log.info(f"为并行传输导出授权到 DC {self.dc_id}")
+            auth = await self.client(ExportAuthorizationRequest(self.dc_id))
+            await sender.send(self._init_connection(ImportAuthorizationRequest(id=auth.id, bytes=auth.bytes)))
+            _exported_auth_keys[(id(self.client), self.dc_id)] = sender.auth_key
+        return sender
+
+    async def connect(self):
+        """建立所有连接，第一条连接负责导出授权，其余连接复用该授权"""
+        first = await self._create_sender()
+        others = await asyncio.gather(
+            *[self._create_sender() for _ in range(self.connections - 1)],
+            return_exceptions=True
+        )
+        for sender in [first, *others]:
+            if isinstance(sender, Exception):
+                log.warning(f"建立到 DC {self.dc_id} 的并行连接失败: {sender}")
+                continue
+            self.senders.append(sender)
+            self._idle.put_nowait(sender)
+
+    async def disconnect(self):
+        """断开所有连接"""
+        await asyncio.gather(*[sender.disconnect() for sender in self.senders], return_exceptions=True)
+        self.senders.clear()
+
+    async def send(self, request):
+        """从空闲连接中取一条发送请求，发送完成后归还"""
+        sender = await self._idle.get()
+        try:
+            return await sender.send(request)
+        finally:
+            self._idle.put_nowait(sender)
+
+
+class ClientSender:
+    """与 SenderPool 接口一致，直接使用客户端自身的连接发送请求"""
+
+    def __init__(self, client):
+        self.client = client
+        self.dc_id = client.session.dc_id
+        self.senders = [client]
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def send(self, request):
+        return await self.client(request)
+
+
+async def _send_with_retry(pool, request, description):
+    """通过连接池发送请求，遇到 FloodWait 时等待后重试，遇到网络或服务器错误时退避重试"""
+    for attempt in range(1, MAX_PART_RETRIES + 1):
+        try:
+            return await pool.send(request)
+        except FloodWaitError as e:
+            log.warning(f"{description} 触发 FloodWait，等待 {e.seconds} 秒")
+            await asyncio.sleep(e.seconds)
+        except (ConnectionError, asyncio.TimeoutError, ServerError, TimedOutError) as e:
+            if attempt == MAX_PART_RETRIES:
+                raise
+            log.warning(f"{description} 失败（第 {attempt} 次）: {e}")
+            await asyncio.sleep(attempt)
+    raise RuntimeError(f"{description} 多次重试后仍然失败")
+
+
+async def _fetch_part(pool, location, offset, limit):
+    """下载单个分片"""
+    result = await _send_with_retry(pool, GetFileRequest(location, offset, limit), f"下载分片 offset={offset}")
+    if isinstance(result, FileCdnRedirect):
+        raise RuntimeError("文件位于CDN，不支持并行下载")
+    return result.bytes
+
+
+async def resume_on_disconnect(transfer, description):
+    """
+    传输因网络中断失败时自动重试，依靠传输记录从已完成的分片继续
+
+    :param transfer: 执行一次完整传输的协程函数
+    :param description: 日志中的传输描述
+    """
+    for attempt in range(1, TRANSFER_RESUME_RETRIES + 1):
+        try:
+            return await transfer()
+        except (ConnectionError, asyncio.TimeoutError, ServerError, TimedOutError) as e:
+            if attempt >= TRANSFER_RESUME_RETRIES:
+                raise
+            log.warning(f"{description} 中断（第 {attempt} 次），从已完成的分片继续: {e}")
+            await asyncio.sleep(attempt)
+
+
+async def iter_download_parallel(client, document, part_size=PARALLEL_PART_SIZE,
+                                 connections=PARALLEL_DOWNLOAD_CONNECTIONS, start_part=0):
+    """
+    通过多条连接并发下载文档，按顺序产出分片
+
+    :param client: 用于下载的客户端
+    :param document: 要下载的文档（Document）
+    :param part_size: 分片大小，必须能整除1MB且是4KB的倍数
+    :param connections: 并发连接数
+    :param start_part: 从第几个分片开始下载，用于续传
+    """
+    dc_id, location = utils.get_input_location(document)
+    file_size = document.size
+    part_count = (file_size + part_size - 1) // part_size
+
+    pool = SenderPool(client, dc_id, connections)
+    await pool.connect()
+    if not pool.senders:
+        raise ConnectionError(f"无法建立到 DC {dc_id} 的连接")
+
+    # 滑动窗口：同时只保留有限个未完成的分片，保证内存占用有上限
+    window = len(pool.senders) * 2
+    pending = collections.deque()
+    next_part = start_part
+    try:
+        while next_part < part_count or pending:
+            while next_part < part_count and len(pending) < window:
+                pending.append(asyncio.create_task(
+                    _fetch_part(pool, location, next_part * part_size, part_size)))
+                next_part += 1
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+        await pool.disconnect()
+
+
+def should_download_parallel(document):
+    """判断文档是否足够大，值得使用并行下载"""
+    return PARALLEL_DOWNLOAD_CONNECTIONS > 1 and document.size >= PARALLEL_DOWNLOAD_MIN_SIZE
+
+
+async def _download_document(client, document, file):
+    """分片下载文档到指定路径，进度写入传输记录，已有记录且文件仍在时从已完成的分片继续"""
+    parallel = should_download_parallel(document)
+    part_size = PARALLEL_PART_SIZE if parallel else utils.get_appropriated_part_size(document.size) * 1024
+
+    start_part = 0
+    journal = await get_transfer_journal(document.id, 'download', TRANSFER_JOURNAL_TTL)
+    if journal and journal[1] == part_size and os.path.exists(file):
+        # 以实际写入磁盘的数据为准
+        start_part = min(journal[2], os.path.getsize(file) // part_size)
+        if start_part:
+            log.info(f"续传下载文档 {document.id}，从第 {start_part} 个分片开始")
+
+    if parallel:
+        chunks = iter_download_parallel(client, document, part_size=part_size, start_part=start_part)
+    else:
+        chunks = client.iter_download(document, offset=start_part * part_size, request_size=part_size,
+                                      file_size=document.size)
+
+    part_index = start_part
+    async with aiofiles.open(file, 'r+b' if start_part else 'wb') as f:
+        await f.seek(start_part * part_size)
+        await f.truncate()
+        try:
+            async for chunk in chunks:
+                await f.write(chunk)
+                part_index += 1
+                if (part_index - start_part) % JOURNAL_FLUSH_PARTS == 0:
+                    await f.flush()
+                    await save_transfer_progress(document.id, 'download', None, part_size, part_index)
+        except BaseException:
+            # 中断时记录已写入的分片，下次从这里继续
+            await f.flush()
+            await save_transfer_progress(document.id, 'download', None, part_size, part_index)
+            raise
+    # 下载完成后仍保留记录，后续上传失败时无需重新下载，由调用方在整个传输完成后删除
+    await save_transfer_progress(document.id, 'download', None, part_size, part_index)
+    return file
+
+
+async def download_message_media(client, message, file):
+    """
+    下载消息中的媒体到指定路径，文档分片下载并支持续传（大文档使用并行下载），其余使用客户端自带的下载
+
+    :param client: 用于下载的客户端
+    :param message: 包含媒体的消息
+    :param file: 保存路径
+    :return: 保存路径
+    """
+    if not isinstance(message.media, MessageMediaDocument):
+        return await client.download_media(message, file=file)
+
+    document = message.media.document
+    return await resume_on_disconnect(lambda: _download_document(client, document, file), f"下载文档 {document.id}")
+
+
+class ParallelUploader:
+    """
+    通过多条连接并发上传同一个文件的分片，得到与 client.upload_file 相同的文件句柄
+
+    传入 resume_key 时大文件的上传进度写入传输记录，再次上传同一文件时沿用原来的 file_id，
+    从 completed_parts 开始提交分片即可续传（服务器会保留已上传的分片一段时间）。
+    """
+
+    def __init__(self, client, file_size, file_name, part_size=None, connections=PARALLEL_UPLOAD_CONNECTIONS,
+                 resume_key=None):
+        self.client = client
+        self.file_size = file_size
+        self.file_name = file_name
+        self.part_size = part_size or utils.get_appropriated_part_size(file_size) * 1024
+        self.part_count = (file_size + self.part_size - 1) // self.part_size
+        self.is_big = file_size > BIG_FILE_SIZE
+        self.file_id = helpers.generate_random_long()
+        # 小文件需要完整内容的MD5，无法续传
+        self.resume_key = resume_key if self.is_big else None
+        # 已连续上传完成的分片数，续传时从这里开始提交
+        self.completed_parts = 0
+        self._start_part = 0
+        self._flushed_parts = 0
+        self._done = set()
+        self._hash_md5 = hashlib.md5()
+        if connections > 1:
+            self._pool = SenderPool(client, client.session.dc_id, connections)
+        else:
+            self._pool = ClientSender(client)
+        # 同时在途的分片数与连接数一致，保证内存占用有上限
+        self._slots = asyncio.Semaphore(connections)
+        self._tasks = []
+
+    async def __aenter__(self):
+        if self.resume_key:
+            journal = await get_transfer_journal(self.resume_key, 'upload', TRANSFER_JOURNAL_TTL)
+            if journal and journal[1] == self.part_size and journal[2] < self.part_count:
+                self.file_id, _, self.completed_parts = journal
+                self._start_part = self._flushed_parts = self.completed_parts
+                log.info(f"续传上传 {self.file_name}，从第 {self.completed_parts} 个分片开始")
+        await self._pool.connect()
+        if not self._pool.senders:
+            raise ConnectionError(f"无法建立到 DC {self._pool.dc_id} 的连接")
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for task in self._tasks:
+            task.cancel()
+        await self._pool.disconnect()
+        if exc_type and self.resume_key:
+            # 中断时记录已完成的分片，下次从这里继续
+            await self._save_progress()
+
+    async def _save_progress(self):
+        # 先记录已写入的分片数，等待写入期间完成的分片不会重复触发写入
+        self._flushed_parts = self.completed_parts
+        await save_transfer_progress(self.resume_key, 'upload', self.file_id, self.part_size, self._flushed_parts)
+
+    async def _part_done(self, part_index):
+        """记录完成的分片，推进连续完成的分片数"""
+        self._done.add(part_index)
+        while self.completed_parts in self._done:
+            self._done.remove(self.completed_parts)
+            self.completed_parts += 1
+        if self.resume_key and self.completed_parts - self._flushed_parts >= JOURNAL_FLUSH_PARTS:
+            await self._save_progress()
+
+    async def _upload_part(self, part_index, data):
+        try:
+            if self.is_big:
+                request = SaveBigFilePartRequest(self.file_id, part_index, self.part_count, data)
+            else:
+                request = SaveFilePartRequest(self.file_id, part_index, data)
+            if not await _send_with_retry(self._pool, request, f"上传分片 {part_index}"):
+                raise RuntimeError(f"上传文件分片 {part_index} 失败")
+            await self._part_done(part_index)
+        finally:
+            self._slots.release()
+
+    async def upload_part(self, part_index, data):
+        """
+        提交一个分片，分片必须按顺序提交（小文件需要按顺序计算MD5），上传本身是并发进行的
+
+        :param part_index: 分片序号
+        :param data: 分片内容
+        """
+        # 已失败的分片尽早抛出异常
+        for task in self._tasks:
+            if task.done() and task.exception():
+                raise task.exception()
+        if not self.is_big:
+            self._hash_md5.update(data)
+        await self._slots.acquire()
+        self._tasks.append(asyncio.create_task(self._upload_part(part_index, data)))
+
+    async def finish(self):
+        """
+        等待所有分片上传完成
+
+        :return: 大于10MB时为InputFileBig，否则为InputFile
+        """
+        await asyncio.gather(*self._tasks)
+        if self._start_part + len(self._tasks) != self.part_count:
+            raise RuntimeError(
+                f"文件分片数量不一致: 已上传 {self._start_part + len(self._tasks)}，预期 {self.part_count}")
+        if self.resume_key:
+            await delete_transfer_journal(self.resume_key, 'upload')
+        if self.is_big:
+            return InputFileBig(self.file_id, self.part_count, self.file_name)
+        return InputFile(self.file_id, self.part_count, self.file_name, self._hash_md5.hexdigest())
+
+
+def should_upload_parallel(file_size):
+    """判断文件是否足够大，值得使用并行上传"""
+    return PARALLEL_UPLOAD_CONNECTIONS > 1 and file_size >= PARALLEL_UPLOAD_MIN_SIZE
+
+
+async def _upload_file(client, file_path, file_size, resume_key):
+    connections = PARALLEL_UPLOAD_CONNECTIONS if should_upload_parallel(file_size) else 1
+    async with ParallelUploader(client, file_size, os.path.basename(file_path), connections=connections,
+                                resume_key=resume_key) as uploader:
+        async with aiofiles.open(file_path, 'rb') as f:
+            # 续传时跳过已上传的分片
+            await f.seek(uploader.completed_parts * uploader.part_size)
+            for part_index in range(uploader.completed_parts, uploader.part_count):
+                await uploader.upload_part(part_index, await f.read(uploader.part_size))
+        return await uploader.finish()
+
+
+async def upload_file_parallel(client, file_path, resume_key=None):
+    """
+    上传本地文件，大文件并发上传分片，其余使用客户端自带的上传
+
+    :param client: 用于上传的客户端
+    :param file_path: 本地文件路径
+    :param resume_key: 续传记录的键（通常是文档ID），传入时超过10MB的文件支持中断后续传
+    :return: 已上传文件的句柄
+    """
+    file_size = os.path.getsize(file_path)
+    resumable = resume_key is not None and file_size > BIG_FILE_SIZE
+    if not should_upload_parallel(file_size) and not resumable:
+        return await client.upload_file(file_path)
+
+    return await resume_on_disconnect(lambda: _upload_file(client, file_path, file_size, resume_key),
+                                      f"上传文件 {os.path.basename(file_path)}")
@@ -0,0 +1,196 @@
+"""
+请求限流模块 - 按 RPC 方法和目标聊天分别限流，遇到 FloodWait 时只暂停受影响的令牌桶
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+
+from telethon import TelegramClient, utils
+from telethon.errors import FloodWaitError, SlowModeWaitError
+
+from config import (
+    RATE_LIMIT_METHOD_RATE, RATE_LIMIT_METHOD_BURST, RATE_LIMIT_PEER_RATE, RATE_LIMIT_PEER_BURST,
+    RATE_LIMIT_MAX_WAIT, RATE_LIMIT_MAX_BUCKETS
+)
+
+# 初始化日志记录器
+log = logging.getLogger("RateLimiter")
+
+# 触发 FloodWait 后速率最多降低到默认值的比例
+MIN_RATE_FACTOR = 0.1
+# 每次请求成功后速率向默认值恢复的比例
+RECOVER_FACTOR = 0.05
+# 请求中表示目标聊天的参数
+PEER_ATTRIBUTES = ("peer", "channel", "to_peer", "from_peer")
+# 文件分片的下载和上传不限流，传输速度由传输准入控制和并行连接数决定
+EXEMPT_METHODS = {"GetFileRequest", "GetCdnFileRequest", "SaveFilePartRequest", "SaveBigFilePartRequest"}
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    按 rate 个/秒补充令牌，最多积攒 burst 个。触发 FloodWait 后暂停到指定时间并将速率减半，
+    之后每次成功的请求逐渐恢复速率。剩余暂停时间超过 RATE_LIMIT_MAX_WAIT 秒时不等待，直接抛出同样的错误。
+    """
+
+    def __init__(self, rate, burst):
+        self.default_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        # 暂停的原因，FloodWaitError 或 SlowModeWaitError
+        self.blocked_error = FloodWaitError
+        self._lock = asyncio.Lock()
+
+    @property
+    def blocked(self):
+        return time.monotonic() < self.blocked_until
+
+    def _check_wait(self, request):
+        """剩余暂停时间超过 RATE_LIMIT_MAX_WAIT 秒时抛出暂停的原因，不排队等待"""
+        remaining = self.blocked_until - time.monotonic()
+        if remaining > RATE_LIMIT_MAX_WAIT:
+            raise self.blocked_error(request, capture=math.ceil(remaining))
+
+    async def acquire(self, request=None):
+        """
+        取一个令牌，没有令牌或处于暂停中时等待
+
+        :param request: 当前的请求，用于抛出的错误信息
+        :raises FloodWaitError: 剩余暂停时间超过 RATE_LIMIT_MAX_WAIT 秒
+        :raises SlowModeWaitError: 同上，暂停由慢速模式引起
+        """
+        self._check_wait(request)
+        async with self._lock:
+            while True:
+                self._check_wait(request)
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def slow_down(self):
+        """速率减半，不低于默认值的 MIN_RATE_FACTOR"""
+        self.rate = max(self.default_rate * MIN_RATE_FACTOR, self.rate / 2)
+
+    def flood(self, seconds, error=FloodWaitError):
+        """
+        触发 FloodWait，暂停 seconds 秒并降低速率
+
+        :param error: 暂停期间超过等待上限的请求抛出的错误类型
+        """
+        blocked_until = time.monotonic() + seconds
+        if blocked_until > self.blocked_until:
+            self.blocked_until = blocked_until
+            self.blocked_error = error
+        self.slow_down()
+        self.tokens = 0
+
+    def success(self):
+        """请求成功，速率逐渐恢复"""
+        if self.rate < self.default_rate:
+            self.rate = min(self.default_rate, self.rate + self.default_rate * RECOVER_FACTOR)
+
+
+class RateLimiter:
+    """
+    一个账号的请求限流器
+
+    每个 RPC 方法有一个令牌桶；请求指定了目标聊天时，(方法, 聊天) 另有一个令牌桶。
+    FloodWait 暂停最具体的那个令牌桶：有目标聊天时只暂停该聊天上的这个方法，其他聊天不受影响；
+    方法本身的令牌桶同时降低速率，但不暂停。
+    """
+
+    def __init__(self):
+        # 键 -> 令牌桶，按最近使用排序，超出上限时淘汰最久未使用且未暂停的
+        self._buckets = OrderedDict()
+
+    def _bucket(self, key, rate, burst):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, burst)
+            self._evict()
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self):
+        for key in list(self._buckets):
+            if len(self._buckets) <= RATE_LIMIT_MAX_BUCKETS:
+                break
+            bucket = self._buckets[key]
+            if not bucket.blocked and not bucket._lock.locked():
+                del self._buckets[key]
+
+    def buckets(self, request):
+        """
+        请求对应的令牌桶
+
+        :return: (方法的令牌桶, (方法, 聊天) 的令牌桶或 None)
+        """
+        method = type(request).__name__
+        method_bucket = self._bucket(method, RATE_LIMIT_METHOD_RATE, RATE_LIMIT_METHOD_BURST)
+        for name in PEER_ATTRIBUTES:
+            peer = getattr(request, name, None)
+            if peer is None:
+                continue
+            try:
+                peer_id = utils.get_peer_id(peer)
+            except (TypeError, ValueError):
+                continue
+            return method_bucket, self._bucket((method, peer_id), RATE_LIMIT_PEER_RATE, RATE_LIMIT_PEER_BURST)
+        return method_bucket, None
+
+
+class RateLimitedClient(TelegramClient):
+    """
+    带请求限流的客户端
+
+    所有请求先从令牌桶取令牌；FloodWait 不超过 RATE_LIMIT_MAX_WAIT 秒时暂停对应的令牌桶并在恢复后重试，
+    同一令牌桶上的其他请求一起等待，而不是继续请求延长封禁时间。
+    超过时直接抛出，令牌桶记录解除时间，封禁期间同一令牌桶上的请求也立即抛出，不排队等待。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = RateLimiter()
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        # 批量请求和文件分片直接发送
+        if utils.is_list_like(request) or type(request).__name__ in EXEMPT_METHODS:
+            return await super()._call(sender, request, ordered, flood_sleep_threshold)
+
+        method_bucket, peer_bucket = self.rate_limiter.buckets(request)
+        while True:
+            await method_bucket.acquire(request)
+            if peer_bucket:
+                await peer_bucket.acquire(request)
+            try:
+                # 不使用 Telethon 自带的等待，FloodWait 由令牌桶统一处理
+                result = await super()._call(sender, request, ordered, 0)
+            except (FloodWaitError, SlowModeWaitError) as e:
+                if peer_bucket:
+                    peer_bucket.flood(e.seconds, type(e))
+                    method_bucket.slow_down()
+                else:
+                    method_bucket.flood(e.seconds, type(e))
+                if e.seconds > RATE_LIMIT_MAX_WAIT:
+                    raise
+                log.warning(f"{type(request).__name__} 触发 FloodWait，暂停 {e.seconds} 秒后重试")
+                continue
+            method_bucket.success()
+            if peer_bucket:
+                peer_bucket.success()
+            return result
@@ -0,0 +1,60 @@
+"""
+会话存储模块 - 将 StringSession 迁移到 SQLite 会话文件，重启后保留实体、access_hash 和更新状态
+"""
+
+import logging
+import os
+
+from telethon.sessions import SQLiteSession, StringSession
+
+from config import SESSION_STORE, SESSION_DIR
+
+# 初始化日志记录器
+log = logging.getLogger("SessionStore")
+
+
+def migrate_string_session(session_string, path):
+    """
+    用 StringSession 初始化 SQLite 会话文件
+
+    会话文件中的授权密钥与 StringSession 一致时直接使用，保留其中缓存的实体和更新状态；
+    不一致（会话文件不存在，或重新登录/更换了账号）时删除旧文件，用 StringSession 的数据中心和授权密钥重新创建。
+
+    :param session_string: 环境变量中的会话字符串
+    :param path: 会话文件路径，不带 .session 扩展名
+    :return: SQLiteSession
+    """
+    seed = StringSession(session_string)
+    if seed.auth_key is None:
+        raise ValueError("会话字符串中没有授权密钥")
+
+    session = SQLiteSession(path)
+    if session.auth_key and session.auth_key.key == seed.auth_key.key and session.dc_id == seed.dc_id:
+        return session
+
+    if session.auth_key:
+        log.warning(f"会话文件 {session.filename} 与会话字符串不一致，重新创建")
+        session.close()
+        session.delete()
+        session = SQLiteSession(path)
+
+    session.set_dc(seed.dc_id, seed.server_address, seed.port)
+    session.auth_key = seed.auth_key
+    session.save()
+    log.info(f"已将会话字符串迁移到会话文件 {session.filename}")
+    return session
+
+
+def open_session(session_string, name):
+    """
+    创建客户端使用的会话
+
+    :param session_string: 环境变量中的会话字符串
+    :param name: 会话文件名，每个客户端使用不同的名字
+    :return: SESSION_STORE 为 sqlite 时返回持久化的 SQLiteSession，否则返回 StringSession
+    """
+    if SESSION_STORE != "sqlite":
+        return StringSession(session_string)
+    if SESSION_DIR:
+        os.makedirs(SESSION_DIR, exist_ok=True)
+    return migrate_string_session(session_string, os.path.join(SESSION_DIR, name))
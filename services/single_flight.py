@@ -0,0 +1,134 @@
+"""
+请求合并模块 - 同一条消息同时只由一个请求转存，其他相同的请求等待其完成后直接使用归档结果
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+
+from config import FLIGHT_LOCK_DIR
+
+# 初始化日志记录器
+log = logging.getLogger("SingleFlight")
+
+# 其他进程正在执行时重新查询结果的间隔（秒），其他进程完成时不会通知本进程
+RECHECK_INTERVAL = 1
+
+
+class SingleFlight:
+    """
+    按键合并的任务标记
+
+    用法：调用 lookup_or_claim(key, lookup)，等待键上的任务结束后查询结果；没有结果时声明由当前请求执行，
+    完成后在 finally 中调用 release(key, flight)。已有结果的请求不需要声明，可以同时进行。
+    查询结果期间其他请求可能已经声明，此时重新等待并查询，同一时间每个键只有一个请求执行。
+    指定 lock_dir 时声明还需要取得键对应的锁文件，多个进程之间也只有一个请求执行，其他进程的请求定期重新查询。
+    """
+
+    def __init__(self, lock_dir=None):
+        self.lock_dir = lock_dir
+        # 键 -> 正在执行的任务结束时触发的事件
+        self._flights = {}
+        # 键 -> 本进程持有的锁文件描述符
+        self._locks = {}
+
+    def in_flight(self, key):
+        """键上是否有正在执行的任务"""
+        return key in self._flights
+
+    async def wait(self, key):
+        """
+        等待键上正在执行的任务结束
+
+        :return: 是否等待过
+        """
+        waited = False
+        while key in self._flights:
+            if not waited:
+                log.info(f"相同的请求正在处理，等待完成: {key}")
+            waited = True
+            await self._flights[key].wait()
+        return waited
+
+    def _lock_path(self, key):
+        name = "_".join(map(str, key)) if isinstance(key, tuple) else str(key)
+        return os.path.join(self.lock_dir, f"{name}.lock")
+
+    def _try_lock(self, key):
+        """尝试取得键对应的锁文件，返回文件描述符；已被其他进程锁定时返回 None"""
+        os.makedirs(self.lock_dir, exist_ok=True)
+        path = self._lock_path(key)
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+            # 持有锁的进程释放时会删除锁文件，取得的可能是已被删除的文件，此时重新打开
+            try:
+                if os.fstat(fd).st_ino == os.stat(path).st_ino:
+                    return fd
+            except FileNotFoundError:
+                pass
+            os.close(fd)
+
+    def try_claim(self, key):
+        """
+        声明由当前请求执行任务
+
+        :return: 任务标记，传给 release；键上已有正在执行的任务（包括其他进程中的）时返回 None
+        """
+        if key in self._flights:
+            return None
+        if self.lock_dir is not None:
+            fd = self._try_lock(key)
+            if fd is None:
+                return None
+            self._locks[key] = fd
+        flight = asyncio.Event()
+        self._flights[key] = flight
+        return flight
+
+    async def lookup_or_claim(self, key, lookup):
+        """
+        等待键上正在执行的任务结束后查询结果，没有结果时声明由当前请求执行
+
+        :param lookup: 无参数的协程函数，返回已有的结果，没有结果时返回假值
+        :return: (结果, 任务标记)，有结果时任务标记为 None，否则结果为 None
+        """
+        remote = False
+        while True:
+            await self.wait(key)
+            result = await lookup()
+            if result:
+                return result, None
+            # 查询期间其他请求可能已经声明，声明失败时等待其完成后重新查询
+            flight = self.try_claim(key)
+            if flight:
+                return None, flight
+            if not self.in_flight(key):
+                # 其他进程正在执行，定期重新查询
+                if not remote:
+                    log.info(f"相同的请求正在其他进程中处理，等待完成: {key}")
+                remote = True
+                await asyncio.sleep(RECHECK_INTERVAL)
+
+    def release(self, key, flight):
+        """任务结束，唤醒等待同一个键的请求"""
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+            fd = self._locks.pop(key, None)
+            if fd is not None:
+                # 先删除再解锁：其他进程在删除前打开的旧文件，取得锁后会发现已被删除并重新打开
+                try:
+                    os.remove(self._lock_path(key))
+                except FileNotFoundError:
+                    pass
+                os.close(fd)
+        flight.set()
+
+
+# 共享的消息转存任务标记，键为 (源聊天ID, 消息ID或grouped_id, 'single'/'group')，媒体工作进程之间通过锁文件互斥
+archive_flight = SingleFlight(FLIGHT_LOCK_DIR)
@@ -0,0 +1,297 @@
+"""
+临时文件池模块 - 统一管理传输过程中落盘的临时文件，限制总占用空间
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+
+from config import SPOOL_DIR, SPOOL_MAX_BYTES, TRANSFER_JOURNAL_TTL
+
+# 初始化日志记录器
+log = logging.getLogger("Spool")
+
+# 可续传的工作目录名前缀
+RESUMABLE_PREFIX = "resume_"
+# 工作目录中的锁文件：使用中的目录由其所属进程持有排他锁，文件内容为申请的字节数
+LOCK_NAME = ".lock"
+# 整个临时文件池的锁文件，多个进程申请、淘汰和清理工作目录时互斥
+POOL_LOCK_NAME = ".spool.lock"
+# 空间不足时重新检查的间隔（秒），其他进程释放空间时不会通知本进程
+RECHECK_INTERVAL = 1
+
+
+def _entry_size(path):
+    """统计文件或目录占用的字节数"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _entry_mtime(path):
+    """文件或目录最近一次写入的时间，目录取其中最新的文件"""
+    mtime = os.path.getmtime(path)
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    mtime = max(mtime, os.path.getmtime(os.path.join(root, name)))
+                except OSError:
+                    pass
+    return mtime
+
+
+def _remove_entry(path):
+    """删除文件或目录"""
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _try_lock(path):
+    """尝试取得文件的排他锁，返回文件描述符；已被其他进程或本进程的其他传输锁定时返回 None"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _probe(path):
+    """
+    检查工作目录是否正在被某个传输使用
+
+    :return: (锁, 申请的字节数)。使用中时锁为 None，字节数为使用者申请的字节数；
+             未使用时字节数为 None，锁为已取得的目录锁（没有锁文件时为 None），由调用方关闭
+    """
+    try:
+        fd = os.open(os.path.join(path, LOCK_NAME), os.O_RDWR)
+    except FileNotFoundError:
+        return None, None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        try:
+            reserved = int(os.pread(fd, 32, 0) or 0)
+        except ValueError:
+            reserved = 0
+        os.close(fd)
+        return None, reserved
+    return fd, None
+
+
+class Spool:
+    """
+    临时文件池
+
+    每次传输在开始下载前按文件大小申请一个独立的工作目录，离开上下文时整个目录被删除。
+    指定了 key 的工作目录在传输失败时保留，用于续传，启动清理时也保留 resume_ttl 以内的此类目录。
+    空间不足时先按最近使用时间淘汰不属于任何在途传输的遗留文件，仍然不足则排队等待。
+    多个进程可以共用同一个目录：使用中的工作目录持有锁文件，申请和淘汰在整个池的锁下进行，
+    总占用按所有进程申请的字节数计算。
+    """
+
+    def __init__(self, directory, max_bytes, resume_ttl=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.resume_ttl = resume_ttl
+        # 在途传输的工作目录名 -> 申请的字节数
+        self._active = {}
+        self._cond = asyncio.Condition()
+
+    @contextmanager
+    def _pool_lock(self):
+        """与其他进程互斥地检查和修改临时文件池"""
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(os.path.join(self.directory, POOL_LOCK_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def sweep(self):
+        """清理上次运行遗留的临时文件，其他进程正在使用的工作目录保留，应在启动时调用"""
+        removed = 0
+        with self._pool_lock():
+            for name in os.listdir(self.directory):
+                if name in self._active or name == POOL_LOCK_NAME:
+                    continue
+                path = os.path.join(self.directory, name)
+                fd = None
+                try:
+                    if os.path.isdir(path):
+                        fd, reserved = _probe(path)
+                        if reserved is not None:
+                            continue
+                    if name.startswith(RESUMABLE_PREFIX) and time.time() - _entry_mtime(path) < self.resume_ttl:
+                        continue
+                    _remove_entry(path)
+                    removed += 1
+                except OSError as e:
+                    log.warning(f"清理遗留临时文件失败: {name}，{e}")
+                finally:
+                    if fd is not None:
+                        os.close(fd)
+        if removed:
+            log.info(f"已清理 {removed} 个遗留的临时文件")
+
+    def usage(self):
+        """临时文件池当前实际占用的字节数"""
+        if not os.path.isdir(self.directory):
+            return 0
+        total = 0
+        for name in os.listdir(self.directory):
+            try:
+                total += _entry_size(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        return total
+
+    def usage_percent(self):
+        """临时文件池占用空间相对上限的百分比"""
+        return min(100.0, self.usage() / self.max_bytes * 100) if self.max_bytes > 0 else 0.0
+
+    def _scan(self, exclude=None):
+        """
+        统计在途传输占用的空间，列出可以淘汰的遗留文件（不包括即将使用的工作目录 exclude）
+
+        :return: (在途传输数, 在途传输占用的字节数, [(最近使用时间, 字节数, 路径, 目录锁)])，
+                 遗留文件按最近使用时间从旧到新排列，目录锁由调用方关闭
+        """
+        active_count, active_bytes, inactive = 0, 0, []
+        for name in os.listdir(self.directory):
+            if name == POOL_LOCK_NAME:
+                continue
+            path = os.path.join(self.directory, name)
+            if name in self._active:
+                active_count += 1
+                active_bytes += self._active[name]
+                continue
+            fd = None
+            try:
+                if os.path.isdir(path):
+                    fd, reserved = _probe(path)
+                    if reserved is not None:
+                        # 其他进程的在途传输，按申请的字节数和实际占用中较大的计算
+                        active_count += 1
+                        active_bytes += max(reserved, _entry_size(path))
+                        continue
+                if name != exclude:
+                    inactive.append((_entry_mtime(path), _entry_size(path), path, fd))
+                    fd = None
+            except OSError:
+                pass
+            finally:
+                # 加入淘汰列表的目录锁由调用方关闭
+                if fd is not None:
+                    os.close(fd)
+        inactive.sort(key=lambda entry: entry[:3])
+        return active_count, active_bytes, inactive
+
+    def _make_room(self, size, active_count, active_bytes, inactive):
+        """淘汰遗留文件直到可以容纳 size 字节，返回是否有足够空间"""
+        # 没有在途传输时，超过上限的单个文件也单独放行
+        if not active_count:
+            size = min(size, self.max_bytes)
+        used = active_bytes + sum(entry_size for _, entry_size, _, _ in inactive)
+        for _, entry_size, path, _ in inactive:
+            if used + size <= self.max_bytes:
+                break
+            log.info(f"临时文件池空间不足，淘汰遗留文件: {path}")
+            try:
+                _remove_entry(path)
+                used -= entry_size
+            except OSError as e:
+                log.warning(f"淘汰临时文件失败: {path}，{e}")
+        return used + size <= self.max_bytes
+
+    def _try_claim(self, size, name):
+        """
+        空间足够时创建并锁定工作目录，在线程中执行
+
+        :return: (工作目录名, 目录锁)，空间不足时返回 None
+        """
+        with self._pool_lock():
+            active_count, active_bytes, inactive = self._scan(exclude=name)
+            try:
+                if not self._make_room(size, active_count, active_bytes, inactive):
+                    return None
+            finally:
+                for *_, fd in inactive:
+                    if fd is not None:
+                        os.close(fd)
+            os.makedirs(os.path.join(self.directory, name), exist_ok=True)
+            fd = _try_lock(os.path.join(self.directory, name, LOCK_NAME))
+            if fd is None:
+                # 同一文件正在被其他传输使用，本次不续传
+                name = uuid.uuid4().hex
+                os.makedirs(os.path.join(self.directory, name))
+                fd = _try_lock(os.path.join(self.directory, name, LOCK_NAME))
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, str(size).encode(), 0)
+            return name, fd
+
+    @staticmethod
+    def _release(path, fd, remove):
+        """删除（或保留用于续传）工作目录并释放目录锁，在线程中执行"""
+        try:
+            if remove:
+                _remove_entry(path)
+        finally:
+            os.close(fd)
+
+    @asynccontextmanager
+    async def reserve(self, size, key=None):
+        """
+        申请一个工作目录，离开上下文时删除其中的所有文件
+
+        :param size: 预计写入的字节数，空间不足时在此等待
+        :param key: 可续传的工作目录键，相同的键对应同一个目录，传输失败时保留其中的文件
+        :return: 工作目录路径
+        """
+        size = max(0, size or 0)
+        name = f"{RESUMABLE_PREFIX}{key}" if key else uuid.uuid4().hex
+        async with self._cond:
+            # 扫描和删除文件是阻塞操作，在线程中执行
+            claimed = await asyncio.to_thread(self._try_claim, size, name)
+            if claimed is None:
+                log.info(f"临时文件池空间不足，等待中: 需要 {size} 字节，在途 {len(self._active)} 个传输")
+            while claimed is None:
+                try:
+                    await asyncio.wait_for(self._cond.wait(), RECHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                claimed = await asyncio.to_thread(self._try_claim, size, name)
+            name, fd = claimed
+            self._active[name] = size
+        path = os.path.join(self.directory, name)
+        completed = False
+        try:
+            yield path
+            completed = True
+        finally:
+            async with self._cond:
+                await asyncio.to_thread(self._release, path, fd,
+                                        completed or not name.startswith(RESUMABLE_PREFIX))
+                del self._active[name]
+                self._cond.notify_all()
+
+
+# 进程内共享的临时文件池
+spool = Spool(SPOOL_DIR, SPOOL_MAX_BYTES, resume_ttl=TRANSFER_JOURNAL_TTL)
@@ -7,12 +7,14 @@ import time
 
 import psutil
 
+from .spool import spool
+
 # 初始化日志记录器
 log = logging.getLogger("SystemMonitor")
 
 
 def monitor_system_resources(cpu_threshold, memory_threshold, disk_io_threshold,
-                             monitor_interval, system_overloaded_var):
+                             monitor_interval, system_overloaded_var, spool_threshold=100):
     """
     监控系统资源使用情况，并在超过阈值时设置系统过载标志
     
@@ -21,6 +23,7 @@ def monitor_system_resources(cpu_threshold, memory_threshold, disk_io_threshold,
     :param disk_io_threshold: 磁盘I/O使用率阈值(百分比)
     :param monitor_interval: 监控间隔时间(秒)
     :param system_overloaded_var: 系统过载标志变量，multiprocessing.Value类型
+    :param spool_threshold: 临时文件池占用阈值(百分比)
     """
     while True:
         try:
@@ -41,6 +44,9 @@ def monitor_system_resources(cpu_threshold, memory_threshold, disk_io_threshold,
                 # 简单估算I/O使用率，实际应根据系统磁盘性能调整基准值
                 disk_io_percent = min(100.0, (read_diff + write_diff) / (10 * 1024 * 1024) * 100)
 
+            # 获取临时文件池占用
+            spool_percent = spool.usage_percent()
+
             # 记录资源使用情况
             # log.info(f"系统资源监控 - CPU: {cpu_percent}%, 内存: {memory_percent}%, 磁盘I/O: {disk_io_percent}%")
 
@@ -48,7 +54,8 @@ def monitor_system_resources(cpu_threshold, memory_threshold, disk_io_threshold,
             current_overloaded = bool(system_overloaded_var.value)
             is_overloaded = (cpu_percent > cpu_threshold or
                              memory_percent > memory_threshold or
-                             disk_io_percent > disk_io_threshold)
+                             disk_io_percent > disk_io_threshold or
+                             spool_percent > spool_threshold)
 
             # 只在状态变化时记录日志和更新值
             if is_overloaded != current_overloaded:
@@ -58,10 +65,12 @@ def monitor_system_resources(cpu_threshold, memory_threshold, disk_io_threshold,
 
                 if is_overloaded:
                     log.warning(
-                        f"系统负载过高 - CPU: {cpu_percent}%, 内存: {memory_percent}%, 磁盘I/O: {disk_io_percent}%")
+                        f"系统负载过高 - CPU: {cpu_percent}%, 内存: {memory_percent}%, 磁盘I/O: {disk_io_percent}%, "
+                        f"临时文件: {spool_percent:.1f}%")
                 else:
                     log.info(
-                        f"系统负载恢复正常 - CPU: {cpu_percent}%, 内存: {memory_percent}%, 磁盘I/O: {disk_io_percent}%")
+                        f"系统负载恢复正常 - CPU: {cpu_percent}%, 内存: {memory_percent}%, 磁盘I/O: {disk_io_percent}%, "
+                        f"临时文件: {spool_percent:.1f}%")
 
             # 等待下一次监控
             time.sleep(monitor_interval)
@@ -71,7 +80,7 @@ def monitor_system_resources(cpu_threshold, memory_threshold, disk_io_threshold,
 
 
 def start_system_monitor(cpu_threshold, memory_threshold, disk_io_threshold,
-                         monitor_interval, system_overloaded_var):
+                         monitor_interval, system_overloaded_var, spool_threshold=100):
     """
     启动系统资源监控线程
     
@@ -80,6 +89,7 @@ def start_system_monitor(cpu_threshold, memory_threshold, disk_io_threshold,
     :param disk_io_threshold: 磁盘I/O使用率阈值(百分比)
     :param monitor_interval: 监控间隔时间(秒)
     :param system_overloaded_var: 系统过载标志变量，multiprocessing.Value类型
+    :param spool_threshold: 临时文件池占用阈值(百分比)
     :return: 监控线程
     """
     import threading
@@ -88,7 +98,7 @@ def start_system_monitor(cpu_threshold, memory_threshold, disk_io_threshold,
     monitor_thread = threading.Thread(
         target=monitor_system_resources,
         args=(cpu_threshold, memory_threshold, disk_io_threshold,
-              monitor_interval, system_overloaded_var),
+              monitor_interval, system_overloaded_var, spool_threshold),
         daemon=True
     )
     monitor_thread.start()
@@ -6,15 +6,19 @@ import asyncio
 import logging
 from datetime import datetime, timedelta
 
-import aiohttp
-
-from config import TRANSACTION_CHECK_INTERVAL, ADMIN_ID, get_proxy
-from db import (
-    get_all_pending_orders, update_order_last_checked,
+from config import TRANSACTION_CHECK_INTERVAL, ADMIN_ID, CACHE_STATS_INTERVAL
+from db.aio import (
+    get_all_pending_orders, update_order_last_checked, update_order_tx_info,
     cancel_expired_order, complete_order, get_order_by_id,
     reset_all_free_quotas
 )
 
+from .chat_cache import chat_cache
+from .comment_resolver import discussion_cache
+from .http_client import http_client
+from .media_group import media_group_cache
+from .username_resolver import username_resolver
+
 # 初始化日志记录器
 log = logging.getLogger("TaskScheduler")
 
@@ -58,7 +62,7 @@ async def check_trc20_transaction(order_id, wallet_address, bot_client, trongrid
         return False
 
     # 从订单获取详细信息
-    order = get_order_by_id(order_id)
+    order = await get_order_by_id(order_id)
     if not order:
         log.error(f"找不到订单 {order_id}")
         return False
@@ -84,73 +88,64 @@ async def check_trc20_transaction(order_id, wallet_address, bot_client, trongrid
             "only_confirmed": "true"
         }
 
-        # 获取代理
-        proxy = get_proxy(proxy_format="url")
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params, proxy=proxy) as response:
-                if response.status != 200:
-                    log.error(f"查询交易失败: {response.status} {await response.text()}")
-                    return False
-
-                data = await response.json()
-
-                # 检查是否有符合条件的交易
-                if "data" in data:
-                    transactions = data["data"]
-                    for tx in transactions:
-                        # 只检查USDT转入交易
-                        if tx["to"] == wallet_address and tx["token_info"]["address"] == usdt_contract:
-                            # 获取交易金额（USDT有6位小数）
-                            value = float(tx["value"]) / 10 ** 6
-
-                            # 检查金额是否精确匹配
-                            if abs(value - expected_amount) < 0.00001:  # 允许0.00001美元的误差，因为我们使用5位小数
-                                # 获取交易哈希
-                                tx_hash = tx["transaction_id"]
-
-                                # 尝试获取交易的备注信息，但不强制要求
-                                memo = ""
+        # 通过共享的HTTP会话请求，复用到 TronGrid 的连接
+        status, data = await http_client.get_json(url, headers=headers, params=params)
+        if status != 200:
+            log.error(f"查询交易失败: {status} {data}")
+            return False
+
+        # 检查是否有符合条件的交易
+        if data and "data" in data:
+            transactions = data["data"]
+            for tx in transactions:
+                # 只检查USDT转入交易
+                if tx["to"] == wallet_address and tx["token_info"]["address"] == usdt_contract:
+                    # 获取交易金额（USDT有6位小数）
+                    value = float(tx["value"]) / 10 ** 6
+
+                    # 检查金额是否精确匹配
+                    if abs(value - expected_amount) < 0.00001:  # 允许0.00001美元的误差，因为我们使用5位小数
+                        # 获取交易哈希
+                        tx_hash = tx["transaction_id"]
+
+                        # 尝试获取交易的备注信息，但不强制要求
+                        memo = ""
+                        try:
+                            tx_detail_url = f"https://api.trongrid.io/v1/transactions/{tx_hash}"
+                            detail_status, tx_detail = await http_client.get_json(tx_detail_url, headers=headers)
+                            if detail_status == 200:
+                                if tx_detail and "data" in tx_detail and tx_detail["data"]:
+                                    # 提取备注信息
+                                    raw_data = tx_detail["data"][0]["raw_data"]
+                                    if "data" in raw_data:
+                                        memo = bytes.fromhex(raw_data["data"][2:]).decode('utf-8', errors='ignore')
+                        except Exception as e:
+                            log.error(f"获取交易备注失败: {e}")
+                            # 备注获取失败不影响主要流程
+
+                        # 更新订单的交易哈希和备注
+                        await update_order_tx_info(order_id, tx_hash, memo)
+
+                        # 完成订单 - 金额精确匹配即可确认
+                        success = await complete_order(order_id, tx_hash)
+                        if success:
+                            log.info(f"自动确认订单 {order_id} 支付成功，交易哈希: {tx_hash}，金额: {value}$")
+                            # 通知用户订单已完成
+                            order = await get_order_by_id(order_id)
+                            await notify_user_order_completed(order, bot_client)
+
+                            # 通知管理员订单已自动完成
+                            if ADMIN_ID:
+                                admin_msg = f"🤖 自动确认订单 🤖\n\n订单ID: {order_id}\n用户ID: {user_id}\n金额: {expected_amount}$\n交易哈希: {tx_hash}"
                                 try:
-                                    tx_detail_url = f"https://api.trongrid.io/v1/transactions/{tx_hash}"
-                                    async with session.get(tx_detail_url, headers=headers,
-                                                           proxy=proxy) as tx_detail_response:
-                                        if tx_detail_response.status == 200:
-                                            tx_detail = await tx_detail_response.json()
-                                            if "data" in tx_detail and tx_detail["data"]:
-                                                # 提取备注信息
-                                                raw_data = tx_detail["data"][0]["raw_data"]
-                                                if "data" in raw_data:
-                                                    memo = bytes.fromhex(raw_data["data"][2:]).decode('utf-8',
-                                                                                                      errors='ignore')
+                                    await bot_client.send_message(ADMIN_ID, admin_msg)
                                 except Exception as e:
-                                    log.error(f"获取交易备注失败: {e}")
-                                    # 备注获取失败不影响主要流程
-
-                                # 更新订单的交易哈希和备注
-                                from db import update_order_tx_info
-                                update_order_tx_info(order_id, tx_hash, memo)
-
-                                # 完成订单 - 金额精确匹配即可确认
-                                success = complete_order(order_id, tx_hash)
-                                if success:
-                                    log.info(f"自动确认订单 {order_id} 支付成功，交易哈希: {tx_hash}，金额: {value}$")
-                                    # 通知用户订单已完成
-                                    order = get_order_by_id(order_id)
-                                    await notify_user_order_completed(order, bot_client)
-
-                                    # 通知管理员订单已自动完成
-                                    if ADMIN_ID:
-                                        admin_msg = f"🤖 自动确认订单 🤖\n\n订单ID: {order_id}\n用户ID: {user_id}\n金额: {expected_amount}$\n交易哈希: {tx_hash}"
-                                        try:
-                                            await bot_client.send_message(ADMIN_ID, admin_msg)
-                                        except Exception as e:
-                                            log.error(f"通知管理员失败: {e}")
-
-                                    return True
+                                    log.error(f"通知管理员失败: {e}")
+
+                            return True
 
         # 更新订单最后检查时间
-        update_order_last_checked(order_id)
+        await update_order_last_checked(order_id)
         return False
 
     except Exception as e:
@@ -166,7 +161,7 @@ async def schedule_transaction_checker(bot_client, trongrid_api_key, usdt_contra
     while True:
         try:
             # 获取所有待处理的订单
-            pending_orders = get_all_pending_orders()
+            pending_orders = await get_all_pending_orders()
 
             if pending_orders:
                 log.info(f"开始检查 {len(pending_orders)} 个待处理订单")
@@ -181,7 +176,7 @@ async def schedule_transaction_checker(bot_client, trongrid_api_key, usdt_contra
                     time_elapsed = (now - created_at).total_seconds()
                     if time_elapsed > payment_timeout:
                         # 订单已超时，取消订单
-                        cancelled = cancel_expired_order(order_id)
+                        cancelled = await cancel_expired_order(order_id)
                         if cancelled:
                             # 尝试通知用户订单已取消
                             try:
@@ -231,5 +226,23 @@ async def schedule_quota_reset():
         await asyncio.sleep(seconds_until_midnight)
 
         # 重置所有用户的免费次数
-        affected_users = reset_all_free_quotas()
+        affected_users = await reset_all_free_quotas()
         log.info(f"已在 {datetime.now()} 重置了 {affected_users} 个用户的免费转发次数")
+
+
+async def schedule_cache_stats(interval=CACHE_STATS_INTERVAL):
+    """定时任务：定期记录各缓存的命中率，便于调整缓存大小和有效时间"""
+    if interval <= 0:
+        return
+    caches = {
+        "聊天信息": chat_cache,
+        "讨论组": discussion_cache,
+        "媒体组": media_group_cache,
+        "用户名": username_resolver
+    }
+    while True:
+        await asyncio.sleep(interval)
+        for name, cache in caches.items():
+            stats = cache.stats()
+            log.info(f"{name}缓存 - 条目: {stats['size']}，命中: {stats['hits']}，未命中: {stats['misses']}，"
+                     f"合并: {stats['coalesced']}，命中率: {stats['hit_rate']:.1%}")
@@ -0,0 +1,83 @@
+"""
+传输准入控制模块 - 按总字节数和并发数限制进程内同时进行的媒体传输
+"""
+
+import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager
+
+from config import TRANSFER_MAX_BYTES, TRANSFER_MAX_COUNT
+
+# 初始化日志记录器
+log = logging.getLogger("TransferLimiter")
+
+
+class TransferBudget:
+    """
+    进程级传输调度器
+
+    每个传输在开始前按文件大小申请额度，在途字节数或传输数超过上限时排队等待。
+    按申请顺序放行，避免大文件一直被小文件插队。
+    """
+
+    def __init__(self, max_bytes, max_count):
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self.in_flight_bytes = 0
+        self.in_flight_count = 0
+        self._tickets = itertools.count()
+        self._queue = []
+        self._cond = asyncio.Condition()
+
+    def split(self, parts):
+        """
+        多个进程共用同一份额度时，每个进程只使用其中的一份
+
+        :param parts: 共用额度的进程数
+        """
+        self.max_bytes = max(1, self.max_bytes // parts)
+        self.max_count = max(1, self.max_count // parts)
+
+    @property
+    def waiting(self):
+        """正在排队的传输数"""
+        return len(self._queue)
+
+    def _can_admit(self, ticket, size):
+        return (self._queue[0] == ticket
+                and self.in_flight_count < self.max_count
+                and (self.in_flight_bytes == 0 or self.in_flight_bytes + size <= self.max_bytes))
+
+    @asynccontextmanager
+    async def reserve(self, size):
+        """
+        申请传输额度，离开上下文时归还
+
+        :param size: 传输的字节数，超过总额度的单个文件在没有其他传输时单独放行
+        """
+        size = max(0, size or 0)
+        ticket = next(self._tickets)
+        async with self._cond:
+            self._queue.append(ticket)
+            try:
+                if not self._can_admit(ticket, size):
+                    log.info(f"传输排队中: {size} 字节，在途 {self.in_flight_bytes} 字节/{self.in_flight_count} 个")
+                await self._cond.wait_for(lambda: self._can_admit(ticket, size))
+            finally:
+                self._queue.remove(ticket)
+                # 队首变化后唤醒其他等待者
+                self._cond.notify_all()
+            self.in_flight_bytes += size
+            self.in_flight_count += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight_bytes -= size
+                self.in_flight_count -= 1
+                self._cond.notify_all()
+
+
+# 进程内共享的传输额度
+transfer_budget = TransferBudget(TRANSFER_MAX_BYTES, TRANSFER_MAX_COUNT)
@@ -0,0 +1,197 @@
+"""
+用户账号池模块 - 多个用户账号分担受限内容的下载，按聊天亲和性和负载选择账号
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from telethon import utils
+from telethon.errors import RPCError, FloodWaitError
+from telethon.tl.functions.messages import ImportChatInviteRequest
+from telethon.tl.types import PeerChannel
+
+from config import USER_POOL_AFFINITY_SLACK, USER_POOL_NEGATIVE_TTL, USER_POOL_MAX_CHATS
+
+# 初始化日志记录器
+log = logging.getLogger("UserPool")
+
+
+def chat_key(chat_id):
+    """
+    链接中的聊天标识转换为账号池使用的键
+
+    :param chat_id: 私有聊天的数字ID（t.me/c/ 后面的部分）或公开聊天的用户名
+    :return: 数字ID为 int，用户名为小写的 str，无法解析时为 None
+    """
+    if chat_id is None:
+        return None
+    chat_id = str(chat_id).lstrip("@")
+    return int(chat_id) if chat_id.isdigit() else chat_id.lower()
+
+
+class UserClientPool:
+    """
+    用户账号池
+
+    私有聊天只能由已加入的账号访问；公开聊天所有账号都可以访问。在可以访问的账号中，
+    优先使用上次处理同一聊天的账号（负载不超过最空闲账号 affinity_slack 个任务时），否则使用最空闲的账号。
+    加入聊天触发 FloodWait 的账号在封禁结束前不再用于加入聊天，有其他可用账号时也不用于处理请求。
+    """
+
+    def __init__(self, clients, affinity_slack=USER_POOL_AFFINITY_SLACK, negative_ttl=USER_POOL_NEGATIVE_TTL,
+                 max_chats=USER_POOL_MAX_CHATS):
+        self.clients = list(clients)
+        self.affinity_slack = affinity_slack
+        self.negative_ttl = negative_ttl
+        self.max_chats = max_chats
+        # 每个账号正在处理的任务数和通过本池加入的聊天数
+        self.loads = [0] * len(self.clients)
+        self.join_counts = [0] * len(self.clients)
+        # 每个账号加入聊天触发 FloodWait 后的封禁结束时间
+        self.banned_until = [0] * len(self.clients)
+        # 聊天键 -> 上次处理该聊天的账号序号
+        self._affinity = OrderedDict()
+        # 私有聊天ID -> 已确认可以访问的账号序号
+        self._members = OrderedDict()
+        # (私有聊天ID, 账号序号) -> 确认无法访问的结果的过期时间
+        self._not_members = {}
+        # 每个账号上次刷新对话列表的时间
+        self._dialogs_refreshed = [float("-inf")] * len(self.clients)
+        self._dialog_locks = [asyncio.Lock() for _ in self.clients]
+
+    def _remember(self, mapping, key, value):
+        mapping[key] = value
+        mapping.move_to_end(key)
+        while len(mapping) > self.max_chats:
+            mapping.popitem(last=False)
+
+    def _add_member(self, key, index):
+        members = self._members.get(key, set())
+        members.add(index)
+        self._remember(self._members, key, members)
+        self._not_members.pop((key, index), None)
+
+    def _unbanned(self, indexes):
+        """筛选出不在封禁中的账号"""
+        now = time.monotonic()
+        return [index for index in indexes if self.banned_until[index] <= now]
+
+    async def _has_access(self, index, key):
+        """账号是否可以访问该聊天，私有聊天以会话中是否有该频道的实体为准"""
+        if not isinstance(key, int):
+            return True
+        if index in self._members.get(key, ()):
+            return True
+        now = time.monotonic()
+        expires = self._not_members.get((key, index))
+        if expires and expires > now:
+            return False
+        try:
+            found = await self._find_channel(index, key)
+        except RPCError:
+            found = False
+        if not found:
+            # 清理过期的结果，避免不断增长
+            self._not_members = {k: v for k, v in self._not_members.items() if v > now}
+            self._not_members[(key, index)] = now + self.negative_ttl
+            return False
+        self._add_member(key, index)
+        return True
+
+    async def _find_channel(self, index, key):
+        """
+        在账号的会话中查找频道的实体
+
+        会话中没有时（例如由其他进程中的同一账号加入），刷新对话列表后再查找一次，每个账号在 negative_ttl 内最多刷新一次。
+        """
+        client = self.clients[index]
+        try:
+            await client.get_input_entity(PeerChannel(key))
+            return True
+        except ValueError:
+            pass
+        missed_at = time.monotonic()
+        async with self._dialog_locks[index]:
+            # 等待期间其他请求已经刷新过时直接再查一次
+            if self._dialogs_refreshed[index] < missed_at:
+                if missed_at - self._dialogs_refreshed[index] < self.negative_ttl:
+                    return False
+                self._dialogs_refreshed[index] = time.monotonic()
+                await client.get_dialogs()
+        try:
+            await client.get_input_entity(PeerChannel(key))
+            return True
+        except ValueError:
+            return False
+
+    async def select(self, chat_id):
+        """
+        选择处理该聊天的账号
+
+        :param chat_id: 链接中的聊天标识
+        :return: 账号序号
+        """
+        key = chat_key(chat_id)
+        candidates = [index for index in range(len(self.clients)) if await self._has_access(index, key)]
+        if not candidates:
+            # 没有账号加入过该聊天，交给最空闲的账号，由处理流程提示用户先发送邀请链接
+            candidates = list(range(len(self.clients)))
+        # 可以访问的账号都在封禁中时仍然使用它们，其他账号无法访问该聊天
+        candidates = self._unbanned(candidates) or candidates
+        least_loaded = min(candidates, key=lambda index: self.loads[index])
+        preferred = self._affinity.get(key)
+        if preferred in candidates and self.loads[preferred] <= self.loads[least_loaded] + self.affinity_slack:
+            selected = preferred
+        else:
+            selected = least_loaded
+        if key is not None:
+            self._remember(self._affinity, key, selected)
+        return selected
+
+    @asynccontextmanager
+    async def acquire(self, chat_id):
+        """
+        取出处理该聊天的账号，离开上下文时归还
+
+        :param chat_id: 链接中的聊天标识
+        :return: 用户客户端
+        """
+        index = await self.select(chat_id)
+        self.loads[index] += 1
+        try:
+            yield self.clients[index]
+        finally:
+            self.loads[index] -= 1
+
+    async def join(self, invite_hash):
+        """
+        通过邀请链接加入聊天，由加入聊天最少的账号执行，触发 FloodWait 时换下一个账号，封禁中的账号跳过
+
+        :param invite_hash: 邀请链接的哈希部分
+        :return: ImportChatInviteRequest 的结果
+        :raises FloodWaitError: 所有账号都在封禁中，等待时间为最早结束的封禁
+        """
+        order = sorted(self._unbanned(range(len(self.clients))),
+                       key=lambda index: (self.join_counts[index], self.loads[index]))
+        if not order:
+            remaining = min(self.banned_until) - time.monotonic()
+            raise FloodWaitError(ImportChatInviteRequest(invite_hash), capture=max(1, math.ceil(remaining)))
+        for attempt, index in enumerate(order):
+            try:
+                result = await self.clients[index](ImportChatInviteRequest(invite_hash))
+            except FloodWaitError as e:
+                self.banned_until[index] = time.monotonic() + e.seconds
+                if attempt == len(order) - 1:
+                    raise
+                log.warning(f"账号 {index} 加入聊天触发 FloodWait（{e.seconds} 秒），改用下一个账号")
+                continue
+            self.join_counts[index] += 1
+            for chat in getattr(result, "chats", []):
+                key = utils.get_peer_id(chat, add_mark=False)
+                self._add_member(key, index)
+                self._remember(self._affinity, key, index)
+            return result
@@ -0,0 +1,159 @@
+"""
+用户名解析模块 - 持久化用户名到 (peer id, access_hash) 的解析结果，减少受严格频率限制的 contacts.ResolveUsername 调用
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+
+from telethon import utils
+from telethon.errors import (
+    UsernameInvalidError, UsernameNotOccupiedError, ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError
+)
+from telethon.tl.functions.contacts import ResolveUsernameRequest
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser, Channel, Chat
+
+from config import USERNAME_CACHE_SIZE, USERNAME_REFRESH_AGE, USERNAME_NEGATIVE_TTL
+from db.aio import get_cached_username, save_cached_username, delete_cached_username
+from .async_cache import AsyncTTLCache
+
+# 初始化日志记录器
+log = logging.getLogger("UsernameResolver")
+
+# 使用解析结果时出现这些错误，说明保存的 access_hash 已失效（用户名转给了其他聊天、频道被删除或不再可访问）
+STALE_PEER_ERRORS = (ChannelInvalidError, ChannelPrivateError, PeerIdInvalidError)
+
+
+def _to_input_peer(peer_type, peer_id, access_hash):
+    """根据保存的解析结果构造 InputPeer"""
+    if peer_type == "channel":
+        return InputPeerChannel(peer_id, access_hash)
+    if peer_type == "chat":
+        return InputPeerChat(peer_id)
+    return InputPeerUser(peer_id, access_hash)
+
+
+def _is_username(peer):
+    """链接中的聊天标识是否为用户名"""
+    return isinstance(peer, str) and not peer.lstrip("-").isdigit() and "/" not in peer
+
+
+class UsernameResolver:
+    """
+    用户名解析器
+
+    解析结果按账号保存在数据库中（access_hash 只对解析它的账号有效），重启后仍然有效。
+    超过 refresh_age 的记录先直接使用，同时在后台重新解析；不存在的用户名在内存中记住 negative_ttl 秒。
+    """
+
+    def __init__(self, max_size, refresh_age, negative_ttl):
+        self.refresh_age = refresh_age
+        # 只缓存不存在的用户名，同时合并同一用户名的并发解析，解析成功的结果保存在数据库中
+        self._lookups = AsyncTTLCache(max_size, 0, negative_ttl)
+        # 正在后台刷新的 (账号ID, 用户名) -> 任务
+        self._refreshing = {}
+
+    async def _resolve_remote(self, client, account_id, username):
+        """调用 contacts.ResolveUsername 解析并保存结果，用户名不存在时返回 None"""
+        try:
+            result = await client(ResolveUsernameRequest(username))
+        except (UsernameNotOccupiedError, UsernameInvalidError):
+            await delete_cached_username(account_id, username)
+            return None
+
+        peer_id = utils.get_peer_id(result.peer)
+        entity = next((x for x in result.chats + result.users if utils.get_peer_id(x) == peer_id), None)
+        if entity is None:
+            return None
+        if isinstance(entity, Channel):
+            peer_type = "channel"
+        elif isinstance(entity, Chat):
+            peer_type = "chat"
+        else:
+            peer_type = "user"
+        await save_cached_username(account_id, username, peer_type, entity.id, getattr(entity, "access_hash", None))
+        return utils.get_input_peer(entity)
+
+    async def _refresh(self, client, account_id, username):
+        """后台重新解析用户名"""
+        key = (account_id, username)
+        try:
+            await self._lookups.get(key, lambda: self._resolve_remote(client, account_id, username))
+        except Exception as e:
+            log.warning(f"后台刷新用户名失败: @{username}，{e}")
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def resolve(self, client, username):
+        """
+        解析用户名
+
+        :param client: Telethon 客户端，解析结果只用于该客户端
+        :param username: 用户名，可以带 @
+        :return: InputPeer
+        :raises ValueError: 用户名不存在
+        """
+        username = username.lstrip("@").lower()
+        account_id = (await client.get_me(input_peer=True)).user_id
+        key = (account_id, username)
+
+        cached = await get_cached_username(account_id, username)
+        if cached:
+            peer_type, peer_id, access_hash, updated_at = cached
+            if ((datetime.now() - updated_at).total_seconds() > self.refresh_age
+                    and key not in self._refreshing):
+                self._refreshing[key] = asyncio.create_task(self._refresh(client, account_id, username))
+            return _to_input_peer(peer_type, peer_id, access_hash)
+
+        peer = await self._lookups.get(key, lambda: self._resolve_remote(client, account_id, username))
+        if peer is None:
+            raise ValueError(f'No user has "{username}" as username')
+        return peer
+
+    def stats(self):
+        """不存在的用户名缓存和并发合并的命中统计，成功的解析结果保存在数据库中，不计入"""
+        return self._lookups.stats()
+
+    async def invalidate(self, client, username):
+        """删除用户名的解析记录，下次解析时重新调用 contacts.ResolveUsername"""
+        username = username.lstrip("@").lower()
+        account_id = (await client.get_me(input_peer=True)).user_id
+        await delete_cached_username(account_id, username)
+
+
+# 进程内共享的用户名解析器
+username_resolver = UsernameResolver(USERNAME_CACHE_SIZE, USERNAME_REFRESH_AGE, USERNAME_NEGATIVE_TTL)
+
+
+async def resolve_peer(client, peer):
+    """
+    将链接中的聊天标识转换为客户端可以直接使用的 peer，用户名先查询解析缓存
+
+    :param client: Telethon 客户端
+    :param peer: 用户名或其他 Telethon 接受的 peer
+    :return: 用户名对应的 InputPeer，其他类型原样返回
+    """
+    if _is_username(peer):
+        return await username_resolver.resolve(client, peer)
+    return peer
+
+
+async def call_with_peer(client, peer, func):
+    """
+    解析聊天标识后调用 func，保存的解析结果已失效时删除记录，重新解析后再调用一次
+
+    :param client: Telethon 客户端
+    :param peer: 用户名或其他 Telethon 接受的 peer
+    :param func: 接受解析后的 peer 的协程函数，例如 lambda p: client.get_messages(p, ids=message_id)
+    :return: (解析后的 peer, func 的返回值)
+    """
+    resolved = await resolve_peer(client, peer)
+    try:
+        return resolved, await func(resolved)
+    except STALE_PEER_ERRORS as e:
+        if not _is_username(peer):
+            raise
+        log.info(f"用户名 {peer} 的解析记录已失效，重新解析: {e}")
+        await username_resolver.invalidate(client, peer)
+        resolved = await resolve_peer(client, peer)
+        return resolved, await func(resolved)
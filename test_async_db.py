@@ -0,0 +1,135 @@
+"""
+测试异步数据库接口的脚本：其他连接持有写锁时，等待写锁的操作不会阻塞事件循环
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+from db import init_db, get_db_connection
+from db.database import DB_FILE
+from db.aio import get_user_quota, decrease_user_quota, get_order_by_id, close_db
+
+# 设置日志记录
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(asctime)s - %(message)s")
+log = logging.getLogger("TestAsyncDB")
+
+# 其他连接持有写锁的时间（秒），小于 DB_BUSY_TIMEOUT
+LOCK_SECONDS = 1.5
+# 心跳协程的间隔（秒）
+TICK_INTERVAL = 0.05
+
+
+def hold_write_lock(locked, seconds):
+    """模拟另一个进程：用单独的连接持有写锁一段时间"""
+    conn = sqlite3.connect(DB_FILE, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        locked.set()
+        time.sleep(seconds)
+        conn.execute('ROLLBACK')
+    finally:
+        conn.close()
+
+
+def reset_user(user_id):
+    """删除测试用户的配额记录，重复运行时从初始次数开始"""
+    with get_db_connection() as conn:
+        conn.execute('DELETE FROM user_forward_quota WHERE user_id = ?', (str(user_id),))
+        conn.commit()
+
+
+async def heartbeat(stop, gaps):
+    """按固定间隔醒来，记录每次实际间隔，事件循环被阻塞时间隔会变长"""
+    loop = asyncio.get_running_loop()
+    last = loop.time()
+    while not stop.is_set():
+        await asyncio.sleep(TICK_INTERVAL)
+        now = loop.time()
+        gaps.append(now - last)
+        last = now
+
+
+async def check_loop_responsive():
+    """其他连接持有写锁期间读写数据库，同时记录心跳间隔"""
+    user_id = 555000111
+    reset_user(user_id)
+    free_quota, _, _ = await get_user_quota(user_id)
+
+    locked = threading.Event()
+    locker = threading.Thread(target=hold_write_lock, args=(locked, LOCK_SECONDS))
+    locker.start()
+    await asyncio.to_thread(locked.wait)
+
+    stop = asyncio.Event()
+    gaps = []
+    ticker = asyncio.create_task(heartbeat(stop, gaps))
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    # 写操作在数据库线程中等待写锁，读操作使用只读连接，不需要等待
+    write = asyncio.create_task(decrease_user_quota(user_id))
+    order = await get_order_by_id("not-exists")
+    read_elapsed = loop.time() - start
+    decreased = await write
+    write_elapsed = loop.time() - start
+
+    stop.set()
+    await ticker
+    locker.join()
+
+    max_gap = max(gaps)
+    log.info(f"读操作耗时 {read_elapsed:.3f} 秒，写操作等待 {write_elapsed:.3f} 秒，"
+             f"心跳 {len(gaps)} 次，最大间隔 {max_gap:.3f} 秒")
+    assert order is None and read_elapsed < LOCK_SECONDS / 2
+    assert decreased and write_elapsed >= LOCK_SECONDS * 0.8
+    # 同步调用时心跳会停顿整个加锁时间
+    assert max_gap < TICK_INTERVAL + 0.2
+    assert len(gaps) >= LOCK_SECONDS / TICK_INTERVAL / 2
+
+    new_free_quota, _, _ = await get_user_quota(user_id)
+    log.info(f"免费次数: {free_quota} -> {new_free_quota}")
+    assert new_free_quota == free_quota - 1
+
+
+async def check_write_order():
+    """同时提交多个写操作，结果与提交顺序一致"""
+    user_id = 555000222
+    reset_user(user_id)
+    free_quota, _, _ = await get_user_quota(user_id)
+    results = await asyncio.gather(*[decrease_user_quota(user_id) for _ in range(free_quota + 2)])
+    log.info(f"连续减少 {len(results)} 次的结果: {results}")
+    assert results == [True] * free_quota + [False, False]
+
+
+def test_loop_responsive():
+    """测试写锁被占用时事件循环仍然及时响应，读操作不受影响"""
+    log.info("测试等待写锁时的事件循环响应...")
+    init_db()
+    asyncio.run(check_loop_responsive())
+
+
+def test_write_order():
+    """测试写操作按提交顺序执行"""
+    log.info("测试写操作顺序...")
+    init_db()
+    asyncio.run(check_write_order())
+
+
+def main():
+    """主测试函数"""
+    log.info("开始测试异步数据库接口...")
+
+    try:
+        test_loop_responsive()
+        test_write_order()
+    finally:
+        close_db()
+
+    log.info("测试完成!")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,16 @@
 
 import logging
 
+from telethon.tl.types import Message, MessageMediaDocument, Document, PeerChannel, MessageEntityBold
+
 from db import (
     init_db, get_user_quota, decrease_user_quota, add_paid_quota,
     create_new_order, get_order_by_id,
-    complete_order, get_user_invite_code, process_invite, get_invite_stats
+    complete_order, get_user_invite_code, process_invite, get_invite_stats,
+    save_media_cache, find_media_cache,
+    save_message_relation, find_forwarded_message_for_one, load_archived_message,
+    get_transfer_journal, save_transfer_progress, delete_transfer_journal,
+    get_cached_username, save_cached_username, delete_cached_username, get_db_connection
 )
 
 # 设置日志记录
@@ -93,6 +99,128 @@ def test_invite():
     log.info(f"邀请后用户配额: 免费={free_quota}, 付费={paid_quota}")
 
 
+def test_media_cache():
+    """测试媒体缓存相关函数"""
+    log.info("测试媒体缓存功能...")
+
+    target_chat_id = -1001234567890
+
+    # 保存媒体缓存
+    save_media_cache('document', 5555, target_chat_id, 100)
+    cached = find_media_cache('document', 5555, target_chat_id)
+    log.info(f"查找媒体缓存: {cached}")
+
+    # 同一媒体再次归档时更新为最新的归档消息
+    save_media_cache('document', 5555, target_chat_id, 200)
+    cached = find_media_cache('document', 5555, target_chat_id)
+    log.info(f"更新后媒体缓存: {cached}")
+
+    # 不存在的媒体
+    missing = find_media_cache('photo', 5555, target_chat_id)
+    log.info(f"未缓存的媒体: {missing}")
+
+    # 在多个归档频道中查找，返回最近归档的一条及其所在的频道
+    other_chat_id = -1001234567891
+    save_media_cache('document', 5555, other_chat_id, 300)
+    cached = find_media_cache('document', 5555, [target_chat_id, other_chat_id])
+    log.info(f"多个归档频道中的媒体缓存: {cached}")
+
+
+def test_archived_message():
+    """测试消息关系中保存的归档媒体信息"""
+    log.info("测试归档媒体信息...")
+
+    target_chat_id = -1001234567890
+
+    # 构造一条归档频道中的文档消息
+    document = Document(id=7777, access_hash=8888, file_reference=b'\x01\x02', date=None,
+                        mime_type='video/mp4', size=1024, dc_id=2, attributes=[])
+    archived_message = Message(
+        id=300, peer_id=PeerChannel(1234567890), date=None, message='测试 caption',
+        media=MessageMediaDocument(document=document),
+        entities=[MessageEntityBold(offset=0, length=2)]
+    )
+
+    # 保存消息关系时同时保存文件引用、caption 和 entities
+    save_message_relation(-1009876543210, 42, target_chat_id, archived_message.id, 0,
+                          archived_message=archived_message)
+    chat_id, target_message_id, _, *columns = find_forwarded_message_for_one(-1009876543210, 42, target_chat_id)
+    archived = load_archived_message(target_message_id, columns, chat_id)
+    log.info(f"还原归档消息: 媒体={archived.media}, caption={archived.caption}, "
+             f"entities={archived.entities}")
+
+    # 同一条消息在另一个归档频道中有更新的记录时，在所有归档频道中查找返回更新的记录
+    save_message_relation(-1009876543210, 42, -1001234567891, 301, 0, archived_message=archived_message)
+    relation = find_forwarded_message_for_one(-1009876543210, 42, [target_chat_id, -1001234567891])
+    log.info(f"多个归档频道中的转发记录: 归档频道={relation[0]}, 归档消息ID={relation[1]}")
+
+
+def test_transfer_journal():
+    """测试传输记录相关函数"""
+    log.info("测试传输记录功能...")
+
+    document_id = 9999
+
+    # 记录上传进度
+    save_transfer_progress(document_id, 'upload', 123456, 512 * 1024, 16)
+    journal = get_transfer_journal(document_id, 'upload', 3600)
+    log.info(f"上传进度: {journal}")
+
+    # 下载方向没有记录
+    journal = get_transfer_journal(document_id, 'download', 3600)
+    log.info(f"下载进度: {journal}")
+
+    # 传输完成后删除记录
+    delete_transfer_journal(document_id, 'upload')
+    journal = get_transfer_journal(document_id, 'upload', 3600)
+    log.info(f"删除后上传进度: {journal}")
+
+
+def test_username_cache():
+    """测试用户名解析缓存相关函数"""
+    log.info("测试用户名解析缓存功能...")
+
+    account_id = 10001
+
+    # 保存解析结果
+    save_cached_username(account_id, "test_channel", "channel", 1234567890, 987654321)
+    cached = get_cached_username(account_id, "test_channel")
+    log.info(f"解析结果: {cached}")
+
+    # 其他账号没有记录
+    cached = get_cached_username(account_id + 1, "test_channel")
+    log.info(f"其他账号的解析结果: {cached}")
+
+    # 用户名失效后删除记录
+    delete_cached_username(account_id, "test_channel")
+    cached = get_cached_username(account_id, "test_channel")
+    log.info(f"删除后解析结果: {cached}")
+
+
+def test_connection_pool():
+    """测试写事务进行中时只读连接不被阻塞"""
+    log.info("测试数据库连接池...")
+
+    user_id = 987654321
+    get_user_quota(user_id)
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        # 写连接持有未提交的写事务
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('UPDATE user_forward_quota SET paid_quota = 99 WHERE user_id = ?', (str(user_id),))
+
+        # 只读连接立即读到已提交的数据，看不到未提交的修改
+        with get_db_connection(readonly=True) as reader:
+            journal_mode = reader.execute('PRAGMA journal_mode').fetchone()[0]
+            paid_quota = reader.execute('SELECT paid_quota FROM user_forward_quota WHERE user_id = ?',
+                                        (str(user_id),)).fetchone()[0]
+        log.info(f"日志模式: {journal_mode}，写事务进行中读到的付费次数: {paid_quota}")
+    # 离开上下文时未提交的事务被回滚
+    free_quota, paid_quota, _ = get_user_quota(user_id)
+    log.info(f"回滚后付费次数: {paid_quota}")
+
+
 def main():
     """主测试函数"""
     log.info("开始测试数据库模块...")
@@ -110,6 +238,21 @@ def main():
     # 测试邀请
     test_invite()
 
+    # 测试媒体缓存
+    test_media_cache()
+
+    # 测试归档媒体信息
+    test_archived_message()
+
+    # 测试传输记录
+    test_transfer_journal()
+
+    # 测试用户名解析缓存
+    test_username_cache()
+
+    # 测试数据库连接池
+    test_connection_pool()
+
     log.info("测试完成!")
 
 
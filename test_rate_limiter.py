@@ -0,0 +1,116 @@
+"""
+测试请求限流的脚本，使用模拟的请求发送，不需要连接 Telegram
+"""
+
+import asyncio
+import logging
+import time
+
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError, SlowModeWaitError
+from telethon.sessions import StringSession
+from telethon.tl.functions.messages import ImportChatInviteRequest, SendMessageRequest
+from telethon.tl.types import PeerChannel
+
+from config import RATE_LIMIT_MAX_WAIT
+from services import RateLimitedClient
+
+# 设置日志记录
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(asctime)s - %(message)s")
+log = logging.getLogger("TestRateLimiter")
+
+# 超过等待上限的封禁时间（秒）
+LONG_BAN = RATE_LIMIT_MAX_WAIT + 3600
+
+
+class StubSender(TelegramClient):
+    """模拟的请求发送：按 errors 中的顺序抛出错误，没有错误时返回 True"""
+
+    async def _call(self, sender, request, ordered=False, flood_sleep_threshold=None):
+        self.sent.append(request)
+        if self.errors:
+            raise self.errors.pop(0)
+        return True
+
+
+class StubClient(RateLimitedClient, StubSender):
+    """限流在模拟的请求发送之上"""
+
+    def __init__(self, errors=()):
+        super().__init__(StringSession(), 1, "x")
+        self.errors = list(errors)
+        self.sent = []
+
+
+async def call_quickly(client, request):
+    """执行请求，返回抛出的错误和耗时"""
+    start = time.monotonic()
+    try:
+        await client._call(None, request)
+        error = None
+    except (FloodWaitError, SlowModeWaitError) as e:
+        error = e
+    return error, time.monotonic() - start
+
+
+async def check_long_flood():
+    """只有方法令牌桶的请求触发超过上限的 FloodWait，之后的请求在封禁期间立即报错"""
+    request = ImportChatInviteRequest("chat1")
+    client = StubClient([FloodWaitError(request, capture=LONG_BAN)])
+
+    error, _ = await call_quickly(client, request)
+    log.info(f"第一次请求: {error}")
+    assert isinstance(error, FloodWaitError) and error.seconds == LONG_BAN
+
+    # 封禁期间不再发送请求，也不在令牌桶中等待
+    errors = await asyncio.wait_for(
+        asyncio.gather(*[call_quickly(client, ImportChatInviteRequest(f"chat{i}")) for i in range(3)]), 5)
+    log.info(f"封禁期间的请求: {[(str(e), round(elapsed, 3)) for e, elapsed in errors]}")
+    assert len(client.sent) == 1
+    for error, elapsed in errors:
+        assert isinstance(error, FloodWaitError) and LONG_BAN - 5 <= error.seconds <= LONG_BAN
+        assert elapsed < 1
+
+
+async def check_long_slow_mode():
+    """聊天上的慢速模式超过上限时只影响该聊天，抛出同样类型的错误"""
+    request = SendMessageRequest(PeerChannel(1001), "text")
+    client = StubClient([SlowModeWaitError(request, capture=LONG_BAN)])
+
+    error, _ = await call_quickly(client, request)
+    assert isinstance(error, SlowModeWaitError)
+
+    error, elapsed = await asyncio.wait_for(call_quickly(client, SendMessageRequest(PeerChannel(1001), "again")), 5)
+    log.info(f"同一聊天的请求: {error}，耗时 {elapsed:.3f} 秒")
+    assert isinstance(error, SlowModeWaitError) and elapsed < 1
+
+    # 其他聊天不受影响
+    error, _ = await asyncio.wait_for(call_quickly(client, SendMessageRequest(PeerChannel(2002), "other")), 5)
+    log.info(f"其他聊天的请求: {error}")
+    assert error is None and len(client.sent) == 2
+
+
+def test_long_flood():
+    """测试超过等待上限的 FloodWait 直接抛出，封禁期间同一令牌桶上的请求立即报错"""
+    log.info("测试超过等待上限的 FloodWait...")
+    asyncio.run(check_long_flood())
+
+
+def test_long_slow_mode():
+    """测试超过等待上限的慢速模式只暂停对应聊天的令牌桶"""
+    log.info("测试超过等待上限的慢速模式...")
+    asyncio.run(check_long_slow_mode())
+
+
+def main():
+    """主测试函数"""
+    log.info("开始测试请求限流...")
+
+    test_long_flood()
+    test_long_slow_mode()
+
+    log.info("测试完成!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+"""
+测试用户账号池的脚本，使用模拟的客户端，不需要连接 Telegram
+"""
+
+import asyncio
+import logging
+from types import SimpleNamespace
+
+from telethon.errors import FloodWaitError
+from telethon.tl.types import PeerChannel
+
+from services import UserClientPool
+
+# 设置日志记录
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(asctime)s - %(message)s")
+log = logging.getLogger("TestUserPool")
+
+
+class StubClient:
+    """模拟的用户客户端，只能访问 chats 中的私有聊天，hidden 中的私有聊天在刷新对话列表后才能访问"""
+
+    def __init__(self, name, chats=(), flood=False, hidden=()):
+        self.name = name
+        self.chats = set(chats)
+        self.hidden = set(hidden)
+        self.flood = flood
+        self.lookups = 0
+        self.dialog_refreshes = 0
+        self.joined = []
+        self.join_attempts = 0
+
+    async def get_input_entity(self, peer):
+        self.lookups += 1
+        if peer.channel_id not in self.chats:
+            raise ValueError(f"Could not find the input entity for {peer}")
+        return peer
+
+    async def get_dialogs(self):
+        self.dialog_refreshes += 1
+        self.chats |= self.hidden
+
+    async def __call__(self, request):
+        self.join_attempts += 1
+        if self.flood:
+            raise FloodWaitError(request, capture=60)
+        # 邀请链接的哈希用 "chat<ID>" 表示要加入的聊天
+        chat_id = int(request.hash[len("chat"):])
+        self.chats.add(chat_id)
+        self.joined.append(chat_id)
+        return SimpleNamespace(chats=[PeerChannel(chat_id)])
+
+    def __repr__(self):
+        return self.name
+
+
+async def check_least_loaded():
+    """三个账号同时处理三个不同的公开聊天"""
+    a, b, c = StubClient("a"), StubClient("b"), StubClient("c")
+    pool = UserClientPool([a, b, c], affinity_slack=0)
+
+    async with pool.acquire("channel_one") as first:
+        async with pool.acquire("channel_two") as second:
+            async with pool.acquire("channel_three") as third:
+                log.info(f"三个不同聊天的账号: {first}, {second}, {third}，负载: {pool.loads}")
+                assert {first, second, third} == {a, b, c}
+    log.info(f"全部结束后负载: {pool.loads}")
+    assert pool.loads == [0, 0, 0]
+
+
+async def check_affinity():
+    """先后处理同一聊天，再让原账号变繁忙"""
+    a, b = StubClient("a"), StubClient("b")
+    pool = UserClientPool([a, b], affinity_slack=1)
+
+    async with pool.acquire("channel_one") as first:
+        pass
+    async with pool.acquire("other_channel"):
+        async with pool.acquire("channel_one") as again:
+            log.info(f"第一次: {first}，另一个聊天占用一个账号时: {again}")
+            assert again is first
+
+    # 上次的账号比最空闲账号多出的任务超过 affinity_slack 时，换到最空闲的账号
+    pool.loads[pool.clients.index(first)] += 2
+    async with pool.acquire("channel_one") as busy:
+        log.info(f"原账号繁忙时: {busy}，负载: {pool.loads}")
+        assert busy is not first
+
+
+async def check_private_chat_routing():
+    """只有部分账号能访问的私有聊天"""
+    a, b = StubClient("a"), StubClient("b", chats=[1001])
+    pool = UserClientPool([a, b], affinity_slack=0)
+
+    # 让 b 更繁忙，也只能选择 b
+    pool.loads[1] = 5
+    async with pool.acquire("1001") as client:
+        log.info(f"只有 b 加入的私有聊天: {client}")
+        assert client is b
+
+    # 无法访问的结果被缓存，不再重复查询
+    lookups = a.lookups
+    async with pool.acquire("1001"):
+        pass
+    log.info(f"a 的实体查询次数: {lookups} -> {a.lookups}，对话列表刷新次数: {a.dialog_refreshes}")
+    assert a.lookups == lookups and a.dialog_refreshes == 1
+
+    # 没有账号加入的私有聊天交给最空闲的账号，由处理流程提示用户先发送邀请链接
+    async with pool.acquire("2002") as client:
+        log.info(f"没有账号加入的私有聊天: {client}")
+        assert client is a
+
+    # 其他进程中的同一账号加入的聊天：会话中没有实体，刷新对话列表后找到
+    c = StubClient("c", hidden=[3001])
+    pool = UserClientPool([StubClient("d"), c])
+    async with pool.acquire("3001") as client:
+        log.info(f"刷新对话列表后找到的聊天: {client}，对话列表刷新次数: {c.dialog_refreshes}")
+        assert client is c and c.dialog_refreshes == 1
+
+
+async def check_join_spreading():
+    """多个账号依次加入邀请链接"""
+    a, b, c = StubClient("a"), StubClient("b"), StubClient("c")
+    pool = UserClientPool([a, b, c])
+
+    for chat_id in (3001, 3002, 3003):
+        await pool.join(f"chat{chat_id}")
+    log.info(f"各账号加入的聊天: a={a.joined}, b={b.joined}, c={c.joined}")
+    assert sorted(len(x.joined) for x in (a, b, c)) == [1, 1, 1]
+
+    # 加入后该聊天的请求交给加入它的账号，不需要查询实体
+    for client in (a, b, c):
+        chat_id = client.joined[0]
+        async with pool.acquire(str(chat_id)) as selected:
+            assert selected is client
+
+    # 触发 FloodWait 的账号被跳过
+    a.flood = True
+    pool.join_counts = [0, 1, 1]
+    await pool.join("chat3004")
+    log.info(f"a 触发 FloodWait 后加入的账号: b={b.joined}, c={c.joined}")
+    assert 3004 in b.joined + c.joined and 3004 not in a.joined
+
+
+async def check_flood_ban():
+    """第一个账号加入聊天时被封禁，之后的加入和请求都交给其他账号"""
+    a, b = StubClient("a", chats=[5001], flood=True), StubClient("b", chats=[5001])
+    pool = UserClientPool([a, b], affinity_slack=0)
+
+    await pool.join("chat4001")
+    log.info(f"a 触发 FloodWait 后加入的账号: b={b.joined}，a 的尝试次数: {a.join_attempts}")
+    assert b.joined == [4001] and a.join_attempts == 1
+
+    # 封禁期间 a 加入的聊天更少也不再尝试
+    pool.join_counts = [0, 5]
+    await pool.join("chat4002")
+    log.info(f"第二次加入: b={b.joined}，a 的尝试次数: {a.join_attempts}")
+    assert b.joined == [4001, 4002] and a.join_attempts == 1
+
+    # 两个账号都能访问的聊天交给未封禁的账号，即使它更繁忙
+    pool.loads[1] = 5
+    async with pool.acquire("5001") as client:
+        log.info(f"a 封禁期间处理私有聊天的账号: {client}")
+        assert client is b
+
+    # 所有账号都在封禁中时直接报错，不再发送请求
+    b.flood = True
+    try:
+        await pool.join("chat4003")
+    except FloodWaitError:
+        pass
+    else:
+        raise AssertionError("b 触发 FloodWait 时应当报错")
+    attempts = (a.join_attempts, b.join_attempts)
+    try:
+        await pool.join("chat4004")
+    except FloodWaitError as e:
+        log.info(f"所有账号封禁时: {e}")
+    else:
+        raise AssertionError("所有账号封禁时应当报错")
+    assert (a.join_attempts, b.join_attempts) == attempts
+
+
+def test_least_loaded():
+    """测试公开聊天交给最空闲的账号"""
+    log.info("测试最空闲账号选择...")
+    asyncio.run(check_least_loaded())
+
+
+def test_affinity():
+    """测试同一聊天优先使用同一个账号，负载差距过大时换账号"""
+    log.info("测试聊天亲和性...")
+    asyncio.run(check_affinity())
+
+
+def test_private_chat_routing():
+    """测试私有聊天只交给已加入的账号"""
+    log.info("测试私有聊天路由...")
+    asyncio.run(check_private_chat_routing())
+
+
+def test_join_spreading():
+    """测试邀请链接分散给不同账号加入，加入后的请求交给加入的账号"""
+    log.info("测试邀请链接分散加入...")
+    asyncio.run(check_join_spreading())
+
+
+def test_flood_ban():
+    """测试加入聊天触发 FloodWait 的账号在封禁期间被跳过"""
+    log.info("测试封禁账号跳过...")
+    asyncio.run(check_flood_ban())
+
+
+def main():
+    """主测试函数"""
+    log.info("开始测试用户账号池...")
+
+    test_least_loaded()
+    test_affinity()
+    test_private_chat_routing()
+    test_join_spreading()
+    test_flood_ban()
+
+    log.info("测试完成!")
+
+
+if __name__ == "__main__":
+    main()